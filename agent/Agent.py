@@ -1,26 +1,63 @@
 import re
 import time
 import json
-from typing import List, Dict, Union, Optional
+import threading
+from functools import lru_cache
+from typing import List, Dict, Union, Optional, Callable
 from tools.tool import Tool
 from util.logs import Log
+from util.model_router import Model_Router
+from agent.observation_stage import Observation_Stage
+from agent.loop_guard import Loop_Guard, CHARS_PER_TOKEN
+from util.metrics import RUN_ITERATIONS, TOOL_LATENCY, TOOL_CALLS
+from util.text_sanitizer import to_ascii
+from util.cancellation import Cancel_Token, Cancelled_Error
 
 # The design allows usage of the OpenAI library.
-# We wrap imports to ensure the code remains valid even if the library isn't present,
-# though execution would fail.
-try:
-    from openai import OpenAI, APIError, RateLimitError, APIConnectionError
-except ImportError:
-    raise ImportError("The 'openai' library is required. Please install it via 'pip install openai'.")
+# It is slow to import, so it is loaded on first use instead of when this module is imported.
+# Except clauses are only evaluated once an exception is raised, so `except _openai().X` is lazy too.
+def _openai():
+    try:
+        import openai
+    except ImportError:
+        raise ImportError("The 'openai' library is required. Please install it via 'pip install openai'.")
+    return openai
+
+def _transient_errors():
+    openai = _openai()
+    return (openai.RateLimitError, openai.APIConnectionError, openai.APIError)
 
 # Note: This module uses the project's `Log` class for all logging.
 
+# Longest a single model call may take. Calls are cut shorter to fit the run's deadline, but are
+# always given at least the minimum, so a run past its deadline can still write its final answer.
+LLM_TIMEOUT_SECONDS = 120
+LLM_MIN_TIMEOUT_SECONDS = 20
+
+# --- Shared Client Pool ---
+# OpenAI clients hold their own HTTP connection pool and are safe to share between threads,
+# so every agent (head and delegates) using the same key reuses a single client.
+_CLIENT_POOL: Dict[str, "OpenAI"] = {}
+_CLIENT_POOL_LOCK = threading.Lock()
+
+def get_shared_client(api_key: str) -> "OpenAI":
+    """
+    Returns the pooled OpenAI client for `api_key`, creating it on first use.
+    """
+    with _CLIENT_POOL_LOCK:
+        client = _CLIENT_POOL.get(api_key)
+        if client is None:
+            client = _openai().OpenAI(api_key=api_key)
+            _CLIENT_POOL[api_key] = client
+        return client
+
 # --- Custom Robustness Decorator ---
 def exponential_backoff_retry(max_retries: int = 3, base_delay: float = 1.0):
     """
     A custom decorator to handle API reliability without external dependencies like 'tenacity'.
     Implements exponential backoff strategy: delay = base_delay * (2 ^ attempt).
-    Handles standard OpenAI transient errors.
+    Handles standard OpenAI transient errors. If `self` has a cancel token, the backoff wakes up
+    as soon as it is cancelled and raises Cancelled_Error instead of retrying.
     """
     def decorator(func):
         def wrapper(*args, **kwargs):
@@ -28,7 +65,7 @@ def exponential_backoff_retry(max_retries: int = 3, base_delay: float = 1.0):
             while True:
                 try:
                     return func(*args, **kwargs)
-                except (RateLimitError, APIConnectionError, APIError) as e:
+                except _transient_errors() as e:
                     # Attempt to find a Log instance on `self` (common case for methods)
                     local_log = None
                     if len(args) and hasattr(args[0], 'log'):
@@ -51,7 +88,12 @@ def exponential_backoff_retry(max_retries: int = 3, base_delay: float = 1.0):
                     else:
                         print(msg)
 
-                    time.sleep(delay)
+                    cancel_token = getattr(args[0], 'cancel_token', None) if len(args) else None
+                    if cancel_token is not None:
+                        cancel_token.wait(delay)
+                        cancel_token.check()
+                    else:
+                        time.sleep(delay)
                     retries += 1
                 except Exception as e:
                     # Non-recoverable errors (e.g., Python runtime errors) raise immediately
@@ -59,6 +101,44 @@ def exponential_backoff_retry(max_retries: int = 3, base_delay: float = 1.0):
         return wrapper
     return decorator
 
+# --- Prebuilt Prompt Blocks ---
+@lru_cache(maxsize=256)
+def build_react_instructions(tool_specs: tuple) -> str:
+    """
+    The ReACT instruction block for a set of tools, given as ((name, description), ...).
+    Cached, since every run with the same tool subset produces the same block.
+    """
+    tool_desc_str = "\n".join([f"{name}: {description}" for name, description in tool_specs])
+    tool_names = ", ".join([name for name, _ in tool_specs])
+    
+    # The ReACT Template
+    # Note the specific instructions on tokens "Action:" and "Action Input:"
+    # and the "Observation:" stop sequence instruction.
+    return f"""
+You are an intelligent agent capable of using tools to solve problems.
+You have access to the following tools:
+
+{tool_desc_str}
+
+To use a tool, you MUST use the following format:
+
+Thought: you should always think about what to do
+Action: the name of the tool to use (must be one of [{tool_names}])
+Action Input: the input to the tool
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+
+When you have a final answer, you MUST use the format:
+
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+"""
+
+def tool_specs(tools) -> tuple:
+    return tuple((t.name, t.description) for t in tools)
+
 # --- The Agent Class Implementation ---
 class Agent:
     """
@@ -66,7 +146,11 @@ class Agent:
     Leverages OpenAI API v1 and custom regex parsing for high reliability.
     """
 
-    def __init__(self, system_prompt: str, tool_list: List[Tool], model: str, api_key: str, log: Log):
+    def __init__(self, system_prompt: str, tool_list: List[Tool], model: str, api_key: str, log: Log,
+                 router: Optional[Model_Router] = None, role: str = "head",
+                 observation_stage: Optional[Observation_Stage] = None,
+                 cancel_token: Optional[Cancel_Token] = None,
+                 time_left: Optional[Callable[[], Optional[float]]] = None):
         """
         Constructor adhering to the design signature.
         
@@ -75,17 +159,33 @@ class Agent:
             tool_list: List of Tool objects available to the agent.
             model: The OpenAI model ID (e.g., 'gpt-4o', 'gpt-3.5-turbo').
             api_key: The OpenAI API key.
+            router: Optional Model_Router. If given, the model is re-picked for `role` on every call,
+                    which lets the router fall back to another model under rate-limit pressure.
+            role: The routing role of this agent (e.g. 'head', 'delegate').
+            observation_stage: Optional Observation_Stage that condenses oversized tool outputs.
+            cancel_token: Optional Cancel_Token. Checked before every LLM call and tool call; once it
+                          is cancelled, prompt() raises Cancelled_Error.
+            time_left: Optional function returning the seconds left before the run's deadline (or
+                       None). Model calls time out to fit it.
         """
         # 1. Client Initialization
-        # We instantiate the client here to validate the API key format immediately.
-        self.client = OpenAI(api_key=api_key)
+        # Clients are pooled per API key so concurrent delegates share one connection pool.
+        self.client = get_shared_client(api_key)
         self.model = model
+        self.router = router
+        self.role = role
         # Logging: use the provided Log instance
         self.log = log
         
         # 2. Tool Registry Construction
         # Convert list to dict for O(1) lookups during the execution loop.
         self.tools: Dict[str, Tool] = {tool.name: tool for tool in tool_list}
+        self.observation_stage = observation_stage
+        self.cancel_token = cancel_token
+        self.time_left = time_left
+        if observation_stage:
+            # Summarized observations are only useful if the raw text can be recalled
+            self.tools[observation_stage.recall_tool.name] = observation_stage.recall_tool
         
         # 3. System Prompt Engineering
         # We must augment the user's prompt with the tool definitions and formatting rules.
@@ -99,41 +199,25 @@ class Agent:
             r"Action\s*:\s*(.*?)\n+Action Input\s*:\s*(.*)", 
             re.DOTALL | re.IGNORECASE
         )
+        self.thought_pattern = re.compile(
+            r"Thought\s*:\s*(.*?)(?:\n+Action\s*:|$)",
+            re.DOTALL | re.IGNORECASE
+        )
 
     def _construct_system_prompt(self, base_prompt: str) -> str:
         """
         Generates the full system prompt by injecting tool descriptions and formatting rules.
         This effectively programs the LLM's 'operating system'.
         """
-        tool_desc_str = "\n".join([f"{t.name}: {t.description}" for t in self.tools.values()])
-        tool_names = ", ".join(self.tools.keys())
-        
-        # The ReACT Template
-        # Note the specific instructions on tokens "Action:" and "Action Input:"
-        # and the "Observation:" stop sequence instruction.
-        react_instructions = f"""
-You are an intelligent agent capable of using tools to solve problems.
-You have access to the following tools:
-
-{tool_desc_str}
-
-To use a tool, you MUST use the following format:
-
-Thought: you should always think about what to do
-Action: the name of the tool to use (must be one of [{tool_names}])
-Action Input: the input to the tool
-Observation: the result of the action
-... (this Thought/Action/Action Input/Observation can repeat N times)
-
-When you have a final answer, you MUST use the format:
-
-Thought: I now know the final answer
-Final Answer: the final answer to the original input question
-
-Begin!
-"""
+        react_instructions = build_react_instructions(tool_specs(self.tools.values()))
         return f"{base_prompt}\n\n{react_instructions}"
 
+    def _llm_timeout(self) -> float:
+        left = self.time_left() if self.time_left else None
+        if left is None:
+            return LLM_TIMEOUT_SECONDS
+        return max(LLM_MIN_TIMEOUT_SECONDS, min(LLM_TIMEOUT_SECONDS, left))
+
     @exponential_backoff_retry(max_retries=3, base_delay=2.0)
     def _call_llm(self, messages: List[Dict[str, str]]) -> str:
         """
@@ -141,17 +225,31 @@ Begin!
         Uses stop sequences to prevent hallucination of tool outputs.
         Enforces ASCII-only output.
         """
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0,      # Deterministic output for tool usage
-            stop=["Observation:"] # CRITICAL: Stop generating before hallucinating the result
-        )
+        model = self.router.model_for(self.role) if self.router else self.model
+        start = time.time()
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,      # Deterministic output for tool usage
+                stop=["Observation:"], # CRITICAL: Stop generating before hallucinating the result
+                timeout=self._llm_timeout()
+            )
+        except _openai().RateLimitError:
+            # Let the router steer the retry (and later calls) toward a less loaded model
+            if self.router:
+                self.router.report_rate_limit(model)
+            raise
+        
+        if self.router:
+            usage = getattr(response, "usage", None)
+            self.router.record(self.role, model, time.time() - start,
+                               getattr(usage, "prompt_tokens", 0) or 0,
+                               getattr(usage, "completion_tokens", 0) or 0)
         content = response.choices[0].message.content.strip()
         
-        # Enforce ASCII only: encode to ascii ignoring errors, then decode back to string.
-        # This strips out any non-ASCII characters.
-        return content.encode('ascii', 'ignore').decode('ascii')
+        # Enforce ASCII only: curly quotes, dashes and accents are transliterated, not dropped.
+        return to_ascii(content)
 
     def _parse_output(self, llm_output: str) -> Union[str, Dict[str, str], None]:
         """
@@ -177,6 +275,36 @@ Begin!
         
         return None
 
+    def _check_cancelled(self):
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def _force_final_answer(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Asks the LLM for its Final Answer immediately, without allowing another action.
+        """
+        messages.append({"role": "user", "content": "You are stuck repeating actions that make no progress. "
+                         "Do not use any more tools. Respond now with 'Final Answer:' followed by your best "
+                         "answer using what you have already found."})
+        self._check_cancelled()
+        try:
+            llm_response = self._call_llm(messages)
+        except Cancelled_Error:
+            raise
+        except Exception as e:
+            return f"Agent Failure: API Error could not be resolved: {e}"
+        self.log.log(f"DEBUG: LLM Output: {llm_response}")
+        parsed = self._parse_output(llm_response)
+        return parsed if isinstance(parsed, str) else llm_response
+
+    def _report_loop_guard(self, guard: Loop_Guard, iterations_saved: int, messages: List[Dict[str, str]]):
+        if not guard.short_circuited and not iterations_saved:
+            return
+        # Every skipped iteration would have re-sent the whole context window
+        context_tokens = sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN
+        self.log.log(f"[LOOP GUARD] : {guard.short_circuited} repeated actions short-circuited, "
+                     f"{iterations_saved} iterations saved, ~{iterations_saved * context_tokens} tokens saved.")
+
     def prompt(self, problem_prompt: str, max_react_iterations: int) -> str:
         """
         The main execution loop (Reasoning -> Acting -> Observing).
@@ -187,7 +315,44 @@ Begin!
             
         Returns:
             The final answer string.
+            
+        Raises:
+            Cancelled_Error: If the cancel token was cancelled during the run.
+        """
+        self.iterations = 0
+        try:
+            return self._react_loop(problem_prompt, max_react_iterations)
+        finally:
+            RUN_ITERATIONS.observe(self.iterations, role=self.role)
+
+    def _run_tool(self, tool: Tool, tool_name: str, tool_input: str) -> str:
+        """
+        Executes a tool (Safe Execution Boundary) and turns its result into an observation.
         """
+        self._check_cancelled()
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            observation_result = tool.use(tool_input)
+            
+            # Handle design-specified failure (returns False)
+            if observation_result is False:
+                outcome = "false"
+                return f"Error: Tool '{tool_name}' returned False. Please check your input format."
+            return str(observation_result)
+                
+        except Cancelled_Error:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            # Catch unexpected runtime errors in the tool
+            outcome = "crash"
+            return f"Error: Tool execution crashed: {e}"
+        finally:
+            TOOL_LATENCY.observe(time.perf_counter() - start, tool=tool_name)
+            TOOL_CALLS.inc(tool=tool_name, outcome=outcome)
+
+    def _react_loop(self, problem_prompt: str, max_react_iterations: int) -> str:
         # Initialize Context Window
         messages = [
             {"role": "system", "content": self.system_prompt},
@@ -195,14 +360,19 @@ Begin!
         ]
         
         iterations = 0
+        guard = Loop_Guard()
         
         while iterations < max_react_iterations:
             iterations += 1
+            self.iterations = iterations
             self.log.log(f"--- Iteration {iterations} ---")
+            self._check_cancelled()
             
             # 1. Thought Generation
             try:
                 llm_response = self._call_llm(messages)
+            except Cancelled_Error:
+                raise
             except Exception as e:
                 return f"Agent Failure: API Error could not be resolved: {e}"
             
@@ -216,6 +386,7 @@ Begin!
             # Case A: Final Answer
             if isinstance(parsed, str):
                 self.log.log("Final Answer received.")
+                self._report_loop_guard(guard, 0, messages)
                 return parsed
             
             # Case B: Action Required
@@ -226,25 +397,27 @@ Begin!
                 self.log.log(f"Action: {tool_name} | Input: {tool_input}")
                 
                 # 3. Tool Execution
-                if tool_name in self.tools:
-                    tool = self.tools[tool_name]
-                    try:
-                        # Execute the tool (Safe Execution Boundary)
-                        observation_result = tool.use(tool_input)
-                        
-                        # Handle design-specified failure (returns False)
-                        if observation_result is False:
-                            observation = f"Error: Tool '{tool_name}' returned False. Please check your input format."
-                        else:
-                            observation = str(observation_result)
-                            
-                    except Exception as e:
-                        # Catch unexpected runtime errors in the tool
-                        observation = f"Error: Tool execution crashed: {e}"
+                repeated = guard.check(tool_name, tool_input)
+                if repeated is not None:
+                    # Loop detected: answer from history instead of running the tool again
+                    self.log.log("[LOOP GUARD] : Repeated action short-circuited.")
+                    observation = repeated
+                elif tool_name in self.tools:
+                    observation = self._run_tool(self.tools[tool_name], tool_name, tool_input)
                 else:
+                    TOOL_CALLS.inc(tool=tool_name, outcome="unknown_tool")
                     # Hallucination handling
                     observation = f"Error: Tool '{tool_name}' not found. Available tools: {list(self.tools.keys())}"
                 
+                # Condense oversized outputs, focused on what the agent said it was looking for
+                if self.observation_stage and not observation.startswith("Error:"):
+                    thought = self.thought_pattern.search(llm_response)
+                    observation = self.observation_stage.process(
+                        tool_name, observation, thought.group(1).strip() if thought else None)
+                
+                if repeated is None:
+                    guard.record(tool_name, tool_input, observation, not observation.startswith("Error:"))
+                
                 self.log.log(f"Observation: {observation}")
                 
                 # 4. Observation Injection
@@ -255,6 +428,8 @@ Begin!
                 remaining_iterations = max_react_iterations - iterations
                 if remaining_iterations <= 2:
                     message_content += f"\nWarning: You have {remaining_iterations} iterations remaining. Please formulate a Final Answer soon."
+                elif guard.is_stalled():
+                    message_content += "\nWarning: Your recent actions have not made progress. Stop repeating them and formulate a Final Answer now."
 
                 messages.append({"role": "user", "content": message_content})
             
@@ -270,6 +445,15 @@ Begin!
                     nudge_content += f" Warning: {remaining_iterations} iterations remaining."
                 
                 messages.append({"role": "user", "content": nudge_content})
+                guard.record_no_action()
+            
+            # Clearly stalled: stop burning iterations and ask for the answer directly
+            if guard.must_stop() and iterations < max_react_iterations:
+                self.log.log("[LOOP GUARD] : Agent is stalled. Requesting Final Answer.")
+                out = self._force_final_answer(messages)
+                self._report_loop_guard(guard, max_react_iterations - iterations - 1, messages)
+                return out
                 
         # Loop Exited without Answer
+        self._report_loop_guard(guard, 0, messages)
         return "Agent Failure: Maximum iterations reached without a Final Answer."
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Detects an agent going in circles. Every action is fingerprinted as (tool, normalized input) along
+with its outcome. Repeating an action, or issuing one that is nearly identical to an earlier one, is
+answered from the history instead of running the tool again, and a run of unproductive iterations is
+reported as a stall so the agent can be pushed to its Final Answer.
+"""
+import re
+from typing import Optional
+
+
+CHARS_PER_TOKEN = 4
+
+
+# A single token that starts with a host name, with or without a scheme ("en.wikipedia.org/wiki/Apple")
+URL_PATTERN = re.compile(r"^(https?://)?[a-z0-9-]+(\.[a-z0-9-]+)+(:\d+)?([/?#]\S*)?$")
+
+
+def is_url(text : str):
+    return URL_PATTERN.match(text) is not None
+
+
+def normalize_input(tool_input : str):
+    text = tool_input.strip().strip("`\"' ").lower()
+    if is_url(text):
+        text = re.sub(r"^https?://", "", text)
+        text = re.sub(r"^www\.", "", text)
+        text = text.split("#")[0].rstrip("/")
+        return text
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+class Loop_Guard:
+    def __init__(self, similarity : float = 0.8, stall_limit : int = 3):
+        self.similarity = similarity
+        self.stall_limit = stall_limit
+        self.history = {}       # (tool, normalized input) -> (ok, observation)
+        self.unproductive = 0   # consecutive iterations that made no progress
+        self.short_circuited = 0
+
+    def _near_match(self, tool : str, key : str):
+        if is_url(key):
+            # Urls only match exactly; neighbouring pages on a site are different sources
+            return None
+        words = set(key.split())
+        if not words:
+            return None
+        for (other_tool, other_key), entry in self.history.items():
+            if other_tool != tool:
+                continue
+            other_words = set(other_key.split())
+            overlap = len(words & other_words) / len(words | other_words)
+            if overlap >= self.similarity:
+                return other_key, entry
+        return None
+
+    def check(self, tool : str, tool_input : str) -> Optional[str]:
+        """
+        Returns a replacement observation if this action repeats an earlier one, otherwise None.
+        """
+        key = normalize_input(tool_input)
+        match = None
+        if (tool, key) in self.history:
+            match = ("exact", key, self.history[(tool, key)])
+        else:
+            near = self._near_match(tool, key)
+            if near:
+                match = ("near", near[0], near[1])
+        if match is None:
+            return None
+
+        kind, earlier, (ok, observation) = match
+        self.short_circuited += 1
+        self.unproductive += 1
+        which = "this exact action" if kind == "exact" else f"a nearly identical action (\"{earlier}\")"
+        if ok:
+            return (f"You already ran {which} with {tool}. Its result is repeated below; do not run it again. "
+                    f"Use what you have or try something genuinely different.\n{observation}")
+        return (f"Error: {which} with {tool} already failed. Do not retry it. Try a different source or "
+                f"query, or move on to your Final Answer.")
+
+    def record(self, tool : str, tool_input : str, observation : str, ok : bool):
+        self.history[(tool, normalize_input(tool_input))] = (ok, observation)
+        self.unproductive = 0 if ok else self.unproductive + 1
+
+    def record_no_action(self):
+        self.unproductive += 1
+
+    def is_stalled(self):
+        return self.unproductive >= self.stall_limit
+
+    def must_stop(self):
+        return self.unproductive >= self.stall_limit + 2
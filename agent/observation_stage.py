@@ -0,0 +1,153 @@
+"""
+Post-processing for tool observations before they reach an agent's context window. Fetched pages and
+search results longer than the stage's threshold are condensed by a summarizer that focuses on the
+agent's last Thought. Other tools return text the agent needs verbatim (the essay, delegate reports)
+and are passed through untouched. The raw text is kept in an Observation_Store under an id such as
+"obs-3", which the agent can page through with the observation-recall-tool if the summary was not
+enough.
+"""
+import re
+import threading
+from typing import Optional
+from tools.tool import Tool
+
+
+CHARS_PER_TOKEN = 4
+
+# Only these tools' outputs are summarized
+SUMMARIZED_TOOLS = ("site-fetcher-tool", "google-search-tool")
+
+STOPWORDS = {
+    "the", "and", "that", "this", "with", "from", "have", "what", "will", "about", "should", "would",
+    "could", "their", "there", "which", "into", "then", "than", "they", "them", "some", "more", "need",
+    "know", "next", "find", "look", "check", "information", "think", "want", "going", "also", "been"
+}
+
+
+class Observation_Store:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raw = {}
+        self._counter = 0
+
+    def put(self, text : str):
+        with self._lock:
+            self._counter += 1
+            obs_id = f"obs-{self._counter}"
+            self._raw[obs_id] = text
+            return obs_id
+
+    def get(self, obs_id : str):
+        with self._lock:
+            return self._raw.get(obs_id)
+
+
+class Extractive_Summarizer:
+    """
+    Local, model-free summarizer. Scores sentences by how many keywords from the focus text they
+    contain and keeps the best ones, in their original order, up to the character budget.
+    """
+    MAX_SENTENCE_CHARS = 400
+
+    def _sentences(self, text : str):
+        out = []
+        for sentence in re.split(r"(?<=[.!?])\s+", text):
+            # Scraped pages often have long runs without punctuation; chop those up
+            while len(sentence) > self.MAX_SENTENCE_CHARS:
+                out.append(sentence[:self.MAX_SENTENCE_CHARS])
+                sentence = sentence[self.MAX_SENTENCE_CHARS:]
+            if sentence.strip():
+                out.append(sentence.strip())
+        return out
+
+    def __call__(self, text : str, focus : str, budget : int):
+        sentences = self._sentences(text)
+        keywords = {w for w in re.findall(r"[a-z0-9]+", focus.lower()) if len(w) > 3 and w not in STOPWORDS}
+
+        scored = []
+        for i, sentence in enumerate(sentences):
+            words = set(re.findall(r"[a-z0-9]+", sentence.lower()))
+            score = len(keywords & words)
+            # Slight preference for early sentences, which tend to be the lede
+            scored.append((score - i / (len(sentences) * 10), i))
+        scored.sort(reverse=True)
+
+        chosen = []
+        used = 0
+        for _, i in scored:
+            if used + len(sentences[i]) > budget:
+                continue
+            chosen.append(i)
+            used += len(sentences[i]) + 1
+        chosen.sort()
+
+        out = ""
+        last = -1
+        for i in chosen:
+            if out and i != last + 1:
+                out += " ... "
+            elif out:
+                out += " "
+            out += sentences[i]
+            last = i
+        return out
+
+
+class Observation_Recall_Tool(Tool):
+    name = "observation-recall-tool"
+    description = """
+    Accepts an observation id (e.g. "obs-3") optionally followed by a page number (e.g. "obs-3 2").
+    Long tool outputs are summarized before you see them; this tool returns a page of the original,
+    unsummarized text for that id. Only use it if the summary is missing something you need.
+    """
+    alias = "Observation Recall"
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def use(self, args: str):
+        parts = [part.strip("\"'") for part in args.split()]
+        if not parts:
+            return False
+        raw = self.stage.store.get(parts[0])
+        if raw is None:
+            return False
+        page = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+        size = self.stage.threshold
+        pages = max(1, -(-len(raw) // size))
+        page = min(max(page, 1), pages)
+        return f"[{parts[0]} page {page}/{pages}]\n" + raw[(page - 1) * size : page * size]
+
+
+class Observation_Stage:
+    def __init__(self, summarizer=None, threshold : int = 6000, budget : int = 1500, tools=SUMMARIZED_TOOLS):
+        self.summarizer = summarizer if summarizer is not None else Extractive_Summarizer()
+        self.tools = tools
+        self.threshold = threshold
+        self.budget = budget
+        self.store = Observation_Store()
+        self.recall_tool = Observation_Recall_Tool(self)
+        self._lock = threading.Lock()
+        self.summarized = 0
+        self.chars_saved = 0
+
+    def process(self, tool_name : str, observation : str, focus : Optional[str]):
+        if tool_name not in self.tools or len(observation) <= self.threshold:
+            return observation
+
+        obs_id = self.store.put(observation)
+        summary = self.summarizer(observation, focus or "", self.budget)
+        if not summary:
+            summary = observation[:self.budget]
+
+        with self._lock:
+            self.summarized += 1
+            self.chars_saved += max(0, len(observation) - len(summary))
+
+        return (f"[Summary of {len(observation)} characters of output, stored as {obs_id}. "
+                f"Use {self.recall_tool.name} with \"{obs_id}\" to read the original.]\n{summary}")
+
+    def report(self):
+        with self._lock:
+            return (f"{self.summarized} oversized observations summarized, "
+                    f"~{self.chars_saved // CHARS_PER_TOKEN} tokens saved")
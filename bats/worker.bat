@@ -0,0 +1 @@
+python -m web_api.worker %*
\ No newline at end of file
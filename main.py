@@ -1,16 +1,13 @@
-from util.logs import Log
-from tools.google_search_tool import GoogleSearchTool
-from keys.wallet import Key_Wallet
-import json
-from tests.unit_tests import do_all_tests
-from webui import host_ui
-
-
-
-
-
-do_all_tests()
-host_ui.run()
-
-
-
+import sys
+
+
+# The self-tests import every tool and hit the network, so they only run when asked for:
+#     python main.py --tests
+# The server is only imported here: worker processes (the document parsing pool) import this module
+# again, and must not build a second server.
+if __name__ == "__main__":
+    from webui import host_ui
+    if "--tests" in sys.argv:
+        from tests.unit_tests import do_all_tests
+        do_all_tests()
+    host_ui.run()
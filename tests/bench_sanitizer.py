@@ -0,0 +1,28 @@
+"""
+Compares util/text_sanitizer.to_ascii with the per-character filter it replaced, on the kinds of
+text the project sanitizes: fetched pages (mostly ASCII), pages with typographic punctuation, and
+non-English pages.
+"""
+import timeit
+from util.text_sanitizer import to_ascii
+
+
+def legacy_filter_non_ascii(input_string):
+    # The old util/ascii_filter.filter_non_ascii, kept here for comparison
+    return "".join(char for char in input_string if ord(char) < 128)
+
+
+SAMPLES = {
+    "ascii page (50k)": ("The quick brown fox jumps over the lazy dog. " * 1200)[:50000],
+    "typographic page (50k)": ("“It’s a test” — she said… " * 1800)[:50000],
+    "accented page (50k)": ("François Truffaut et la Nouvelle Vague à Paris. " * 1200)[:50000],
+}
+
+
+def bench_sanitizer(number : int = 20):
+    print("\n\n" + "="*10 + "PERFORMING SANITIZER BENCHMARK" + "="*10)
+    for name, text in SAMPLES.items():
+        legacy = min(timeit.repeat(lambda: legacy_filter_non_ascii(text), number=number, repeat=3)) / number
+        fast = min(timeit.repeat(lambda: to_ascii(text), number=number, repeat=3)) / number
+        print(f"\t{name:<24} legacy {legacy * 1000:8.3f} ms   to_ascii {fast * 1000:8.3f} ms   "
+              f"({legacy / fast:6.1f}x)   chars kept: {len(legacy_filter_non_ascii(text))} -> {len(to_ascii(text))}")
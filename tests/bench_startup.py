@@ -0,0 +1,51 @@
+"""
+Measures how long it takes, and how much memory it costs, to import the server's modules in a fresh
+interpreter. Heavy third-party libraries should not show up in the loaded list; they are imported
+on first use.
+"""
+import json
+import subprocess
+import sys
+
+
+MODULES = [
+    "agent.Agent",
+    "tools.tool_registry",
+    "web_api.api_functions",
+    "webui.host_ui"
+]
+
+HEAVY = ["openai", "requests", "bs4", "pypdf", "playwright"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss_kb //= 1024
+except ImportError:
+    rss_kb = None
+print(json.dumps({{"seconds": elapsed, "rss_kb": rss_kb, "heavy": [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+
+def bench_startup(runs : int = 3):
+    print("\n\n" + "="*10 + "PERFORMING STARTUP BENCHMARK" + "="*10)
+    for module in MODULES:
+        samples = []
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"\t{module}: import failed\n{proc.stderr.strip()}")
+                break
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if not samples:
+            continue
+        best = min(samples, key=lambda s: s["seconds"])
+        rss = f"{best['rss_kb'] / 1024:.1f} MB" if best["rss_kb"] else "n/a"
+        print(f"\t{module:<24} {best['seconds'] * 1000:8.1f} ms   peak RSS {rss:>9}   heavy modules loaded: {best['heavy']}")
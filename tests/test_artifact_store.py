@@ -0,0 +1,57 @@
+import os
+import tempfile
+import time
+from web_api.artifact_store import Artifact_Store
+
+
+def test_artifact_store():
+    print("\n\n" + "="*10 + "PERFORMING ARTIFACT STORE TEST" + "="*10)
+    root = tempfile.mkdtemp()
+    store = Artifact_Store(root, max_total_bytes=100)
+
+    first = store.put("Transcript", "txt", "a" * 40)
+    print(first)
+    digest = first["sha256"]
+    # Files are sharded by the first two hex digits of their hash, and stored once
+    assert os.path.exists(os.path.join(root, digest[:2], digest))
+    assert first["url"] == f"/api/artifacts/{digest}.txt?name=Transcript" and first["size"] == 40
+    assert store.put("Copy", "txt", b"a" * 40)["sha256"] == digest
+    assert store._total == 40
+    assert store.read(digest) == b"a" * 40
+    assert store.path_for("../" + digest[3:]) is None and store.read("0" * 64) is None
+
+    # Past the cap, the least recently used files go first (reading a file counts as a use)
+    second = store.put("Works_Cited", "json", "b" * 40)
+    old = time.time() - 60
+    os.utime(store._path(digest), (old - 60, old - 60))
+    os.utime(store._path(second["sha256"]), (old, old))
+    store.read(digest)
+    third = store.put("Notepad", "txt", "c" * 40)
+    assert store.exists(first) and store.exists(third) and not store.exists(second)
+    assert store._total == 80
+
+    # A new store over the same directory picks up what is already there
+    assert Artifact_Store(root, max_total_bytes=100)._total == 80
+
+
+def test_artifact_responses():
+    print("\n\n" + "="*10 + "PERFORMING ARTIFACT RESPONSE TEST" + "="*10)
+    from webui import host_ui
+    host_ui.api.artifacts = Artifact_Store(tempfile.mkdtemp())
+    ref = host_ui.api.artifacts.put("Transcript", "txt", "0123456789" * 10)
+    client = host_ui.APP.test_client()
+
+    full = client.get(ref["url"])
+    assert full.status_code == 200 and full.data == b"0123456789" * 10
+    assert full.headers["ETag"].strip('"') == ref["sha256"]
+    assert "immutable" in full.headers["Cache-Control"]
+    assert "Transcript.txt" in full.headers["Content-Disposition"]
+
+    # Repeat downloads are answered from the browser's copy, and large files can be read in pieces
+    again = client.get(ref["url"], headers={"If-None-Match": full.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    part = client.get(ref["url"], headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.data == b"0123456789"
+    assert part.headers["Content-Range"] == "bytes 10-19/100"
+
+    assert client.get(f"/api/artifacts/{'0' * 64}.txt").status_code == 404
@@ -0,0 +1,25 @@
+from util.blackboard import Research_Blackboard
+
+
+def test_blackboard():
+    print("\n\n" + "="*10 + "PERFORMING BLACKBOARD TEST" + "="*10)
+    bb = Research_Blackboard()
+
+    bb.set_author("delegate 1/2")
+    bb.record_query("Apples as a fruit", "[{\"link\": \"https://example.com/apples\"}]")
+    bb.record_fetch("https://example.com/apples/", "Apples are grown in orchards around the world.")
+    bb.record_fetch("https://example.com/blocked", False)
+    assert bb.add_note("Apples originated in Central Asia.")
+    assert not bb.add_note("apples originated in  central asia.")
+
+    # A later delegate asking for the same things should be served from the board
+    bb.set_author("delegate 2/2")
+    assert bb.lookup_query("\"apples AS a fruit\"") is not None
+    assert bb.lookup_fetch("https://EXAMPLE.com/apples") == (True, "Apples are grown in orchards around the world.")
+    assert bb.lookup_fetch("https://example.com/blocked") == (True, False)
+    assert bb.lookup_fetch("https://example.com/pears") == (False, None)
+    assert bb.stats()["saved_calls"] == 3
+
+    print("Digest:\n" + bb.digest())
+    print("Search for 'orchards':\n" + bb.search("orchards"))
+    assert "orchards" in bb.search("orchards")
@@ -0,0 +1,145 @@
+import os
+import tempfile
+import threading
+import time
+import agent.Agent as agent_module
+from util.cancellation import Cancel_Token, Cancelled_Error
+from web_api.jobs import Job_Manager, Disconnect_Watcher
+from web_api.job_queue import Sqlite_Job_Queue
+
+
+class _Slow_API:
+    """
+    Stands in for Application_API: "runs" until its token is cancelled, like the agent loop does.
+    """
+    def run_analysis(self, query, on_context=None, cancel_token=None):
+        for _ in range(100):
+            cancel_token.check()
+            time.sleep(0.05)
+        return {"revised_text": query["text"]}
+
+
+class _Flaky_Caller:
+    """
+    Stands in for Agent: every call fails with an error the backoff treats as transient.
+    """
+    def __init__(self, cancel_token):
+        self.cancel_token = cancel_token
+        self.calls = 0
+
+    @agent_module.exponential_backoff_retry(max_retries=3, base_delay=5.0)
+    def call(self):
+        self.calls += 1
+        raise ConnectionError("connection reset")
+
+
+def _wait_for(condition, seconds=3):
+    end = time.monotonic() + seconds
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_cancellation():
+    print("\n\n" + "="*10 + "PERFORMING CANCELLATION TEST" + "="*10)
+    token = Cancel_Token()
+    aborted = []
+    unregister = token.on_cancel(lambda: aborted.append("closed"))
+    token.check()
+    token.cancel("client disconnected")
+    token.cancel("ignored")
+    assert token.cancelled and token.reason == "client disconnected" and aborted == ["closed"]
+    try:
+        token.check()
+        assert False, "check should raise once cancelled"
+    except Cancelled_Error as e:
+        print(e)
+    unregister()
+
+    # Deadlines cancel on their own, and wake up waits early
+    token = Cancel_Token()
+    token.set_deadline(0.1)
+    start = time.monotonic()
+    assert token.wait(5)
+    assert time.monotonic() - start < 1 and token.reason == "deadline"
+
+    # ...and run the abort callbacks without anything polling the token
+    token = Cancel_Token()
+    aborted = threading.Event()
+    token.on_cancel(aborted.set)
+    token.set_deadline(0.1)
+    assert aborted.wait(2) and token.reason == "deadline"
+
+    # A run that finishes first clears its deadline, and no timer is left behind to fire later
+    token = Cancel_Token()
+    token.set_deadline(0.1)
+    timer = token._timer
+    token.clear_deadline()
+    timer.join(1)
+    assert not timer.is_alive() and token.deadline is None
+    time.sleep(0.2)
+    assert not token.cancelled
+
+    # Running threaded jobs stop at their next check; queued ones never start
+    manager = Job_Manager(_Slow_API(), max_workers=1)
+    running = manager.submit({"text": "one"})
+    queued = manager.submit({"text": "two"})
+    assert _wait_for(lambda: running.status == "running")
+    assert manager.cancel(queued.id).status == "cancelled"
+    manager.cancel(running.id)
+    assert _wait_for(lambda: running.status == "cancelled")
+    print(running.describe())
+
+    # The disconnect watcher only cancels once no stream has come back within the grace period
+    job = manager.submit({"text": "three"})
+    watcher = Disconnect_Watcher(manager, grace=0.2)
+    watcher.opened(job.id)
+    watcher.closed(job.id)
+    watcher.opened(job.id)         # EventSource reconnected
+    time.sleep(0.4)
+    assert not job.cancel_token.cancelled
+    watcher.closed(job.id)
+    assert _wait_for(lambda: job.status == "cancelled")
+    assert "client disconnected" in job.error
+
+    # SQLite backend: queued jobs are cancelled outright, running ones on the worker's next poll
+    queue = Sqlite_Job_Queue(os.path.join(tempfile.mkdtemp(), "queue.sqlite3"))
+    first = queue.submit({"text": "essay one", "tools": []})
+    second = queue.submit({"text": "essay two", "tools": []})
+    job_id, _ = queue.claim("worker-a")
+    assert job_id == first.id
+    assert queue.cancel(second.id).status == "cancelled"
+    assert queue.cancel(first.id).status == "cancel_requested"
+    assert queue.cancel_requested(first.id)
+    assert queue.heartbeat(first.id, "worker-a")
+    queue.cancelled(first.id, "worker-a", "Run cancelled (cancelled)")
+    assert queue.get(first.id).is_finished() and queue.claim("worker-b") is None
+
+
+def test_agent_cancellation():
+    print("\n\n" + "="*10 + "PERFORMING AGENT CANCELLATION TEST" + "="*10)
+    # The retry backoff wakes up on cancellation instead of sleeping it out
+    original = agent_module._transient_errors
+    agent_module._transient_errors = lambda: (ConnectionError,)
+    try:
+        token = Cancel_Token()
+        caller = _Flaky_Caller(token)
+        threading.Timer(0.1, token.cancel, args=("cancelled",)).start()
+        start = time.monotonic()
+        try:
+            caller.call()
+            assert False, "the backoff should have raised Cancelled_Error"
+        except Cancelled_Error as e:
+            print(e)
+        assert time.monotonic() - start < 2 and caller.calls == 1
+    finally:
+        agent_module._transient_errors = original
+
+    # Model calls time out to fit what is left of the run, but never below the minimum
+    agent = agent_module.Agent.__new__(agent_module.Agent)
+    agent.time_left = None
+    assert agent._llm_timeout() == agent_module.LLM_TIMEOUT_SECONDS
+    agent.time_left = lambda: 45.0
+    assert agent._llm_timeout() == 45.0
+    agent.time_left = lambda: -10.0
+    assert agent._llm_timeout() == agent_module.LLM_MIN_TIMEOUT_SECONDS
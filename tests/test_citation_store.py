@@ -0,0 +1,42 @@
+import os
+import tempfile
+import time
+from util.citation_store import Citation_Store, canonical_url
+from util.citations import get_metadata, format_mla
+
+
+def test_citation_store():
+    print("\n\n" + "="*10 + "PERFORMING CITATION STORE TEST" + "="*10)
+    assert canonical_url("https://www.Example.com/page/?b=2&a=1&utm_source=x#top") == \
+        canonical_url("http://example.com/page?a=1&b=2")
+    assert canonical_url("https://example.com/page?id=1") != canonical_url("https://example.com/page?id=2")
+
+    store = Citation_Store(os.path.join(tempfile.mkdtemp(), "citations.sqlite3"), failure_seconds=0.2)
+    url = "https://www.example.com/apples/"
+    store.store(url, {"title": "All About Apples", "site_name": "Example", "author": "Jane Smith",
+                      "date": "2020-05-01", "url": url, "content_type": "html"})
+
+    # A hit is answered from the store, whichever way the url is written
+    meta = get_metadata("http://example.com/apples", store=store)
+    citation = format_mla(meta)
+    print(citation)
+    assert "All About Apples" in citation and "Smith, Jane" in citation
+    assert meta["url"] == "http://example.com/apples"
+
+    # Failures are remembered, but only briefly
+    store.store_failure("https://dead.example.org", "Could not fetch content from URL")
+    assert store.lookup("https://dead.example.org")["error"].startswith("Could not fetch")
+    time.sleep(0.3)
+    assert store.lookup("https://dead.example.org") is None
+
+    # Search results with enough metadata are cited without fetching the page
+    hint = {"title": "Pears Through History", "site_name": None, "author": "Sam Lee", "date": "2018-01-02"}
+    meta = get_metadata("https://www.example.net/pears", store=store, hint=hint)
+    assert meta["site_name"] == "www.example.net" and meta["title"] == "Pears Through History"
+    assert store.lookup("https://example.net/pears")["author"] == "Sam Lee"
+
+    # ...even if fetching the page failed recently
+    store.store_failure("https://www.example.net/plums", "Could not fetch content from URL")
+    assert "error" in get_metadata("https://www.example.net/plums", store=store)
+    meta = get_metadata("https://www.example.net/plums", store=store, hint={"title": "Plums"})
+    assert meta["title"] == "Plums" and store.lookup("https://www.example.net/plums")["title"] == "Plums"
@@ -0,0 +1,90 @@
+import threading
+import time
+import agent.Agent as agent_module
+import tools.delegate as delegate
+from tools.delegate import Delegate_Tool
+from util.app_context import App_Context
+
+
+class _Stub_Wallet:
+    def get(self, name):
+        return "test-key"
+
+
+class _Stub_Agent:
+    """
+    Stands in for Agent: answers with its task after a short wait, and counts how many run at once.
+    """
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def prompt(self, task, max_iter):
+        with _Stub_Agent.lock:
+            _Stub_Agent.running += 1
+            _Stub_Agent.most_running = max(_Stub_Agent.most_running, _Stub_Agent.running)
+        # Later tasks finish first, so the merge order cannot come from completion order
+        time.sleep(0.2 if "first" in task else 0.05)
+        with _Stub_Agent.lock:
+            _Stub_Agent.running -= 1
+        if "fail" in task:
+            raise RuntimeError("hit the max number of iterations")
+        return "report on " + task.split("\n")[0]
+
+
+class _Stub_OpenAI_Module:
+    class OpenAI:
+        def __init__(self, api_key):
+            self.api_key = api_key
+
+
+def test_delegate():
+    print("\n\n" + "="*10 + "PERFORMING DELEGATE TEST" + "="*10)
+    ctx = App_Context("essay", verbose=False, wallet=_Stub_Wallet())
+    tool = Delegate_Tool(ctx)
+    ctx.toolbox = [tool]
+
+    # Only a JSON list of strings fans out
+    assert tool._split_tasks('["topic A", " topic B ", ""]') == ["topic A", "topic B"]
+    assert tool._split_tasks("research topic A") == ["research topic A"]
+    assert tool._split_tasks('["unterminated') == ['["unterminated']
+    assert tool._split_tasks('{"task": "topic A"}') == ['{"task": "topic A"}']
+    assert tool._split_tasks("[]") == ["[]"]
+
+    original = delegate.Agent
+    delegate.Agent = _Stub_Agent
+    try:
+        ctx.max_parallel_delegates = 2
+        out = tool.use('["first topic", "second topic", "third topic", "fail topic"]')
+        print(out)
+        assert _Stub_Agent.most_running == 2
+        positions = [out.index(f"=== REPORT {i}/4") for i in range(1, 5)]
+        assert positions == sorted(positions)
+        assert "report on first topic" in out and "report on third topic" in out
+        assert "Delegate was unable to fully finish" in out
+
+        single = tool.use("one topic")
+        assert single.startswith("report on one topic") and "=== REPORT" not in single
+    finally:
+        delegate.Agent = original
+
+    # Delegates using the same key share one client (and with it one connection pool)
+    original_openai = agent_module._openai
+    agent_module._openai = lambda: _Stub_OpenAI_Module
+    try:
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(agent_module.get_shared_client("shared-key")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len({id(client) for client in clients}) == 1
+        assert agent_module.get_shared_client("other-key") is not clients[0]
+    finally:
+        agent_module._openai = original_openai
+        agent_module._CLIENT_POOL.pop("shared-key", None)
+        agent_module._CLIENT_POOL.pop("other-key", None)
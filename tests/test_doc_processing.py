@@ -0,0 +1,75 @@
+import os
+import tempfile
+import threading
+import time
+from util.doc_processing import Doc_Processor, Doc_Processing_Error, HANDOFF_BYTES
+from util.cancellation import Cancel_Token, Cancelled_Error
+
+
+# Module level, so the worker processes can unpickle them
+def _describe(data):
+    return {"pid": os.getpid(), "size": len(data), "head": data[:4]}
+
+
+def _hang(data):
+    time.sleep(30)
+
+
+# Set by the test process only; a worker that was forked from it would see the change
+_IN_PARENT = False
+
+
+def _in_parent(data):
+    return _IN_PARENT
+
+
+def test_doc_processing():
+    print("\n\n" + "="*10 + "PERFORMING DOCUMENT PROCESSING TEST" + "="*10)
+    global _IN_PARENT
+    _IN_PARENT = True
+    processor = Doc_Processor(max_workers=1, timeout=1)
+    try:
+        small = processor._run(_describe, b"%PDF small")
+        print(small)
+        assert small["pid"] != os.getpid() and small["size"] == 10
+        # Workers start fresh instead of being forked from the (threaded) server
+        assert processor._run(_in_parent, b"") is False
+
+        # Large buffers and spooled files reach the worker through the file system
+        large = processor._run(_describe, b"%PDF" + b"x" * HANDOFF_BYTES)
+        assert large["size"] == HANDOFF_BYTES + 4 and large["head"] == b"%PDF"
+        with tempfile.NamedTemporaryFile() as spooled:
+            spooled.write(b"%PDF spooled")
+            spooled.seek(0)
+            assert processor._run(_describe, spooled)["size"] == 12
+
+        # A runaway parse is stopped by the worker's alarm, and the pool keeps working without
+        # being replaced
+        pool = processor._pool
+        start = time.monotonic()
+        try:
+            processor._run(_hang, b"")
+            assert False, "the task should have timed out"
+        except Doc_Processing_Error as e:
+            print(e)
+        assert time.monotonic() - start < 10
+        assert processor._run(_describe, b"after")["size"] == 5
+        assert processor._pool is pool
+
+        # A cancelled run stops waiting for its parse right away
+        token = Cancel_Token()
+        threading.Timer(0.2, token.cancel, args=("client disconnected",)).start()
+        start = time.monotonic()
+        try:
+            processor._run(_hang, b"", token)
+            assert False, "the wait should have been cancelled"
+        except Cancelled_Error as e:
+            print(e)
+        assert time.monotonic() - start < 0.9 and processor._pool is pool
+    finally:
+        _IN_PARENT = False
+        processor.shutdown()
+
+    # Without a process pool, tasks run inline
+    inline = Doc_Processor(use_processes=False)
+    assert inline._run(_describe, b"inline")["pid"] == os.getpid()
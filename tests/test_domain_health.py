@@ -0,0 +1,77 @@
+import os
+import tempfile
+import time
+from util.domain_health import Domain_Health, fetch_timeout, looks_like_captcha, MIN_TIMEOUT_SECONDS
+
+
+def test_domain_health():
+    print("\n\n" + "="*10 + "PERFORMING DOMAIN HEALTH TEST" + "="*10)
+    health = Domain_Health(os.path.join(tempfile.mkdtemp(), "health.sqlite3"), half_life=0.5, bad_url_seconds=0.5,
+                           transient_bad_url_seconds=0.1)
+
+    for i in range(4):
+        health.record_failure(f"https://www.walled.example/page{i}", "http_403")
+    health.record_success("https://open.example/a")
+    health.record_failure("https://open.example/b", "timeout")
+
+    # Failed urls fail fast, others on the same domain are still allowed
+    assert health.bad_url("https://walled.example/page1/") == "http_403"
+    assert health.bad_url("https://walled.example/other") is None
+
+    # A timeout may not happen again, so it is only remembered briefly
+    assert health.bad_url("https://open.example/b") == "timeout"
+    time.sleep(0.2)
+    assert health.bad_url("https://open.example/b") is None
+    assert health.bad_url("https://walled.example/page1") == "http_403"
+
+    report = health.report()
+    print(report)
+    assert report[0]["domain"] == "walled.example"
+    assert health.is_unhealthy("walled.example")
+    assert not health.is_unhealthy("open.example")
+
+    # Everything decays: the negative cache expires and old failures stop counting
+    time.sleep(1.6)
+    assert health.bad_url("https://walled.example/page1") is None
+    assert health.score("walled.example") > 0.6
+
+    assert looks_like_captcha("Just a moment... Checking your browser before accessing the site.")
+    assert looks_like_captcha("example.com\nVerify you are human by completing the action below.\nRay ID: 8a1b")
+    assert not looks_like_captcha("An essay about apples. " * 500)
+    # Short pages about challenges are content
+    assert not looks_like_captcha("What is a CAPTCHA?\n"
+                                  "A CAPTCHA is a test that tells people and programs apart. Sites show one "
+                                  "when they see unusual traffic, and it asks you to verify you are human, "
+                                  "for example by picking every picture with a traffic light in it.\n"
+                                  "The name stands for Completely Automated Public Turing test to tell "
+                                  "Computers and Humans Apart, and the first ones were distorted words.")
+
+
+def test_fetch_timeouts():
+    print("\n\n" + "="*10 + "PERFORMING FETCH TIMEOUT TEST" + "="*10)
+    health = Domain_Health(os.path.join(tempfile.mkdtemp(), "health.sqlite3"))
+
+    # Too few samples: the default
+    health.record_latency("https://fast.example/a", "playwright", 0.4)
+    assert health.timeout_for("https://fast.example/a", "playwright", 30) == 30
+
+    for seconds in (0.5, 0.6, 0.8, 1.2, 3.0):
+        health.record_latency("https://fast.example/b", "playwright", seconds)
+        health.record_latency("https://slow.example/b", "playwright", seconds * 20)
+    health._timeouts.clear()
+    fast = health.timeout_for("https://www.fast.example/c", "playwright", 30)
+    print(f"fast.example: {fast}s, slow.example: {health.timeout_for('https://slow.example/c', 'playwright', 30)}s")
+    assert MIN_TIMEOUT_SECONDS <= fast < 30
+    assert health.timeout_for("https://slow.example/c", "playwright", 30) == 30
+
+    # Each tier has its own samples: nothing is known about plain requests to fast.example yet
+    assert health.timeout_for("https://fast.example/c", "requests", 10) == 10
+
+    # The run's deadline wins over the domain's timeout
+    previous, Domain_Health._instance = Domain_Health._instance, health
+    try:
+        assert fetch_timeout("https://slow.example/c", "playwright", 30, time_left=None) == 30
+        assert 0 < fetch_timeout("https://slow.example/c", "playwright", 30, time_left=15) < 15
+        assert fetch_timeout("https://slow.example/c", "playwright", 30, time_left=2) == 0
+    finally:
+        Domain_Health._instance = previous
@@ -0,0 +1,135 @@
+import os
+import tempfile
+from util.download_guard import Download_Rejected, classify, read_body, temp_copy, MAX_TEXT_BYTES
+from util.app_context import App_Context
+from util.cancellation import Cancelled_Error
+from tools.site_fetcher_tool import SiteFetcherTool
+
+
+class _Fake_Response:
+    """
+    Just enough of a streamed requests response. Counts the chunks handed out.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+
+def _rejected(call):
+    try:
+        call()
+    except Download_Rejected as e:
+        return e.kind
+    return None
+
+
+def test_download_guard():
+    print("\n\n" + "="*10 + "PERFORMING DOWNLOAD GUARD TEST" + "="*10)
+    assert classify("text/html; charset=utf-8") == "text"
+    assert classify("application/pdf", content_length="1000") == "pdf"
+    assert classify("application/octet-stream", "https://example.com/paper.PDF") == "pdf"
+    assert classify("application/octet-stream", "https://example.com/file") is None
+    assert _rejected(lambda: classify("video/mp4")) == "unsupported_type"
+    assert _rejected(lambda: classify("application/zip")) == "unsupported_type"
+    assert _rejected(lambda: classify("text/html", content_length=str(MAX_TEXT_BYTES + 1))) == "too_large"
+
+    body, kind = read_body(_Fake_Response([b"<html>", b"<body>hi</body></html>"]), "text")
+    assert kind == "text" and body == b"<html><body>hi</body></html>"
+
+    # PDFs land in a temporary file, not in memory
+    body, kind = read_body(_Fake_Response([b"%PDF-1.7\n", b"rest of the file"]))
+    assert kind == "pdf" and body.read() == b"%PDF-1.7\nrest of the file"
+    body.close()
+
+    # Unlabelled binaries are refused after the first chunk; oversized bodies once they pass the cap
+    binary = _Fake_Response([b"PK\x03\x04\x00\x00"] + [b"x" * 1024] * 10)
+    assert _rejected(lambda: read_body(binary)) == "unsupported_type"
+    assert binary.sent == 1
+    endless = _Fake_Response([b"a" * (1024 * 1024)] * 50)
+    assert _rejected(lambda: read_body(endless, "text")) == "too_large"
+    print(f"Stopped an endless page after {endless.sent} chunks")
+    assert endless.sent <= MAX_TEXT_BYTES // (1024 * 1024) + 1
+
+    # A browser download is copied, so the copy outlives the browser deleting the original
+    path = os.path.join(tempfile.mkdtemp(), "download.pdf")
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.7\nfrom the browser")
+    copy = temp_copy(path)
+    os.remove(path)
+    assert copy.read() == b"%PDF-1.7\nfrom the browser"
+    copy.close()
+
+
+class _Fake_Download:
+    """
+    A browser download that grows its .crdownload file by `step` bytes every time the page waits,
+    and is renamed once it reaches `total`.
+    """
+    def __init__(self, directory, total, step):
+        self.directory = directory
+        self.total = total
+        self.step = step
+        self.suggested_filename = "report.pdf"
+        self.partial = os.path.join(directory, "guid.crdownload")
+        self.final = os.path.join(directory, "guid")
+        self.cancelled = False
+        open(self.partial, "wb").close()
+
+    def grow(self):
+        if self.cancelled or not os.path.exists(self.partial):
+            return
+        with open(self.partial, "ab") as f:
+            f.write(b"x" * self.step)
+        if os.path.getsize(self.partial) >= self.total:
+            os.rename(self.partial, self.final)
+
+    def path(self):
+        assert os.path.exists(self.final), "path() would block until the download is done"
+        return self.final
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Fake_Page:
+    def __init__(self, download):
+        self.download = download
+        self.waited = 0
+
+    def wait_for_timeout(self, ms):
+        self.waited += 1
+        self.download.grow()
+
+
+def test_browser_download_guard():
+    print("\n\n" + "="*10 + "PERFORMING BROWSER DOWNLOAD GUARD TEST" + "="*10)
+    tool = SiteFetcherTool(App_Context("", verbose=False))
+
+    # A download under the cap is waited for and handed over once complete
+    download = _Fake_Download(tempfile.mkdtemp(), total=300, step=100)
+    page = _Fake_Page(download)
+    assert tool._await_download(page, download, download.directory, 1000, 5000) == download.final
+    assert page.waited == 3 and not download.cancelled
+
+    # One that passes the cap is cancelled as soon as the partial file shows it
+    download = _Fake_Download(tempfile.mkdtemp(), total=10000, step=100)
+    assert _rejected(lambda: tool._await_download(_Fake_Page(download), download, download.directory, 250, 5000)) == "too_large"
+    assert download.cancelled and os.path.getsize(download.partial) == 300
+
+    # So is one that does not finish in time, and one whose run was cancelled
+    download = _Fake_Download(tempfile.mkdtemp(), total=10000, step=1)
+    assert _rejected(lambda: tool._await_download(_Fake_Page(download), download, download.directory, 1000, 1)) == "timeout"
+    assert download.cancelled
+    download = _Fake_Download(tempfile.mkdtemp(), total=10000, step=1)
+    tool.ctx.cancel_token.cancel("client disconnected")
+    try:
+        tool._await_download(_Fake_Page(download), download, download.directory, 1000, 5000)
+        assert False, "a cancelled run should stop waiting"
+    except Cancelled_Error as e:
+        print(e)
+    assert download.cancelled
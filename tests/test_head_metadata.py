@@ -0,0 +1,93 @@
+import util.head_metadata as head_metadata
+from util.head_metadata import Head_Parser, metadata_from_tags, fetch_pdf_info
+
+PAGE = """<!DOCTYPE html><html><head><title> Apples | Example </title>
+<meta property="og:title" content="All About Apples">
+<meta name="citation_author" content="Smith, Jane">
+<meta name="citation_publication_date" content="2020/5/1">
+<script type="application/ld+json">{"@type": "Article", "publisher": {"name": "Example Press"}}</script>
+</head><body>""" + "<p>body text</p>" * 10000 + "</body></html>"
+
+
+class _Fake_Response:
+    def __init__(self, data, start, total):
+        self.status_code = 206
+        self.headers = {"Content-Range": f"bytes {start}-{start + len(data) - 1}/{total}"}
+        self.raw = self
+        self._data = data
+
+    def read(self, n, decode_content=True):
+        return self._data[:n]
+
+    def close(self):
+        pass
+
+
+class _Fake_Range_Session:
+    """
+    Serves Range requests from an in-memory file and remembers how many bytes it sent.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.sent = 0
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        spec = headers["Range"][len("bytes="):]
+        if spec.startswith("-"):
+            start = len(self.data) - int(spec[1:])
+        else:
+            start, end = (int(x) for x in spec.split("-"))
+        end = len(self.data) if spec.startswith("-") else min(end + 1, len(self.data))
+        self.sent += end - start
+        return _Fake_Response(self.data[start:end], start, len(self.data))
+
+
+def _build_pdf():
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [] /Count 0 >>",
+        b"<< /Title (Apples \\(and Pears\\)) /Author <FEFF004A0061006E006500200053006D006900740068> "
+        b"/CreationDate (D:20190304120000Z) >>",
+        b"<< /Length 100000 >>\nstream\n" + b"x" * 100000 + b"\nendstream",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 3 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def test_head_metadata():
+    print("\n\n" + "="*10 + "PERFORMING HEAD METADATA TEST" + "="*10)
+    # The parser stops at the end of <head>, however the page is split into chunks
+    parser = Head_Parser()
+    fed = 0
+    for i in range(0, len(PAGE), 512):
+        parser.feed(PAGE[i:i + 512])
+        fed = i + 512
+        if parser.done:
+            break
+    assert parser.done and fed < 2048
+    meta = metadata_from_tags(parser.tags, parser.json_ld, parser.title)
+    print(meta)
+    assert meta == {"title": "All About Apples", "author": "Jane Smith", "site_name": "Example Press",
+                    "date": "2020-05-01"}
+
+    # PDFs: the info object is outside the tail, so it is found through the cross-reference table
+    pdf = _build_pdf()
+    session = _Fake_Range_Session(pdf)
+    original = head_metadata.PDF_TAIL_BYTES
+    head_metadata.PDF_TAIL_BYTES = 400
+    try:
+        info = fetch_pdf_info("https://example.com/apples.pdf", session)
+    finally:
+        head_metadata.PDF_TAIL_BYTES = original
+    print(info, f"{session.sent} of {len(pdf)} bytes read")
+    assert info == {"title": "Apples (and Pears)", "author": "Jane Smith", "site_name": None, "date": "2019-03-04"}
+    assert session.sent < len(pdf) // 4
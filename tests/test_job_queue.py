@@ -0,0 +1,145 @@
+import os
+import tempfile
+import threading
+import time
+import web_api.worker as worker
+from web_api.job_queue import Sqlite_Job_Queue
+from web_api.jobs import Queue_Full_Error
+from util.logs import Log
+
+
+class _Slow_API:
+    """
+    Stands in for Application_API: "runs" for a few seconds unless its token is cancelled.
+    """
+    def run_analysis(self, query, on_context=None, cancel_token=None):
+        for _ in range(20):
+            cancel_token.check()
+            time.sleep(0.05)
+        return {"revised_text": query["text"]}
+
+
+class _Null_Writer:
+    def write(self, record):
+        pass
+
+
+class _Logging_API:
+    """
+    Stands in for Application_API: logs one iteration, then waits until the test opens the gate.
+    """
+    def __init__(self):
+        self.gate = threading.Event()
+
+    def run_analysis(self, query, on_context=None, cancel_token=None):
+        ctx = type("Stub_Context", (), {})()
+        ctx.log = Log(False, writer=_Null_Writer())
+        on_context(ctx)
+        ctx.log.log("--- Iteration 1 ---")
+        self.gate.wait(5)
+        return {"revised_text": query["text"]}
+
+
+def _wait_for(condition, seconds=3):
+    end = time.monotonic() + seconds
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_job_queue():
+    print("\n\n" + "="*10 + "PERFORMING JOB QUEUE TEST" + "="*10)
+    path = os.path.join(tempfile.mkdtemp(), "queue.sqlite3")
+    queue = Sqlite_Job_Queue(path, lease_seconds=60, max_attempts=2, max_queued=2)
+
+    job = queue.submit({"text": "essay", "tools": ["b", "a"]})
+    # An identical submission joins the queued job instead of queueing a second run
+    assert queue.submit({"text": "essay", "tools": ["a", "b"]}).id == job.id
+    queue.submit({"text": "other essay", "tools": []})
+    try:
+        queue.submit({"text": "one too many", "tools": []})
+        assert False, "queue should have been full"
+    except Queue_Full_Error:
+        print("Queue full, as expected.")
+
+    # Worker A claims the oldest job and reports progress
+    job_id, query = queue.claim("worker-a")
+    assert job_id == job.id and query["text"] == "essay"
+    assert queue.heartbeat(job_id, "worker-a", [(0, "--- Iteration 1 ---"), (1, "Action: x")], 1)
+    assert [e for _, e in queue.events_since(job_id, 1)] == ["Action: x"]
+
+    # Worker A dies: once its lease expires, worker B takes the job over
+    queue.lease_seconds = -1
+    assert queue.heartbeat(job_id, "worker-a")
+    queue.lease_seconds = 60
+    second_id, _ = queue.claim("worker-b")
+    third_id, _ = queue.claim("worker-b")
+    assert second_id == job_id and third_id != job_id
+    assert not queue.heartbeat(job_id, "worker-a")
+
+    queue.complete(job_id, "worker-b", {"revised_text": "essay"})
+    done = queue.get(job_id)
+    print(done.describe())
+    assert done.status == "done" and done.result["revised_text"] == "essay" and done.attempts == 2
+
+    # A job shared by two submissions keeps running until both have cancelled it
+    shared = queue.submit({"text": "shared essay", "tools": []})
+    assert queue.submit({"text": "shared essay", "tools": []}).id == shared.id
+    assert queue.claim("worker-a")[0] == shared.id
+    assert queue.cancel(shared.id).status == "running" and not queue.cancel_requested(shared.id)
+    assert queue.cancel(shared.id).status == "cancel_requested"
+
+
+def test_worker_lease_loss():
+    print("\n\n" + "="*10 + "PERFORMING WORKER LEASE LOSS TEST" + "="*10)
+    queue = Sqlite_Job_Queue(os.path.join(tempfile.mkdtemp(), "queue.sqlite3"))
+    queue.submit({"text": "essay", "tools": []})
+    job_id, query = queue.claim("worker-a")
+
+    # Worker A stalls past its lease and worker B takes the job over
+    queue.lease_seconds = -1
+    assert queue.heartbeat(job_id, "worker-a")
+    queue.lease_seconds = 60
+    assert queue.claim("worker-b")[0] == job_id
+
+    # Worker A's next heartbeat fails: its run is stopped and the job is left to worker B
+    original_poll = worker.CANCEL_POLL_SECONDS
+    worker.CANCEL_POLL_SECONDS = 0.05
+    queue.lease_seconds = 0.3
+    try:
+        start = time.monotonic()
+        worker._run_job(queue, _Slow_API(), "worker-a", job_id, query)
+        assert time.monotonic() - start < 2
+    finally:
+        worker.CANCEL_POLL_SECONDS = original_poll
+        queue.lease_seconds = 60
+    assert queue.get(job_id).status == "running"
+
+    worker._run_job(queue, _Slow_API(), "worker-b", job_id, query)
+    done = queue.get(job_id)
+    print(done.describe())
+    assert done.status == "done" and done.result["revised_text"] == "essay"
+
+
+def test_worker_event_flush():
+    print("\n\n" + "="*10 + "PERFORMING WORKER EVENT FLUSH TEST" + "="*10)
+    queue = Sqlite_Job_Queue(os.path.join(tempfile.mkdtemp(), "queue.sqlite3"), lease_seconds=60)
+    queue.submit({"text": "essay", "tools": []})
+    job_id, query = queue.claim("worker-a")
+
+    # Log entries reach the queue while the run is going, long before the next lease heartbeat
+    api = _Logging_API()
+    run = threading.Thread(target=worker._run_job, args=(queue, api, "worker-a", job_id, query))
+    run.start()
+    try:
+        assert _wait_for(lambda: len(queue.events_since(job_id, 0)) == 2)
+        assert queue.get(job_id).status == "running"
+        events = queue.events_since(job_id, 0)
+        print(events)
+        # Entries logged before the worker subscribed are forwarded too, starting with index 0
+        assert [index for index, _ in events] == [0, 1]
+        assert events[0][1].startswith("[STARTED LOG AT") and events[1][1] == "--- Iteration 1 ---"
+    finally:
+        api.gate.set()
+        run.join(5)
+    assert queue.get(job_id).status == "done"
@@ -0,0 +1,208 @@
+import os
+import tempfile
+import threading
+import time
+from util.logs import Log
+from web_api.jobs import Job, Job_Manager, Queue_Full_Error
+from web_api.result_cache import Result_Cache
+
+
+class _Gated_API:
+    """
+    Stands in for Application_API: every run waits until the test opens the gate.
+    """
+    def __init__(self):
+        self.gate = threading.Event()
+
+    def run_analysis(self, query, on_context=None, cancel_token=None):
+        self.gate.wait(5)
+        if query["text"] == "fail":
+            raise RuntimeError("the agent crashed")
+        return {"revised_text": query["text"]}
+
+
+class _Shared_Run_API:
+    """
+    Stands in for Application_API: identical queries share one run through a Result_Cache, and a
+    run goes on until the test opens the gate or its token is cancelled.
+    """
+    def __init__(self):
+        self.results = Result_Cache(os.path.join(tempfile.mkdtemp(), "results.sqlite3"))
+        self.tokens = []
+        self.gate = threading.Event()
+
+    def run_analysis(self, query, on_context=None, cancel_token=None):
+        return self.results.get_or_run(query["text"], lambda token: self._run(query, token),
+                                       cancel_token=cancel_token)
+
+    def _run(self, query, token):
+        self.tokens.append(token)
+        while not self.gate.is_set():
+            token.wait(0.02)
+            token.check()
+        return {"revised_text": query["text"]}, False
+
+
+class _Null_Writer:
+    def write(self, record):
+        pass
+
+
+def _wait_for(condition, seconds=3):
+    end = time.monotonic() + seconds
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_jobs():
+    print("\n\n" + "="*10 + "PERFORMING JOB MANAGER TEST" + "="*10)
+    api = _Gated_API()
+    manager = Job_Manager(api, max_workers=1, max_queued=1, ttl=0.2)
+
+    # One running and one waiting fill the manager; the next submission is turned away
+    running = manager.submit({"text": "one"})
+    waiting = manager.submit({"text": "fail"})
+    assert _wait_for(lambda: running.status == "running")
+    assert waiting.status == "queued"
+    try:
+        manager.submit({"text": "one too many"})
+        assert False, "the manager should have been full"
+    except Queue_Full_Error as e:
+        print(f"Queue full, as expected: {e}")
+    assert manager.counts() == {"running": 1, "queued": 1}
+
+    api.gate.set()
+    assert _wait_for(lambda: running.is_finished() and waiting.is_finished())
+    assert running.status == "done" and running.result == {"revised_text": "one"}
+    assert waiting.status == "failed" and waiting.error == "the agent crashed"
+    print(running.describe())
+
+    # Finished jobs free their slots at once, and are forgotten after the TTL
+    third = manager.submit({"text": "three"})
+    assert manager.get(running.id) is running
+    assert _wait_for(lambda: third.is_finished())
+    time.sleep(0.3)
+    assert manager.get(running.id) is None and manager.get(waiting.id) is None
+    assert manager.get(third.id) is None
+    assert manager.counts() == {}
+
+
+def test_shared_run_cancel():
+    print("\n\n" + "="*10 + "PERFORMING SHARED RUN CANCEL TEST" + "="*10)
+    api = _Shared_Run_API()
+    manager = Job_Manager(api, max_workers=4)
+
+    try:
+        # Two clients submit the same query; cancelling the one that joined the run only stops its wait
+        first = manager.submit({"text": "essay"})
+        # The first job must have started the run before the second joins it
+        assert _wait_for(lambda: len(api.tokens) == 1)
+        second = manager.submit({"text": "essay"})
+        assert _wait_for(lambda: api.results.coalesced == 1)
+        manager.cancel(second.id)
+        assert _wait_for(lambda: second.is_finished())
+        assert second.status == "cancelled" and not first.is_finished()
+        api.gate.set()
+        assert _wait_for(lambda: first.is_finished())
+        assert first.status == "done" and first.result == {"revised_text": "essay"}
+        assert len(api.tokens) == 1 and not api.tokens[0].cancelled
+        api.gate.clear()
+
+        # Cancelling the job that started the run leaves it going for the other one
+        first = manager.submit({"text": "other essay"})
+        assert _wait_for(lambda: len(api.tokens) == 2)
+        second = manager.submit({"text": "other essay"})
+        assert _wait_for(lambda: api.results.coalesced == 2)
+        manager.cancel(first.id)
+        assert not api.tokens[-1].cancelled
+        api.gate.set()
+        assert _wait_for(lambda: first.is_finished() and second.is_finished())
+        assert second.status == "done" and first.status == "cancelled"
+        api.gate.clear()
+
+        # Once every client has cancelled, the run itself stops without the gate ever opening
+        first = manager.submit({"text": "third essay"})
+        assert _wait_for(lambda: len(api.tokens) == 3)
+        second = manager.submit({"text": "third essay"})
+        assert _wait_for(lambda: api.results.coalesced == 3)
+        manager.cancel(first.id)
+        manager.cancel(second.id)
+        assert _wait_for(lambda: first.is_finished() and second.is_finished())
+        assert first.status == second.status == "cancelled"
+        assert api.tokens[-1].cancelled
+        print(first.describe(), second.describe())
+    finally:
+        # A failed assertion must not leave a gated run holding the process open
+        api.gate.set()
+
+
+def test_job_stream():
+    print("\n\n" + "="*10 + "PERFORMING JOB STREAM TEST" + "="*10)
+    job = Job({"text": "essay"})
+    job.ctx = type("Stub_Context", (), {})()
+    job.ctx.log = Log(False, writer=_Null_Writer())
+    for i in range(1, 4):
+        job.ctx.log.log(f"--- Iteration {i} ---")
+    job.status = "running"
+
+    # A reconnecting client resumes after the last event it saw (Last-Event-ID 1 -> offset 2)
+    received = []
+    def read():
+        for item in job.stream(offset=2):
+            if item is not None:
+                received.append(item)
+    reader = threading.Thread(target=read)
+    reader.start()
+    assert _wait_for(lambda: len(received) == 2)
+
+    # Entries logged while streaming follow
+    job.ctx.log.log("Action: google-search-tool | Input: apples")
+    assert _wait_for(lambda: len(received) == 3)
+
+    # Entries logged just before the job finishes are still delivered, and the stream ends as soon
+    # as the job does rather than on the next keepalive
+    job.ctx.log.log("Final Answer received.")
+    job.status = "done"
+    job.mark_finished()
+    reader.join(1)
+    assert not reader.is_alive()
+    print(received)
+    assert [index for index, _ in received] == [2, 3, 4, 5]
+    assert received[0][1] == "--- Iteration 2 ---" and received[-1][1] == "Final Answer received."
+
+
+def test_job_stream_concurrent():
+    print("\n\n" + "="*10 + "PERFORMING CONCURRENT JOB STREAM TEST" + "="*10)
+    job = Job({"text": "essay"})
+    job.ctx = type("Stub_Context", (), {})()
+    job.ctx.log = Log(False, writer=_Null_Writer())
+    job.status = "running"
+    # A slow subscriber ahead of the stream widens the window in which entries could overtake
+    job.ctx.log.subscribe(lambda index, entry: time.sleep(0.0005))
+
+    received = []
+    def read():
+        for item in job.stream():
+            if item is not None:
+                received.append(item[0])
+    reader = threading.Thread(target=read)
+    reader.start()
+
+    # Concurrent delegates log from several threads at once; the stream still gets every entry once
+    def write(name):
+        for i in range(200):
+            job.ctx.log.log(f"[{name}] entry {i}")
+    writers = [threading.Thread(target=write, args=(f"delegate {n}",)) for n in range(4)]
+    for writer in writers:
+        writer.start()
+    try:
+        for writer in writers:
+            writer.join()
+        assert _wait_for(lambda: len(received) == len(job.ctx.log.entries))
+    finally:
+        job.status = "done"
+        job.mark_finished()
+        reader.join(3)
+    assert not reader.is_alive()
+    assert received == list(range(len(job.ctx.log.entries))) and len(received) == 801
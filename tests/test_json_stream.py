@@ -0,0 +1,55 @@
+import gzip
+import json
+import util.json_stream as json_stream
+from util.json_stream import iter_json, iter_chunks, compress_chunks, negotiate_encoding
+
+
+PAYLOAD = {
+    "revised_text": "An essay \"quoted\" with\nnewlines, tabs\tand unicode: café — 日本",
+    "works_cited": [{"url": "https://example.com/a?b=1&c=2", "year": 2024}, None, True, 1.5],
+    "notes": [],
+    "empty": {},
+    7: "numeric key"
+}
+
+
+def test_json_stream():
+    print("\n\n" + "="*10 + "PERFORMING JSON STREAM TEST" + "="*10)
+    # The streamed encoding is exactly what json.dumps produces, however it is chunked
+    assert "".join(iter_json(PAYLOAD)) == json.dumps(PAYLOAD)
+    chunks = list(iter_chunks(PAYLOAD, chunk_size=16))
+    assert len(chunks) > 1
+    assert b"".join(chunks).decode("ascii") == json.dumps(PAYLOAD)
+    assert json.loads("".join(iter_json(PAYLOAD, sanitize=str.upper)))["NOTES"] == []
+
+    # Compressed output round-trips
+    body = b"".join(compress_chunks(iter_chunks(PAYLOAD, chunk_size=16), "gzip"))
+    assert json.loads(gzip.decompress(body)) == json.loads(json.dumps(PAYLOAD))
+    assert b"".join(compress_chunks(iter_chunks(PAYLOAD), None)) == json.dumps(PAYLOAD).encode("ascii")
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        body = b"".join(compress_chunks(iter_chunks(PAYLOAD, chunk_size=16), "br"))
+        assert json.loads(brotli.decompress(body)) == json.loads(json.dumps(PAYLOAD))
+
+    # Negotiation follows the client's q-values, with ties going to the better compression
+    original = json_stream._brotli_available
+    try:
+        json_stream._brotli_available = lambda: True
+        assert negotiate_encoding("gzip, deflate, br") == "br"
+        assert negotiate_encoding("br;q=0.5, gzip") == "gzip"
+        assert negotiate_encoding("br;q=0, gzip;q=0.8") == "gzip"
+        assert negotiate_encoding("gzip;q=0.5, identity") is None
+        assert negotiate_encoding("identity;q=0, gzip;q=0.1") == "gzip"
+        assert negotiate_encoding("*") == "br"
+        assert negotiate_encoding("*;q=0, identity") is None
+        assert negotiate_encoding("identity") is None
+        assert negotiate_encoding("") is None
+        assert negotiate_encoding(None) is None
+        json_stream._brotli_available = lambda: False
+        assert negotiate_encoding("br, gzip;q=0.5") == "gzip"
+        assert negotiate_encoding("br") is None
+    finally:
+        json_stream._brotli_available = original
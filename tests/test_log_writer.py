@@ -0,0 +1,66 @@
+import glob
+import json
+import os
+import tempfile
+from util.log_writer import Log_Writer, process_log_path
+from util.logs import Log
+
+
+def test_log_writer():
+    print("\n\n" + "="*10 + "PERFORMING LOG WRITER TEST" + "="*10)
+    directory = tempfile.mkdtemp()
+    writer = Log_Writer(os.path.join(directory, "agent.jsonl"), max_bytes=2000, backup_count=2)
+    log = Log(should_print=True, console_limit=40, writer=writer)
+    log.save_dir = directory + "/"
+
+    log.log("DEBUG: LLM Output: thinking")
+    log.log("Observation: " + "x" * 500)
+    for i in range(60):
+        log.log(f"entry {i}")
+
+    # The transcript matches the entries exactly, and save() only appends what is new
+    assert log.as_string == "".join(entry + "\n" for entry in log.entries)
+    log.save()
+    log.log("after save")
+    log.save()
+    assert writer.flush()
+    with open(log.save_dir + log.name, encoding="utf-8") as file:
+        assert file.read() == log.as_string
+
+    # Records are structured, and the file rotated instead of growing past the limit
+    files = sorted(glob.glob(os.path.join(directory, "agent.jsonl*")))
+    print(files)
+    assert len(files) == 3
+    assert all(os.path.getsize(path) < 2000 + 700 for path in files)
+    with open(os.path.join(directory, "agent.jsonl"), encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert records[-1]["msg"] == "after save" and records[-1]["level"] == "INFO"
+    assert records[-1]["run"] == log.run_id
+
+    # Two runs started in the same second still get their own id and transcript file
+    other = Log(should_print=False, writer=writer)
+    assert other.run_id != log.run_id and other.name != log.name
+    writer.close()
+
+
+def test_log_writer_per_process():
+    print("\n\n" + "="*10 + "PERFORMING PER-PROCESS LOG FILE TEST" + "="*10)
+    # Every process rotates only its own file
+    path = process_log_path("./logs/agent.jsonl")
+    assert path == f"./logs/agent.{os.getpid()}.jsonl"
+    writer = Log_Writer.get()
+    assert writer.path == path and Log_Writer.get() is writer
+
+    # A forked child gets a writer (and file) of its own instead of the parent's dead thread
+    read_end, write_end = os.pipe()
+    pid = os.fork() if hasattr(os, "fork") else None
+    if pid == 0:
+        child = Log_Writer.get()
+        ok = child is not writer and child.path == process_log_path("./logs/agent.jsonl") != path
+        os.write(write_end, b"1" if ok else b"0")
+        os._exit(0)
+    if pid is not None:
+        os.waitpid(pid, 0)
+        assert os.read(read_end, 1) == b"1"
+    os.close(read_end)
+    os.close(write_end)
@@ -0,0 +1,34 @@
+from agent.loop_guard import Loop_Guard
+
+
+def test_loop_guard():
+    print("\n\n" + "="*10 + "PERFORMING LOOP GUARD TEST" + "="*10)
+    guard = Loop_Guard(similarity=0.8, stall_limit=3)
+
+    guard.record("google-search-tool", "apples as a fruit", "[results]", True)
+    guard.record("site-fetcher-tool", "https://example.com/apples/", "Error: Tool returned False.", False)
+
+    # Exact repeats (modulo quoting, case and trailing slashes) are answered from history
+    repeat = guard.check("google-search-tool", "\"Apples as a FRUIT\"")
+    print(repeat)
+    assert repeat is not None and "[results]" in repeat
+    failed = guard.check("site-fetcher-tool", "http://www.example.com/apples")
+    print(failed)
+    assert failed.startswith("Error:")
+
+    # Near duplicates are caught for searches, but neighbouring urls are different sources
+    assert guard.check("google-search-tool", "apples as a fruit!") is not None
+    assert guard.check("google-search-tool", "history of apple orchards") is None
+    assert guard.check("site-fetcher-tool", "https://example.com/pears") is None
+
+    assert guard.is_stalled()
+    assert not guard.must_stop()
+    guard.record_no_action()
+    guard.record_no_action()
+    assert guard.must_stop()
+
+    # Urls without a scheme are canonicalized and compared exactly too, never word by word
+    guard.record("site-fetcher-tool", "en.wikipedia.org/wiki/Apple", "Apple is a fruit.", True)
+    assert guard.check("site-fetcher-tool", "https://en.wikipedia.org/wiki/Apple/") is not None
+    assert guard.check("site-fetcher-tool", "en.wikipedia.org/wiki/Apple_Inc") is None
+    assert guard.check("site-fetcher-tool", "en.wikipedia.org/wiki/Apple?lang=fr") is None
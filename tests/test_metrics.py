@@ -0,0 +1,35 @@
+import os
+import tempfile
+from util.metrics import Metrics_Registry, CACHE_REQUESTS
+from web_api.result_cache import Result_Cache
+
+
+def test_metrics():
+    print("\n\n" + "="*10 + "PERFORMING METRICS TEST" + "="*10)
+    registry = Metrics_Registry()
+    calls = registry.counter("test_calls_total", "Calls.", ["tool"])
+    latency = registry.histogram("test_latency_seconds", "Latency.", ["tool"], buckets=(0.1, 1))
+    queued = registry.gauge("test_queued", "Queued.")
+    registry.add_collector(lambda: queued.set(3))
+
+    calls.inc(tool="search")
+    calls.inc(2, tool="search")
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, tool="fetch")
+
+    text = registry.render()
+    print(text)
+    assert 'test_calls_total{tool="search"} 3' in text
+    # Buckets are cumulative and values past the last bound only count toward +Inf
+    assert 'test_latency_seconds_bucket{tool="fetch",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{tool="fetch",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{tool="fetch",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{tool="fetch"} 3' in text
+    assert "test_queued 3" in text
+
+    # The result cache reports hits, misses and coalesced waits
+    cache = Result_Cache(os.path.join(tempfile.mkdtemp(), "results.sqlite3"))
+    before = CACHE_REQUESTS.value(cache="results", result="hit")
+    cache.get_or_run("key", lambda token: ({"out": 1}, True))
+    cache.get_or_run("key", lambda token: ({"out": 2}, True))
+    assert CACHE_REQUESTS.value(cache="results", result="hit") == before + 1
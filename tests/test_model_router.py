@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import time
+import util.model_router as model_router
+from util.model_router import Model_Router
+
+
+CONFIG = {
+    "routes": {
+        "head": ["test-large", "test-small"],
+        "delegate": ["test-small", "test-nano"]
+    },
+    "prices_per_1k_tokens": {"test-large": {"input": 1.0, "output": 2.0}},
+    "rate_limit_window_seconds": 0.3,
+    "rate_limit_threshold": 2
+}
+
+
+def test_model_router():
+    print("\n\n" + "="*10 + "PERFORMING MODEL ROUTER TEST" + "="*10)
+    router = Model_Router(CONFIG)
+    try:
+        assert router.model_for("head") == "test-large"
+        assert router.model_for("delegate") == "test-small"
+        assert router.model_for("unknown-role") == "test-large"
+
+        # One rate limit is not pressure yet; the threshold is
+        router.report_rate_limit("test-large")
+        assert router.model_for("head") == "test-large"
+        router.report_rate_limit("test-large")
+        assert router.model_for("head") == "test-small"
+
+        # Pressure is shared by every router in the process
+        assert Model_Router(CONFIG).model_for("head") == "test-small"
+
+        # With the whole chain under pressure, the last model is used anyway
+        router.report_rate_limit("test-small")
+        router.report_rate_limit("test-small")
+        assert router.model_for("head") == "test-small"
+        assert router.model_for("delegate") == "test-nano"
+
+        # Once the window has passed, the preferred model is back
+        time.sleep(0.4)
+        assert router.model_for("head") == "test-large"
+
+        router.record("head", "test-large", 2.0, prompt_tokens=1000, completion_tokens=500)
+        router.record("head", "test-large", 1.0)
+        print(router.summary())
+        assert "2 calls, avg 1.50s" in router.summary() and "$2.0000" in router.summary()
+    finally:
+        for model in ("test-large", "test-small", "test-nano"):
+            model_router._rate_limit_hits.pop(model, None)
+
+
+def test_model_router_config():
+    print("\n\n" + "="*10 + "PERFORMING MODEL ROUTER CONFIG TEST" + "="*10)
+    # A file that only overrides one route keeps the default for the others
+    path = os.path.join(tempfile.mkdtemp(), "model_routes.json")
+    with open(path, "w") as file:
+        json.dump({"routes": {"delegate": ["test-nano"]}, "rate_limit_threshold": 5}, file)
+    cached = model_router._config_cache
+    model_router._config_cache = None
+    try:
+        config = model_router.load_route_config(path)
+    finally:
+        model_router._config_cache = cached
+    assert config["routes"]["delegate"] == ["test-nano"]
+    assert config["routes"]["head"] == model_router.DEFAULT_CONFIG["routes"]["head"]
+    assert config["rate_limit_threshold"] == 5
+
+    # A config without a "head" route still falls back to the default head chain
+    router = Model_Router({"routes": {"delegate": ["test-nano"]}})
+    assert router.chain_for("unknown-role") == model_router.DEFAULT_CONFIG["routes"]["head"]
@@ -0,0 +1,47 @@
+from agent.observation_stage import Observation_Stage, Extractive_Summarizer
+
+
+FILLER = "The site navigation lists menus, cookie banners and newsletter signup forms. "
+
+
+def test_observation_stage():
+    print("\n\n" + "="*10 + "PERFORMING OBSERVATION STAGE TEST" + "="*10)
+    summarizer = Extractive_Summarizer()
+    text = (FILLER * 3 + "Apples were first domesticated in Central Asia. " + FILLER * 3 +
+            "Orchards of apples spread along the Silk Road. " + FILLER)
+    summary = summarizer(text, "Where were apples domesticated, and how did apples spread?", 120)
+    print(summary)
+    # The relevant sentences are kept, in their original order, inside the budget
+    assert summary.index("Central Asia") < summary.index("Silk Road")
+    assert "cookie banners" not in summary and len(summary) <= 120
+    assert " ... " in summary
+
+    # Unpunctuated runs are cut into sentences so one of them cannot blow the budget
+    assert all(len(s) <= Extractive_Summarizer.MAX_SENTENCE_CHARS for s in summarizer._sentences("x" * 1000))
+
+    stage = Observation_Stage(threshold=500, budget=200)
+    page = FILLER * 10 + "Apples were first domesticated in Central Asia."
+    assert stage.process("site-fetcher-tool", "short page", "apples") == "short page"
+    condensed = stage.process("site-fetcher-tool", page, "where were apples domesticated")
+    print(condensed)
+    assert condensed.startswith(f"[Summary of {len(page)} characters of output, stored as obs-1.")
+    assert "Central Asia" in condensed and len(condensed) < 400
+
+    # The essay and delegate reports reach the agent verbatim, however long they are
+    with open("./prompts/test_essay.txt", "r") as file:
+        essay = file.read()
+    assert len(essay) > stage.threshold
+    assert stage.process("essay-reader-tool", essay, "read the essay") == essay
+    assert stage.process("delegation-tool", page, "report") == page
+
+    # The original is paged back by the recall tool
+    recall = stage.recall_tool
+    first = recall.use("obs-1")
+    assert first.startswith("[obs-1 page 1/2]\n") and first.endswith(page[:500])
+    assert recall.use("\"obs-1\" 2") == "[obs-1 page 2/2]\n" + page[500:]
+    assert recall.use("obs-1 9").startswith("[obs-1 page 2/2]")
+    assert recall.use("obs-99") is False and recall.use("") is False
+    assert stage.process(recall.name, first, None) == first
+
+    print(stage.report())
+    assert stage.summarized == 1 and stage.chars_saved > 0
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+import time
+from web_api.result_cache import Result_Cache, cache_key
+
+
+def _wait_for(condition, seconds=3):
+    end = time.monotonic() + seconds
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+def _in_threads(count, target):
+    results = [None] * count
+    def call(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_result_cache():
+    print("\n\n" + "="*10 + "PERFORMING RESULT CACHE TEST" + "="*10)
+    query = {"text": "essay", "instructions": "fix it", "tools": ["b", "a"], "aiLevel": 3}
+    key = cache_key(query, "gpt-4o")
+    # Stable across tool order, the AI level's type and fields that do not affect the outcome
+    assert key == cache_key({"text": "essay", "instructions": "fix it", "tools": ["a", "b"], "aiLevel": "3",
+                             "noCache": True}, "gpt-4o")
+    assert key != cache_key(dict(query, text="essay!"), "gpt-4o")
+    assert key != cache_key(query, "gpt-4o-mini")
+
+    cache = Result_Cache(os.path.join(tempfile.mkdtemp(), "results.sqlite3"), ttl=0.3)
+    runs = []
+    shared = []
+    def run(token):
+        runs.append(1)
+        return {"revised_text": "fixed"}, True
+    assert cache.get_or_run(key, run, on_shared=shared.append) == {"revised_text": "fixed"}
+    assert cache.get_or_run(key, run, on_shared=shared.append) == {"revised_text": "fixed"}
+    assert len(runs) == 1 and shared == ["hit"]
+    # Invalid entries and noCache requests run again; entries expire after the TTL
+    assert cache.get_or_run(key, run, valid=lambda result: False) and len(runs) == 2
+    assert cache.get_or_run(key, run, use_cache=False) and len(runs) == 3
+    time.sleep(0.4)
+    assert cache.get(key) is None
+    cache.get_or_run(key, lambda token: ({"revised_text": "failed run"}, False))
+    assert cache.get(key) is None
+
+    # Identical requests that arrive during a run wait for it instead of starting their own
+    gate = threading.Event()
+    def slow_run(token):
+        runs.append(1)
+        gate.wait(5)
+        return {"revised_text": "slow"}, True
+    runs.clear()
+    shared.clear()
+    threads, results = _in_threads(4, lambda: cache.get_or_run("slow", slow_run, on_shared=shared.append))
+    assert _wait_for(lambda: len(shared) == 3)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(runs) == 1 and results == [{"revised_text": "slow"}] * 4
+    assert shared == ["coalesced"] * 3 and cache.coalesced == 3
+
+    # The leader's error reaches every follower, and nothing is cached
+    gate.clear()
+    def failing_run(token):
+        gate.wait(5)
+        raise RuntimeError("the agent crashed")
+    threads, results = _in_threads(3, lambda: cache.get_or_run("failing", failing_run))
+    assert _wait_for(lambda: cache.coalesced == 5)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    print(results)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("failing") is None
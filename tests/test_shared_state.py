@@ -0,0 +1,22 @@
+from util.shared_state import Shared_State
+from util.application import Application_Instance
+from agent.Agent import tool_specs
+
+
+def test_shared_state():
+    print("\n\n" + "="*10 + "PERFORMING SHARED STATE TEST" + "="*10)
+    # Building the shared state and a run's context (with every tool) must not read the keys file,
+    # which exits the process when keys are missing
+    shared = Shared_State(verbose=False)
+    app = Application_Instance(shared=shared)
+    assert shared._wallet is None and app.ctx._wallet is not None
+    assert len(app.tools) == len(shared.tool_classes)
+    assert "Search Google" in app.get_tool_aliases()
+
+    # The cached ReACT instructions are keyed on the tool set, whatever order the user picked it in
+    aliases = app.get_tool_aliases()[:3]
+    first = Application_Instance(shared=shared)
+    first.filter_down(aliases)
+    second = Application_Instance(shared=shared)
+    second.filter_down(list(reversed(aliases)))
+    assert tool_specs(first.tools) == tool_specs(second.tools)
@@ -0,0 +1,19 @@
+from util.text_sanitizer import to_ascii
+
+
+def test_text_sanitizer():
+    print("\n\n" + "="*10 + "PERFORMING TEXT SANITIZER TEST" + "="*10)
+    cases = {
+        "plain ascii stays the same": "plain ascii stays the same",
+        "“Quoted” ‘text’": "\"Quoted\" 'text'",
+        "1990–1995 — a decade": "1990-1995 -- a decade",
+        "Gabriel García Márquez": "Gabriel Garcia Marquez",
+        "Straße in Łódź": "Strasse in Lodz",
+        "ﬁnal draft…": "final draft...",
+        "日本 abc": " abc",
+    }
+    for text, expected in cases.items():
+        out = to_ascii(text)
+        print(f"\t{text!r} -> {out!r}")
+        assert out == expected
+        assert out.isascii()
@@ -0,0 +1,26 @@
+import json
+from datetime import datetime
+from util.works_cited import Works_Cited
+
+
+def test_works_cited():
+    print("\n\n" + "="*10 + "PERFORMING WORKS CITED TEST" + "="*10)
+    wc = Works_Cited()
+    wc.cite_source("website", "mla", {
+        "title": "All About Apples", "site_name": "Example", "author": "Jane Smith", "date": "2020-05-01",
+        "url": "https://example.com/apples", "content_type": "html", "access_date": datetime(2024, 3, 1)
+    })
+    wc.cite("website", "mla", "A citation made without a metadata record.")
+
+    mla = wc.render()
+    apa = wc.render("apa")
+    print(mla)
+    print(apa)
+    assert "Smith, Jane." in mla
+    assert "Jane Smith. (2020-05-01). All About Apples. Example." in apa
+    assert "A citation made without a metadata record." in apa
+
+    # The JSON export carries everything needed to re-render offline
+    restored = Works_Cited.from_records(json.loads(json.dumps(wc.to_records())))
+    assert restored.render("apa") == apa
+    assert restored.render("mla") == mla
@@ -2,13 +2,70 @@ from tests.test_search import test_search
 from tests.test_fetch import test_fetch
 from tests.test_cite import test_apa, test_mla
 from tests.test_api_functs import test_api_functs
+from tests.test_blackboard import test_blackboard
+from tests.test_delegate import test_delegate
+from tests.test_loop_guard import test_loop_guard
+from tests.test_model_router import test_model_router, test_model_router_config
+from tests.test_observation_stage import test_observation_stage
+from tests.test_jobs import test_jobs, test_shared_run_cancel, test_job_stream, test_job_stream_concurrent
+from tests.test_result_cache import test_result_cache
+from tests.test_job_queue import test_job_queue, test_worker_lease_loss, test_worker_event_flush
+from tests.test_shared_state import test_shared_state
+from tests.bench_startup import bench_startup
+from tests.test_artifact_store import test_artifact_store, test_artifact_responses
+from tests.test_log_writer import test_log_writer, test_log_writer_per_process
+from tests.test_json_stream import test_json_stream
+from tests.test_metrics import test_metrics
+from tests.test_text_sanitizer import test_text_sanitizer
+from tests.bench_sanitizer import bench_sanitizer
+from tests.test_citation_store import test_citation_store
+from tests.test_works_cited import test_works_cited
+from tests.test_head_metadata import test_head_metadata
+from tests.test_domain_health import test_domain_health, test_fetch_timeouts
+from tests.test_cancellation import test_cancellation, test_agent_cancellation
+from tests.test_download_guard import test_download_guard, test_browser_download_guard
+from tests.test_doc_processing import test_doc_processing
 
 TESTS_TO_DO = {
     "search" : False,
     "fetch" : False,
     "mla" : False,
     "apa" : False,
-    "api" : False
+    "api" : False,
+    "blackboard" : False,
+    "delegate" : False,
+    "loop_guard" : False,
+    "model_router" : False,
+    "model_router_config" : False,
+    "observation_stage" : False,
+    "jobs" : False,
+    "shared_run_cancel" : False,
+    "job_stream" : False,
+    "job_stream_concurrent" : False,
+    "result_cache" : False,
+    "job_queue" : False,
+    "worker_lease_loss" : False,
+    "worker_event_flush" : False,
+    "shared_state" : False,
+    "startup_bench" : False,
+    "artifact_store" : False,
+    "artifact_responses" : False,
+    "json_stream" : False,
+    "log_writer" : False,
+    "log_writer_per_process" : False,
+    "metrics" : False,
+    "text_sanitizer" : False,
+    "sanitizer_bench" : False,
+    "citation_store" : False,
+    "works_cited" : False,
+    "head_metadata" : False,
+    "domain_health" : False,
+    "fetch_timeouts" : False,
+    "cancellation" : False,
+    "agent_cancellation" : False,
+    "download_guard" : False,
+    "browser_download_guard" : False,
+    "doc_processing" : False
 }
 
 
@@ -23,4 +80,71 @@ def do_all_tests():
         test_apa()
     if TESTS_TO_DO["api"]:
         test_api_functs()
-
+    if TESTS_TO_DO["blackboard"]:
+        test_blackboard()
+    if TESTS_TO_DO["delegate"]:
+        test_delegate()
+    if TESTS_TO_DO["loop_guard"]:
+        test_loop_guard()
+    if TESTS_TO_DO["model_router"]:
+        test_model_router()
+    if TESTS_TO_DO["model_router_config"]:
+        test_model_router_config()
+    if TESTS_TO_DO["observation_stage"]:
+        test_observation_stage()
+    if TESTS_TO_DO["jobs"]:
+        test_jobs()
+    if TESTS_TO_DO["shared_run_cancel"]:
+        test_shared_run_cancel()
+    if TESTS_TO_DO["job_stream"]:
+        test_job_stream()
+    if TESTS_TO_DO["job_stream_concurrent"]:
+        test_job_stream_concurrent()
+    if TESTS_TO_DO["result_cache"]:
+        test_result_cache()
+    if TESTS_TO_DO["job_queue"]:
+        test_job_queue()
+    if TESTS_TO_DO["worker_lease_loss"]:
+        test_worker_lease_loss()
+    if TESTS_TO_DO["worker_event_flush"]:
+        test_worker_event_flush()
+    if TESTS_TO_DO["shared_state"]:
+        test_shared_state()
+    if TESTS_TO_DO["startup_bench"]:
+        bench_startup()
+    if TESTS_TO_DO["artifact_store"]:
+        test_artifact_store()
+    if TESTS_TO_DO["artifact_responses"]:
+        test_artifact_responses()
+    if TESTS_TO_DO["json_stream"]:
+        test_json_stream()
+    if TESTS_TO_DO["log_writer"]:
+        test_log_writer()
+    if TESTS_TO_DO["log_writer_per_process"]:
+        test_log_writer_per_process()
+    if TESTS_TO_DO["metrics"]:
+        test_metrics()
+    if TESTS_TO_DO["text_sanitizer"]:
+        test_text_sanitizer()
+    if TESTS_TO_DO["sanitizer_bench"]:
+        bench_sanitizer()
+    if TESTS_TO_DO["citation_store"]:
+        test_citation_store()
+    if TESTS_TO_DO["works_cited"]:
+        test_works_cited()
+    if TESTS_TO_DO["head_metadata"]:
+        test_head_metadata()
+    if TESTS_TO_DO["domain_health"]:
+        test_domain_health()
+    if TESTS_TO_DO["fetch_timeouts"]:
+        test_fetch_timeouts()
+    if TESTS_TO_DO["cancellation"]:
+        test_cancellation()
+    if TESTS_TO_DO["agent_cancellation"]:
+        test_agent_cancellation()
+    if TESTS_TO_DO["download_guard"]:
+        test_download_guard()
+    if TESTS_TO_DO["browser_download_guard"]:
+        test_browser_download_guard()
+    if TESTS_TO_DO["doc_processing"]:
+        test_doc_processing()
\ No newline at end of file
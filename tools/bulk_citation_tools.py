@@ -1,9 +1,10 @@
 from util.logs import Log
-from util.citations import get_citation_apa, get_citation_mla
+from util.citations import get_metadata
 from tools.tool import Tool
 from util.works_cited import Works_Cited
 from util.single_string_cleaner import clean_single_string
 from util.app_context import App_Context
+from util.cancellation import Cancelled_Error
 
 class Bulk_MLA_Citation_Tool(Tool):
     name = "bulk-mla-citation-tool"
@@ -24,10 +25,14 @@ class Bulk_MLA_Citation_Tool(Tool):
 
     def use(self, args: str):
         for url in self.ctx.all_visited_sites:
+            self.ctx.cancel_token.check()
             self.logger.log(f"[MLA CITATION TOOL] : Creating MLA citation for [{url}]")
             try:
-                citation = get_citation_mla(url)
-                self.works_cited.cite("website", "mla", citation)
+                meta = get_metadata(url, hint=self.ctx.search_metadata.get(url), time_left=self.ctx.time_left(),
+                                    cancel_token=self.ctx.cancel_token)
+                self.works_cited.cite_source("website", "mla", meta)
+            except Cancelled_Error:
+                raise
             except Exception as error:
                 self.logger.log(f"[MLA CITATION TOOL] : Citation failed! {str(error)}")
         return "All sources successfully cited!"
@@ -51,10 +56,14 @@ class Bulk_APA_Citation_Tool(Tool):
 
     def use(self, args: str):
         for url in self.ctx.all_visited_sites:
+            self.ctx.cancel_token.check()
             self.logger.log(f"[APA CITATION TOOL] : Creating APA citation for [{url}]")
             try:
-                citation = get_citation_apa(url)
-                self.works_cited.cite("website", "apa", citation)
+                meta = get_metadata(url, hint=self.ctx.search_metadata.get(url), time_left=self.ctx.time_left(),
+                                    cancel_token=self.ctx.cancel_token)
+                self.works_cited.cite_source("website", "apa", meta)
+            except Cancelled_Error:
+                raise
             except Exception as error:
                 self.logger.log(f"[APA CITATION TOOL] : Citation failed! {str(error)}")
         return "All sources successfully cited!"
\ No newline at end of file
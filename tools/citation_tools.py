@@ -5,10 +5,11 @@ Does individual citations, has been deprecated and replaced with bulk citation t
 
 # print("USING DEPRECATED CITATION TOOLS -- PLEASE USE BULK CITATION TOOLS INSTEAD")
 
-from util.citations import get_citation_apa, get_citation_mla
+from util.citations import get_metadata
 from tools.tool import Tool
 from util.single_string_cleaner import clean_single_string
 from util.app_context import App_Context
+from util.cancellation import Cancelled_Error
 
 class MLA_Citation_Tool(Tool):
     name = "mla-citation-tool"
@@ -28,9 +29,11 @@ class MLA_Citation_Tool(Tool):
         args = clean_single_string(args)
         self.logger.log(f"[MLA CITATION TOOL] : Creating MLA citation for [{args}]")
         try:
-            citation = get_citation_mla(args)
-            self.works_cited.cite("website", "mla", citation)
-            return citation
+            meta = get_metadata(args, hint=self.ctx.search_metadata.get(args), time_left=self.ctx.time_left(),
+                                cancel_token=self.ctx.cancel_token)
+            return self.works_cited.cite_source("website", "mla", meta)
+        except Cancelled_Error:
+            raise
         except Exception as error:
             self.logger.log(f"[MLA CITATION TOOL] : Citation failed! {str(error)}")
             return False
@@ -53,9 +56,11 @@ class APA_Citation_Tool(Tool):
         args = clean_single_string(args)
         self.logger.log(f"[APA CITATION TOOL] : Creating APA citation for [{args}]")
         try:
-            citation = get_citation_apa(args)
-            self.works_cited.cite("website", "apa", citation)
-            return citation
+            meta = get_metadata(args, hint=self.ctx.search_metadata.get(args), time_left=self.ctx.time_left(),
+                                cancel_token=self.ctx.cancel_token)
+            return self.works_cited.cite_source("website", "apa", meta)
+        except Cancelled_Error:
+            raise
         except Exception as error:
             self.logger.log(f"[APA CITATION TOOL] : Citation failed! {str(error)}")
             return False
\ No newline at end of file
@@ -2,6 +2,9 @@ from tools.tool import Tool
 from util.app_context import App_Context
 from util.prompt_loader import Prompt
 from agent.Agent import Agent
+from util.cancellation import Cancelled_Error
+from concurrent.futures import ThreadPoolExecutor
+import json
 
 
 class _Take_Delegate_Note_Tool(Tool):
@@ -19,9 +22,30 @@ class _Take_Delegate_Note_Tool(Tool):
         self.ctx = ctx
 
     def use(self, args: str):
+        self.notes.append(args)
+        if not self.ctx.blackboard.add_note(args):
+            self.ctx.log.log("[DELEGATE NOTE RECORDER TOOL] : Duplicate note, already on the blackboard.")
+            return "This note is already on the research blackboard. No need to record it again."
         self.ctx.log.log("[DELEGATE NOTE RECORDER TOOL] : Note successfully recorded.")
         return "Success! Your note will be passed on to the head AI when you are done."
 
+class _Blackboard_Query_Tool(Tool):
+    name = "research-blackboard-tool"
+    description = """
+    Accepts a single argument, a keyword or phrase. Searches the shared research blackboard, which 
+    holds every search, fetched page and note made by any assistant during this session, and returns 
+    the matching entries. Pass "None" to get an overview of the whole blackboard. Check here before 
+    searching or fetching, since repeating work that is already on the blackboard wastes time.
+    """
+    alias = "Research Blackboard"
+
+    def __init__(self, ctx : App_Context):
+        self.ctx = ctx
+
+    def use(self, args: str):
+        self.ctx.log.log(f"[RESEARCH BLACKBOARD TOOL] : Searching blackboard for [{args}]")
+        return self.ctx.blackboard.search(args)
+
 class Delegate_Tool(Tool):
     name = "delegation-tool"
     description = """
@@ -45,35 +69,92 @@ class Delegate_Tool(Tool):
     asking your delegate to check the grammar of the essay, or asking your delegate to make revisions 
     for a specific type of mistake.
     
-    Note that your assistant will not remember anything between uses of this tool. Its context 
-    window is completely reset at the beginning of each call.
+    If you have several independent topics to research, you may delegate them all in one call by 
+    passing a JSON list of task descriptions, e.g. ["research topic A ...", "research topic B ..."].
+    Each task is given to its own assistant and they work at the same time, so this is much faster 
+    than delegating them one after another. The reports are returned together, in the same order as 
+    the tasks. Only group tasks that do not depend on each other's results.
+    
+    Note that your assistant will not remember its own reasoning between uses of this tool. Its 
+    context window is reset at the beginning of each call, but it is shown a summary of the searches, 
+    pages and notes that earlier assistants recorded on a shared research blackboard.
     """
     alias = "Delegate"
 
     def __init__(self, cont: App_Context):
         self.ctx = cont
 
-    def use(self, args: str):
-        self.ctx.log.log("[DELEGATION TOOL] : Executing task.")
+    def _split_tasks(self, args: str):
+        """
+        A JSON list of strings fans out into several independent tasks. Anything else is a single task.
+        """
+        stripped = args.strip()
+        if stripped.startswith("["):
+            try:
+                tasks = json.loads(stripped)
+            except ValueError:
+                return [args]
+            if isinstance(tasks, list):
+                tasks = [str(task).strip() for task in tasks if str(task).strip()]
+                if tasks:
+                    return tasks
+        return [args]
+
+    def _run_delegate(self, task: str, label: str):
+        self.ctx.log.log(f"[DELEGATION TOOL] : Executing task{label}.")
+        self.ctx.blackboard.set_author(f"delegate{label}")
         notepad = _Take_Delegate_Note_Tool(self.ctx)
         
-        new_tools = [notepad]
+        new_tools = [notepad, _Blackboard_Query_Tool(self.ctx)]
         for tool in self.ctx.toolbox:
             if tool != self:
                 new_tools.append(tool)
                 
-        agent = Agent(Prompt("delegate_prompt"), new_tools,
-                   self.ctx.model_name, self.ctx.wallet.get("OPENAI"), self.ctx.log)
+        agent = Agent(Prompt("delegate_prompt").txt, new_tools,
+                   self.ctx.router.model_for("delegate"), self.ctx.wallet.get("OPENAI"), self.ctx.log,
+                   router=self.ctx.router, role="delegate",
+                   observation_stage=self.ctx.observation_stage,
+                   cancel_token=self.ctx.cancel_token,
+                   time_left=self.ctx.time_left)
+        
         
+        # Give the delegate what the other assistants have already found this session
+        digest = self.ctx.blackboard.digest()
+        if digest:
+            task += "\n\nThe research blackboard already contains the following. Do not repeat this work:\n" + digest
         
         try:
-            out = agent.prompt(args, self.ctx.max_iter)
-        except:
+            out = agent.prompt(task, self.ctx.max_iter)
+        except Cancelled_Error:
+            self.ctx.blackboard.set_author("head")
+            raise
+        except Exception:
             out = "Delegate was unable to fully finish because it hit the max number of iterations without a final solution."
         
         out += "\n"
         for note in notepad.notes:
             out += f"\t[NOTE] : {note}"
         
-        self.ctx.log.log("[DELEGATION TOOL] : Task complete.")
+        self.ctx.blackboard.set_author("head")
+        self.ctx.log.log(f"[DELEGATION TOOL] : Task{label} complete.")
+        return out
+
+    def use(self, args: str):
+        self.ctx.cancel_token.check()
+        tasks = self._split_tasks(args)
+        if len(tasks) == 1:
+            return self._run_delegate(tasks[0], "")
+        
+        # Fan-out: independent tasks run as concurrent delegates. The OpenAI client is pooled in
+        # the Agent module, so all delegates share one connection pool.
+        workers = max(1, min(len(tasks), self.ctx.max_parallel_delegates))
+        self.ctx.log.log(f"[DELEGATION TOOL] : Fanning out {len(tasks)} tasks across {workers} delegates.")
+        labels = [f" {i + 1}/{len(tasks)}" for i in range(len(tasks))]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            reports = list(pool.map(self._run_delegate, tasks, labels))
+        
+        # Merge reports in the same order the tasks were given
+        out = ""
+        for i, (task, report) in enumerate(zip(tasks, reports)):
+            out += f"=== REPORT {i + 1}/{len(tasks)} : {task} ===\n{report}\n"
         return out
\ No newline at end of file
@@ -3,12 +3,13 @@ from util.logs import Log
 from keys.wallet import Key_Wallet
 import re
 from urllib.parse import unquote, urlparse, parse_qs
-import requests
 from typing import List, Dict
-import json
 from util.single_string_cleaner import clean_single_string
 from util.app_context import App_Context
-from util.ascii_filter import filter_non_ascii
+from util.text_sanitizer import to_ascii
+from util.json_stream import iter_json
+from util.head_metadata import metadata_from_tags
+from util.domain_health import Domain_Health, domain_of, UNHEALTHY_SCORE
 
 class GoogleSearchTool(Tool):
     name = "google-search-tool"
@@ -25,12 +26,18 @@ class GoogleSearchTool(Tool):
         self.ctx = ctx
         self.found_links: List[Dict] = []
         self.logger = ctx.log
+        
+    # Read from the wallet when a search is made, so building the tool does not load the keys
+    @property
+    def gs_api_key(self):
         # API key (required by keys.wallet)
-        self.gs_api_key = ctx.wallet.get("GOOGLE_SEARCH")
+        return self.ctx.wallet.get("GOOGLE_SEARCH")
 
+    @property
+    def gs_cx(self):
         # Try to find a CX (search engine id) in the wallet first, otherwise from environment
-        self.gs_cx = ctx.wallet.get("GOOGLE_CX")
-        
+        return self.ctx.wallet.get("GOOGLE_CX")
+
         
     def _sanitize_url(self, url: str) -> str:
         # Remove common tracking params and unquote
@@ -56,6 +63,14 @@ class GoogleSearchTool(Tool):
             "displayLink": item.get("displayLink"),
         }
 
+    def _citation_metadata(self, item: Dict) -> Dict:
+        # The page's own <meta> tags, as Google indexed them
+        metatags = (item.get("pagemap") or {}).get("metatags") or [{}]
+        tags = {key.lower(): [value] for key, value in metatags[0].items() if isinstance(value, str) and value}
+        meta = metadata_from_tags(tags)
+        meta["content_type"] = "pdf" if item.get("mime") == "application/pdf" else "html"
+        return meta
+
     def use(self, args: str, num: int = 15, start: int = 1, safe: str = "off") -> List[Dict]:
         args = clean_single_string(args)
 
@@ -72,6 +87,11 @@ class GoogleSearchTool(Tool):
         """
         self.logger.log(f"[GOOGLE SEARCH TOOL] : searching for \"{args}\" (num={num}, start={start})")
 
+        cached = self.ctx.blackboard.lookup_query(args)
+        if cached is not None:
+            self.logger.log("[GOOGLE SEARCH TOOL] : Query already on the research blackboard, reusing results.")
+            return cached
+
         if not self.gs_api_key:
             self.logger.log("[GOOGLE SEARCH TOOL] : ERROR - missing GOOGLE_SEARCH API key")
             return False
@@ -90,6 +110,7 @@ class GoogleSearchTool(Tool):
             "safe": safe,
         }
 
+        import requests
         try:
             resp = requests.get(endpoint, params=params, timeout=10)
         except requests.RequestException as e:
@@ -111,6 +132,13 @@ class GoogleSearchTool(Tool):
         for it in items:
             formatted = self._format_item(it)
             results.append(formatted)
+            self.ctx.search_metadata[formatted["link"]] = self._citation_metadata(it)
+
+        # Results from sites we keep failing to fetch go last (the sort is stable), so they are
+        # neither the agent's first pick nor among the sources cited automatically
+        health = Domain_Health.get()
+        scores = {domain: health.score(domain) for domain in {domain_of(r["link"]) for r in results}}
+        results.sort(key=lambda r: scores[domain_of(r["link"])] < UNHEALTHY_SCORE)
 
         self.found_links = results
         
@@ -121,7 +149,10 @@ class GoogleSearchTool(Tool):
                 self.ctx.all_visited_sites.append(link["link"])
             index += 1
         
-        return filter_non_ascii(json.dumps(results))
+        # Transliterate titles and snippets rather than leaving \u escapes for the LLM to read
+        out = "".join(iter_json(results, sanitize=to_ascii))
+        self.ctx.blackboard.record_query(args, out)
+        return out
 
     
 
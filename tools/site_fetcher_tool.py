@@ -1,53 +1,30 @@
 from tools.tool import Tool
 from util.logs import Log
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from bs4 import BeautifulSoup
 from util.single_string_cleaner import clean_single_string
-from util.ascii_filter import filter_non_ascii
+from util.text_sanitizer import to_ascii
 from util.app_context import App_Context
-from playwright.sync_api import sync_playwright
-import io
-import pypdf
+from util.metrics import FETCH_TIER, PLAYWRIGHT_BROWSERS
+from util.domain_health import Domain_Health, fetch_timeout, looks_like_captcha
+from util.cancellation import Cancelled_Error
+from util.doc_processing import Doc_Processor, Doc_Processing_Error
+from util.download_guard import Download_Rejected, classify, read_body, check_file, temp_copy, \
+    TEXT_EXTENSIONS, MAX_TEXT_BYTES, MAX_PDF_BYTES
+import os
+import shutil
+import tempfile
 import time
 
-MAX_CHARS = 50000
-
-
-def extract_plaintext_from_html(html_content):
-    """
-    Extracts all visible plaintext from an HTML document.
-    """
-    if not html_content:
-        return ""
-    soup = BeautifulSoup(html_content, 'html.parser')
+# requests and playwright are heavy, so they are imported where they are used.
+# Parsing (bs4, pypdf) happens in util/doc_processing.py.
 
-    # Remove script and style elements
-    for script_or_style in soup(['script', 'style']):
-        script_or_style.decompose()
-
-    # Get all text and strip leading/trailing whitespace
-    plaintext = soup.get_text(separator=' ', strip=True)
-    return plaintext
-
-
-def extract_text_from_pdf(pdf_bytes):
-    """
-    Extracts text from PDF binary data.
-    """
-    try:
-        text = ""
-        # Create a file-like object from the bytes
-        with io.BytesIO(pdf_bytes) as f:
-            reader = pypdf.PdfReader(f)
-            for page in reader.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + " "
-        return text
-    except Exception as e:
-        return f"Error extracting PDF text: {e}"
+MAX_CHARS = 50000
+# Upper bounds; a domain that usually answers quickly gets less (see Domain_Health.timeout_for)
+PLAYWRIGHT_TIMEOUT_SECONDS = 30
+REQUESTS_TIMEOUT_SECONDS = 10
+NETWORKIDLE_SECONDS = 5
+DOWNLOAD_START_SECONDS = 2.5
+# Browser waits are split into slices this long, so a cancelled run stops waiting within one
+CANCEL_SLICE_SECONDS = 0.5
 
 
 class SiteFetcherTool(Tool):
@@ -91,34 +68,102 @@ class SiteFetcherTool(Tool):
 
     def _extract_content(self, raw_content, is_pdf):
         """
-        Helper to route raw content to the correct extractor (HTML vs PDF).
+        Helper to route raw content to the correct extractor (HTML vs PDF), which runs in the
+        document processing pool. PDFs may come as an open (temporary) file, which is closed once read.
         """
         if not raw_content:
             return ""
 
-        if is_pdf:
-            # Ensure bytes
-            if isinstance(raw_content, str):
-                raw_content = raw_content.encode('utf-8')
-            return extract_text_from_pdf(raw_content)
-        else:
-            # Ensure string
-            if isinstance(raw_content, bytes):
-                raw_content = raw_content.decode('utf-8', errors='ignore')
-            return extract_plaintext_from_html(raw_content)
+        processor = Doc_Processor.get()
+        try:
+            if is_pdf:
+                # Ensure bytes or a file
+                if isinstance(raw_content, str):
+                    raw_content = raw_content.encode('utf-8')
+                return processor.pdf_to_text(raw_content, self.ctx.cancel_token)
+            else:
+                return processor.html_to_text(raw_content, self.ctx.cancel_token)
+        except Doc_Processing_Error as e:
+            self.logger.log(f"[SITE FETCHER TOOL] : Could not extract text: {e}")
+            return ""
+        finally:
+            if hasattr(raw_content, "close"):
+                raw_content.close()
+
+    def _wait_sliced(self, wait, timeout_ms):
+        """
+        Calls wait(timeout=...) (a Playwright wait) in short slices until it returns or `timeout_ms`
+        is used up, checking the run's cancel token between slices.
+        """
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            self.ctx.cancel_token.check()
+            slice_ms = max(1, int(1000 * min(CANCEL_SLICE_SECONDS, deadline - time.monotonic())))
+            try:
+                return wait(timeout=slice_ms)
+            except Exception as e:
+                if "Timeout" not in str(e) or time.monotonic() >= deadline:
+                    raise
+
+    def _await_download(self, page, download, directory, cap, timeout_ms):
+        """
+        Waits for a browser download saved to `directory`, in short slices, checking the run's cancel
+        token and the size of the partial file between them. Returns the finished file's path. If the
+        download grows past `cap` bytes or is not done within `timeout_ms`, it is cancelled and
+        Download_Rejected ("too_large" or "timeout") is raised.
+        """
+        deadline = time.monotonic() + timeout_ms / 1000
+        try:
+            while True:
+                self.ctx.cancel_token.check()
+                size = 0
+                finished = False
+                for name in os.listdir(directory):
+                    try:
+                        size += os.path.getsize(os.path.join(directory, name))
+                    except OSError:
+                        continue
+                    # Chromium writes to a .crdownload file and renames it once the download is complete
+                    finished = finished or not name.endswith(".crdownload")
+                if size > cap:
+                    raise Download_Rejected("too_large", f"{download.suggested_filename} is over the download limit")
+                if finished:
+                    return download.path()
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise Download_Rejected("timeout", f"{download.suggested_filename} did not finish downloading in time")
+                # Lets the browser make progress while this thread waits
+                page.wait_for_timeout(max(1, int(1000 * min(CANCEL_SLICE_SECONDS, left))))
+        except (Download_Rejected, Cancelled_Error):
+            try: download.cancel()
+            except Exception: pass
+            raise
 
-    def _fetch_with_playwright(self, url):
+    def _fetch_with_playwright(self, url, timeout):
         """
         Primary method: Fetch site content using a headless browser.
         Handles direct HTML rendering AND forced file downloads (PDFs).
-        Returns (content, is_pdf_boolean).
+        `timeout` (seconds) bounds the navigation; the waits after it only use what is left of it.
+        Returns (content, is_pdf_boolean, failure_kind or None, navigation seconds or None).
+        Downloads are watched as they arrive and cancelled past the size cap or the timeout.
+        Known limit: Playwright only hands over a response body whole, so a page served without a
+        Content-Length is read completely before its size can be checked against the cap.
         """
+        # Starts once the browser is up, so launching it does not count against the site
+        started = None
+        def ms_left(cap):
+            return max(1, int(1000 * min(cap, timeout - (time.monotonic() - started))))
+
         self.logger.log(f"[SITE FETCHER TOOL] : Attempting primary fetch with Playwright for {url}...")
+        # Downloads go to a directory of our own, so their size can be watched while they arrive
+        downloads_dir = tempfile.mkdtemp(prefix="downloads-")
         
         try:
-            with sync_playwright() as p:
+            from playwright.sync_api import sync_playwright
+            with PLAYWRIGHT_BROWSERS.track(), sync_playwright() as p:
                 browser = p.chromium.launch(
                     headless=self.HEADLESS_MODE,
+                    downloads_path=downloads_dir,
                     args=[
                         "--disable-blink-features=AutomationControlled",
                         "--no-sandbox",
@@ -136,56 +181,95 @@ class SiteFetcherTool(Tool):
 
                 page = context.new_page()
                 page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+                started = time.monotonic()
 
                 # 1. Setup Download Listener
                 downloads = []
                 page.on("download", lambda d: downloads.append(d))
 
                 response = None
+                failure = None
+                latency = None
                 try:
-                    response = page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                    # Returns once the response starts arriving; the page load is awaited in slices
+                    response = page.goto(url, wait_until="commit", timeout=ms_left(timeout))
+                    self._wait_sliced(lambda timeout: page.wait_for_load_state("domcontentloaded", timeout=timeout),
+                                      ms_left(timeout))
+                    latency = time.monotonic() - started
+                except Cancelled_Error:
+                    raise
                 except Exception as e:
                     if "Download is starting" in str(e):
                         self.logger.log(f"[SITE FETCHER TOOL] : Download triggered during navigation.")
-                        # Wait briefly for the download object to populate
-                        for _ in range(5):
-                            if downloads: break
-                            time.sleep(0.5)
+                        # The download event may not have been dispatched yet
+                        if not downloads:
+                            try: downloads.append(self._wait_sliced(lambda timeout: page.wait_for_event("download", timeout=timeout),
+                                                                    ms_left(DOWNLOAD_START_SECONDS)))
+                            except Cancelled_Error: raise
+                            except Exception: pass
                     else:
                         self.logger.log(f"[SITE FETCHER TOOL] : Playwright navigation warning: {e}")
+                        if "Timeout" in str(e):
+                            failure = "timeout"
 
                 final_content = None
                 is_pdf = False
+                if response is not None and response.status >= 400:
+                    failure = "http_403" if response.status == 403 else "http_error"
 
                 # 2. Check if a download was captured
                 if downloads:
                     try:
                         download = downloads[0]
-                        path = download.path()
                         suggested_filename = download.suggested_filename
-                        
-                        with open(path, 'rb') as f:
-                            final_content = f.read()
-                        
-                        if self._is_pdf_content(final_content, filename=suggested_filename):
+                        extension = os.path.splitext(suggested_filename)[1].lower()
+                        if extension and extension != ".pdf" and extension not in TEXT_EXTENSIONS:
+                            # Archives, videos, datasets: stop before the browser fetches the rest
+                            download.cancel()
+                            raise Download_Rejected("unsupported_type", f"Unsupported download {suggested_filename}")
+                        # Only PDFs are accepted without a text extension (see check_file)
+                        cap = MAX_TEXT_BYTES if extension in TEXT_EXTENSIONS else MAX_PDF_BYTES
+                        path = self._await_download(page, download, downloads_dir, cap, ms_left(timeout))
+                        kind = check_file(path, suggested_filename)
+                        if kind == "pdf":
+                            # The browser deletes its downloads on close, so read from a copy
+                            final_content = temp_copy(path)
                             is_pdf = True
+                        else:
+                            with open(path, 'rb') as f:
+                                final_content = f.read()
                         
+                    except Cancelled_Error:
+                        raise
+                    except Download_Rejected as e:
+                        self.logger.log(f"[SITE FETCHER TOOL] : Skipping download: {e}")
+                        failure = e.kind
                     except Exception as e:
                          self.logger.log(f"[SITE FETCHER TOOL] : Error reading downloaded file: {e}")
 
                 # 3. If no download, process the standard response
                 elif response:
                     try:
-                        body_bytes = response.body()
                         headers = response.all_headers()
+                        kind = classify(headers.get("content-type", ""), response.url, headers.get("content-length"))
+                        body_bytes = response.body()
+                        if len(body_bytes) > (MAX_PDF_BYTES if kind == "pdf" else MAX_TEXT_BYTES):
+                            raise Download_Rejected("too_large", f"{len(body_bytes)} bytes is over the download limit")
 
                         if self._is_pdf_content(body_bytes, headers):
                             is_pdf = True
                             final_content = body_bytes
                         else:
-                            try: page.wait_for_load_state("networkidle", timeout=5000)
-                            except: pass 
+                            try: self._wait_sliced(lambda timeout: page.wait_for_load_state("networkidle", timeout=timeout),
+                                                   ms_left(NETWORKIDLE_SECONDS))
+                            except Cancelled_Error: raise
+                            except Exception: pass
                             final_content = page.content()
+                    except Cancelled_Error:
+                        raise
+                    except Download_Rejected as e:
+                        self.logger.log(f"[SITE FETCHER TOOL] : Skipping response: {e}")
+                        failure = e.kind
                     except Exception as e:
                          self.logger.log(f"[SITE FETCHER TOOL] : Error reading Playwright response body: {e}")
                 
@@ -195,18 +279,29 @@ class SiteFetcherTool(Tool):
                      except: pass
 
                 browser.close()
-                return final_content, is_pdf
+                return final_content, is_pdf, failure, latency
 
+        except Cancelled_Error:
+            # Leaving the with-block above has already closed the browser
+            raise
         except Exception as e:
             self.logger.log(f"[SITE FETCHER TOOL] : Playwright error: {e}")
-            return None, False
+            return None, False, "timeout" if "Timeout" in str(e) else "error", None
+        finally:
+            # PDFs were copied out (temp_copy) before the browser closed
+            shutil.rmtree(downloads_dir, ignore_errors=True)
 
-    def _fetch_with_requests(self, url):
+    def _fetch_with_requests(self, url, timeout):
         """
-        Fallback method: Fetch site content using standard requests library.
-        Returns (content, is_pdf_boolean).
+        Fallback method: Fetch site content using standard requests library, waiting at most
+        `timeout` seconds for the server. The body is streamed through the download guard, so
+        unsupported or oversized payloads are dropped early and PDFs arrive as a temporary file.
+        Returns (content, is_pdf_boolean, failure_kind or None, seconds until the response or None).
         """
         self.logger.log(f"[SITE FETCHER TOOL] : Attempting fallback fetch with Requests for {url}...")
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
         
         session = requests.Session()
         headers = {
@@ -219,31 +314,82 @@ class SiteFetcherTool(Tool):
         session.mount("https://", adapter)
         session.mount("http://", adapter)
 
+        token = self.ctx.cancel_token
         try:
-            resp = session.get(url, timeout=10, allow_redirects=True)
-            if resp.status_code != 200:
-                self.logger.log(f"[SITE FETCHER TOOL] : Requests returned status {resp.status_code}.")
-                return None, False
-            
-            is_pdf = self._is_pdf_content(resp.content, resp.headers, filename=url)
+            started = time.monotonic()
+            # With stream=True this returns once the headers are in; the body is read below
+            resp = session.get(url, timeout=timeout, allow_redirects=True, stream=True)
+            latency = time.monotonic() - started
+            # Closing the response from the cancelling thread aborts a read in progress
+            unregister = token.on_cancel(resp.close)
+            try:
+                if resp.status_code != 200:
+                    self.logger.log(f"[SITE FETCHER TOOL] : Requests returned status {resp.status_code}.")
+                    return None, False, "http_403" if resp.status_code == 403 else "http_error", None
+                kind = classify(resp.headers.get("Content-Type", ""), resp.url, resp.headers.get("Content-Length"))
+                body, kind = read_body(resp, kind, token)
+            finally:
+                unregister()
+                resp.close()
             
-            if is_pdf:
-                return resp.content, True
+            if kind == "pdf":
+                return body, True, None, latency
             else:
-                return resp.text, False
+                # Same decoding as resp.text, minus the guessing when no charset is given
+                return body.decode(resp.encoding or "utf-8", errors="replace"), False, None, latency
 
+        except Download_Rejected as e:
+            self.logger.log(f"[SITE FETCHER TOOL] : Skipping response: {e}")
+            return None, False, e.kind, None
+        except requests.Timeout as e:
+            token.check()
+            self.logger.log(f"[SITE FETCHER TOOL] : Requests fetch timed out: {e}")
+            return None, False, "timeout", None
         except requests.RequestException as e:
+            token.check()
             self.logger.log(f"[SITE FETCHER TOOL] : Requests fetch failed: {e}")
-            return None, False
+            return None, False, "error", None
+        except Cancelled_Error:
+            raise
+        except Exception:
+            # A read interrupted by closing the response fails in whatever way urllib3 notices it
+            token.check()
+            raise
 
     def use(self, args: str):
         url = clean_single_string(args)
+        self.ctx.cancel_token.check()
+        
+        found, cached = self.ctx.blackboard.lookup_fetch(url)
+        if found:
+            self.logger.log(f"[SITE FETCHER TOOL] : {url} already on the research blackboard, reusing result.")
+            FETCH_TIER.inc(tier="blackboard")
+            return cached
+        
+        # Known-bad urls fail fast instead of waiting out the same timeouts again
+        health = Domain_Health.get()
+        recent_failure = health.bad_url(url)
+        if recent_failure:
+            self.logger.log(f"[SITE FETCHER TOOL] : {url} failed recently ({recent_failure}), not retrying yet.")
+            FETCH_TIER.inc(tier="negative_cache")
+            self.ctx.blackboard.record_fetch(url, False)
+            return False
+        
+        timeout = fetch_timeout(url, "playwright", PLAYWRIGHT_TIMEOUT_SECONDS, self.ctx.time_left())
+        if timeout <= 0:
+            self.logger.log(f"[SITE FETCHER TOOL] : Run deadline reached, not fetching {url}.")
+            FETCH_TIER.inc(tier="deadline")
+            return False
         
         # --- Attempt 1: Playwright (Default) ---
-        raw_content, is_pdf = self._fetch_with_playwright(url)
+        raw_content, is_pdf, failure, latency = self._fetch_with_playwright(url, timeout)
         
         # Extract immediately to check quality
         out = self._extract_content(raw_content, is_pdf)
+        tier = "playwright"
+        if out and looks_like_captcha(out):
+            failure = "captcha"
+            out = ""
 
         # --- Attempt 2: Requests (Fallback) ---
         # Trigger if:
@@ -254,15 +400,34 @@ class SiteFetcherTool(Tool):
             reason = "Fetch failed" if not raw_content else "Returned empty/whitespace text"
             self.logger.log(f"[SITE FETCHER TOOL] : Playwright {reason}. Switching to Requests fallback...")
             
-            raw_content, is_pdf = self._fetch_with_requests(url)
+            timeout = fetch_timeout(url, "requests", REQUESTS_TIMEOUT_SECONDS, self.ctx.time_left())
+            if timeout <= 0:
+                self.logger.log(f"[SITE FETCHER TOOL] : Run deadline reached, skipping the Requests fallback.")
+                return False
+            self.ctx.cancel_token.check()
+            raw_content, is_pdf, fallback_failure, latency = self._fetch_with_requests(url, timeout)
             out = self._extract_content(raw_content, is_pdf)
+            tier = "requests"
+            if out and looks_like_captcha(out):
+                fallback_failure = "captcha"
+                out = ""
+            # The first tier's reason is more telling when the fallback only came back empty
+            failure = fallback_failure or failure
 
         if not out or not out.strip():
+            FETCH_TIER.inc(tier="failed")
+            health.record_failure(url, failure or "empty")
+            self.ctx.blackboard.record_fetch(url, False)
             return False
+        FETCH_TIER.inc(tier=tier)
+        health.record_success(url)
+        if latency is not None:
+            health.record_latency(url, tier, latency)
 
-        out = filter_non_ascii(out)
+        out = to_ascii(out)
         if len(out) > MAX_CHARS:
             out = out[:MAX_CHARS]
         
         self.ctx.all_visited_sites.append(url) 
+        self.ctx.blackboard.record_fetch(url, out)
         return out
\ No newline at end of file
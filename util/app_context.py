@@ -1,16 +1,53 @@
+import time
 from util.logs import Log
 from util.works_cited import Works_Cited
 from keys.wallet import Key_Wallet
+from util.blackboard import Research_Blackboard
+from util.model_router import Model_Router
+from agent.observation_stage import Observation_Stage
+from util.cancellation import Cancel_Token
 
 
 class App_Context:
-    def __init__(self, essay : str, verbose=True):
+    def __init__(self, essay : str, verbose=True, wallet=None):
         self.log = Log(verbose)
         self.wc = Works_Cited()
         self.essay = essay
-        self.wallet = Key_Wallet(self.log)
+        # A Key_Wallet, or a function returning one (runs built from Shared_State reuse its wallet
+        # instead of re-reading the keys file). Either way the keys are only read on first use.
+        self._wallet = wallet
         self.all_visited_sites = []
+        # url -> citation fields Google returned for it, so search results can be cited without a fetch
+        self.search_metadata = {}
         self.toolbox = []
         self.max_iter = 10
+        self.max_parallel_delegates = 3
         self.model_name = ""
-        self.notes = []
\ No newline at end of file
+        self.notes = []
+        self.blackboard = Research_Blackboard()
+        self.router = Model_Router()
+        self.observation_stage = Observation_Stage()
+        self.deadline = None
+        self.cancel_token = Cancel_Token()
+    
+    @property
+    def wallet(self) -> Key_Wallet:
+        if self._wallet is None:
+            self._wallet = Key_Wallet(self.log)
+        elif callable(self._wallet):
+            self._wallet = self._wallet()
+        return self._wallet
+    
+    def set_deadline(self, seconds : float):
+        """
+        The run should be done `seconds` from now; fetches shorten their timeouts to fit.
+        """
+        self.deadline = time.monotonic() + seconds
+    
+    def time_left(self):
+        """
+        Seconds until the run's deadline, or None if it has none.
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
\ No newline at end of file
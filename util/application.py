@@ -2,20 +2,29 @@ from util.logs import Log
 from agent.Agent import Agent
 from util.prompt_loader import Prompt
 from util.app_context import App_Context
+from util.shared_state import Shared_State
 from tools.tool_registry import *
 import json
-from util.ascii_filter import filter_non_ascii
+import queue
+import threading
+from util.text_sanitizer import to_ascii
+from util.cancellation import Cancelled_Error
+
+# Fetches shorten their timeouts so a run finishes within this, however slow the sites it visits
+RUN_DEADLINE_SECONDS = 15 * 60
+# Past the deadline, this long is left for the agent to write its answer before the run is cancelled
+RUN_CANCEL_GRACE_SECONDS = 2 * 60
 
 class Application_Instance:
     
-    def __init__(self, noisy=False):
-        self.ctx = App_Context("No essay supplied.", noisy)
+    def __init__(self, noisy=False, shared : Shared_State = None):
+        shared = shared if shared is not None else Shared_State.get()
+        self.ctx = App_Context("No essay supplied.", noisy, wallet=lambda: shared.wallet)
         self.tools = []
-        for tool in ALL_TOOLS:
+        for tool in shared.tool_classes:
             self.tools.append(tool(self.ctx))
-        self.system_prompt = Prompt("system_prompt").txt
-        # self.target_model = "gpt-4.1-mini"
-        self.target_model = "gpt-4o"
+        self.system_prompt = shared.system_prompt
+        self.target_model = self.ctx.router.model_for("head")
         
     def get_tool_aliases(self):
         registry = []
@@ -34,33 +43,98 @@ class Application_Instance:
         self.ctx.log.save()
         return self.ctx.log.as_string
     
-    def dump_works_cited(self):
-        return self.ctx.wc.purge()
+    def dump_works_cited(self, format=None):
+        return self.ctx.wc.render(format)
     
     def dump_works_cited_json(self):
-        return json.dumps(self.ctx.wc.works, indent=2)
+        return json.dumps(self.ctx.wc.to_records(), indent=2)
     
     def run_agentic(self, additional_prompting : str, essay : str, max_iter : int = 10):
-        self.ctx.essay = filter_non_ascii(essay)
+        self.ctx.essay = to_ascii(essay)
         self.ctx.toolbox = self.tools
         self.ctx.max_iter = max_iter
+        self.ctx.set_deadline(RUN_DEADLINE_SECONDS)
+        self.ctx.cancel_token.set_deadline(RUN_DEADLINE_SECONDS + RUN_CANCEL_GRACE_SECONDS)
+        try:
+            return self._run_agentic(additional_prompting, max_iter)
+        finally:
+            # Stops the deadline timer, which would otherwise sit idle until long after the run ended
+            self.ctx.cancel_token.clear_deadline()
+    
+    def _run_agentic(self, additional_prompting : str, max_iter : int):
+        # Picked now rather than at construction, since pooled instances may have waited a while
+        self.target_model = self.ctx.router.model_for("head")
         self.ctx.model_name = self.target_model
         
         syst_prompt = self.system_prompt
-        self.ctx.log.log(f"[APPLICATION] : Using prompt {syst_prompt[0:100].replace("\n", " ")}")
+        preview = syst_prompt[0:100].replace("\n", " ")
+        self.ctx.log.log(f"[APPLICATION] : Using prompt {preview}")
         tool_names = []
         for tool in self.tools:
             tool_names.append(tool.name)
         self.ctx.log.log(f"\tUsing tools: {json.dumps(tool_names)}")
         if (additional_prompting != ""):
-            self.system_prompt += f"\nAdditionally, the user has instructed you: \"{additional_prompting}\""
+            syst_prompt += f"\nAdditionally, the user has instructed you: \"{additional_prompting}\""
         
         self.agent = Agent(syst_prompt, self.tools,
-                           self.target_model, self.ctx.wallet.get("OPENAI"), self.ctx.log)
+                           self.target_model, self.ctx.wallet.get("OPENAI"), self.ctx.log,
+                           router=self.ctx.router, role="head",
+                           observation_stage=self.ctx.observation_stage,
+                           cancel_token=self.ctx.cancel_token,
+                           time_left=self.ctx.time_left)
         
         self.ctx.log.log("[APPLICATION] : Beginning agentic execution...")
-        out = self.agent.prompt("Begin helping.", max_iter)
+        try:
+            out = self.agent.prompt("Begin helping.", max_iter)
+        except Cancelled_Error as e:
+            self.ctx.log.log(f"[APPLICATION] : {e}, stopping.")
+            raise
         self.ctx.log.log("[APPLICATION] : Agentic execution complete!")
+        bb = self.ctx.blackboard.stats()
+        self.ctx.log.log(f"[APPLICATION] : Research blackboard held {bb['queries']} searches, {bb['fetches']} pages "
+                         f"and {bb['notes']} notes; {bb['saved_calls']} repeated tool calls were served from it.")
+        self.ctx.log.log("[APPLICATION] : Model usage by route:\n" + self.ctx.router.summary())
+        self.ctx.log.log("[APPLICATION] : Observation stage: " + self.ctx.observation_stage.report())
         self.ctx.log.log("\tOutput: " + out)
         
-        return out
\ No newline at end of file
+        return out
+
+
+class Application_Pool:
+    """
+    Keeps a few Application_Instances built ahead of time, so a run does not wait for setup.
+    Instances are single use; the pool rebuilds a replacement in the background after each acquire.
+    """
+    
+    def __init__(self, size=2, noisy=True):
+        self.size = size
+        self.noisy = noisy
+        self.shared = Shared_State.get()
+        self.ready = queue.Queue()
+        self._refill_lock = threading.Lock()
+        self._refill()
+    
+    def _build(self):
+        return Application_Instance(self.noisy, self.shared)
+    
+    def _fill(self):
+        # Only one refill at a time; it tops the pool back up to `size`
+        if not self._refill_lock.acquire(blocking=False):
+            return
+        try:
+            while self.ready.qsize() < self.size:
+                self.ready.put(self._build())
+        finally:
+            self._refill_lock.release()
+    
+    def _refill(self):
+        threading.Thread(target=self._fill, daemon=True).start()
+    
+    def acquire(self):
+        try:
+            app = self.ready.get_nowait()
+        except queue.Empty:
+            app = self._build()
+        self._refill()
+        app.ctx.log.begin()
+        return app
@@ -0,0 +1,173 @@
+"""
+A per-run scratchpad shared by the head AI and all of its delegates. Every search query, fetched
+url and delegate note is recorded here exactly once, so a delegate that starts later can see what
+has already been done instead of repeating it.
+"""
+import threading
+from urllib.parse import urlparse
+from util.metrics import CACHE_REQUESTS
+
+
+MAX_DIGEST_NOTE_CHARS = 200
+MAX_SEARCH_RESULTS = 8
+SNIPPET_RADIUS = 150
+
+
+def normalize_query(query : str):
+    return " ".join(query.lower().replace("\"", " ").replace("'", " ").split())
+
+
+def normalize_url(url : str):
+    try:
+        parsed = urlparse(url.strip())
+        path = parsed.path.rstrip("/")
+        key = f"{parsed.netloc.lower()}{path}"
+        if parsed.query:
+            key += "?" + parsed.query
+        return key
+    except Exception:
+        return url.strip().lower()
+
+
+class Research_Blackboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.queries = {}   # normalized query -> entry
+        self.fetches = {}   # normalized url -> entry
+        self.notes = {}     # normalized note -> entry
+        self.saved_calls = 0
+
+    def set_author(self, author : str):
+        """
+        Tags everything recorded from the calling thread with `author` (e.g. "delegate 2/3").
+        """
+        self._local.author = author
+
+    def _author(self):
+        return getattr(self._local, "author", "head")
+
+    # --- Recording ---
+
+    def record_query(self, query : str, result : str):
+        key = normalize_query(query)
+        with self._lock:
+            if key not in self.queries:
+                self.queries[key] = {"query": query, "result": result, "by": self._author()}
+
+    def record_fetch(self, url : str, text):
+        key = normalize_url(url)
+        ok = bool(text)
+        with self._lock:
+            if key not in self.fetches or (ok and not self.fetches[key]["ok"]):
+                self.fetches[key] = {
+                    "url": url,
+                    "ok": ok,
+                    "text": text if ok else "",
+                    "chars": len(text) if ok else 0,
+                    "by": self._author()
+                }
+
+    def add_note(self, note : str):
+        """
+        Returns False if an identical note was already on the board.
+        """
+        key = " ".join(note.lower().split())
+        with self._lock:
+            if key in self.notes:
+                return False
+            self.notes[key] = {"note": note.strip(), "by": self._author()}
+            return True
+
+    # --- Lookups (count as saved tool calls on a hit) ---
+
+    def lookup_query(self, query : str):
+        with self._lock:
+            entry = self.queries.get(normalize_query(query))
+            if entry is None:
+                CACHE_REQUESTS.inc(cache="blackboard_search", result="miss")
+                return None
+            CACHE_REQUESTS.inc(cache="blackboard_search", result="hit")
+            self.saved_calls += 1
+            return entry["result"]
+
+    def lookup_fetch(self, url : str):
+        """
+        Returns (found, text). `text` is False for urls that already failed to fetch.
+        """
+        with self._lock:
+            entry = self.fetches.get(normalize_url(url))
+            if entry is None:
+                CACHE_REQUESTS.inc(cache="blackboard_fetch", result="miss")
+                return False, None
+            CACHE_REQUESTS.inc(cache="blackboard_fetch", result="hit")
+            self.saved_calls += 1
+            return True, (entry["text"] if entry["ok"] else False)
+
+    # --- Summaries ---
+
+    def is_empty(self):
+        with self._lock:
+            return not (self.queries or self.fetches or self.notes)
+
+    def digest(self):
+        """
+        A compact overview of the board, small enough to prepend to a delegate's task.
+        """
+        with self._lock:
+            out = ""
+            if self.queries:
+                out += "Searches already performed:\n"
+                for entry in self.queries.values():
+                    out += f"\t- \"{entry['query']}\" ({entry['by']})\n"
+            if self.fetches:
+                out += "Pages already fetched:\n"
+                for entry in self.fetches.values():
+                    status = f"{entry['chars']} chars" if entry["ok"] else "FAILED, do not retry"
+                    out += f"\t- {entry['url']} ({status})\n"
+            if self.notes:
+                out += "Notes from other assistants:\n"
+                for entry in self.notes.values():
+                    note = entry["note"]
+                    if len(note) > MAX_DIGEST_NOTE_CHARS:
+                        note = note[:MAX_DIGEST_NOTE_CHARS] + "..."
+                    out += f"\t- ({entry['by']}) {note}\n"
+            return out
+
+    def search(self, term : str):
+        """
+        Finds notes, queries and fetched pages that mention `term`, with a snippet of page text.
+        """
+        needle = " ".join(term.lower().split())
+        if needle in ("", "none"):
+            return self.digest() or "The blackboard is empty."
+
+        results = []
+        with self._lock:
+            for entry in self.notes.values():
+                if needle in entry["note"].lower():
+                    results.append(f"[NOTE] ({entry['by']}) {entry['note']}")
+            for key, entry in self.queries.items():
+                if needle in key:
+                    results.append(f"[SEARCH] \"{entry['query']}\" -> {entry['result'][:SNIPPET_RADIUS * 2]}")
+            for entry in self.fetches.values():
+                if not entry["ok"]:
+                    continue
+                pos = entry["text"].lower().find(needle)
+                if pos >= 0 or needle in entry["url"].lower():
+                    start = max(0, pos - SNIPPET_RADIUS)
+                    snippet = entry["text"][start:start + SNIPPET_RADIUS * 2]
+                    results.append(f"[PAGE] {entry['url']} : ...{snippet}...")
+
+        if not results:
+            return f"Nothing on the blackboard mentions \"{term}\"."
+        return "\n".join(results[:MAX_SEARCH_RESULTS])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queries": len(self.queries),
+                "fetches": len(self.fetches),
+                "notes": len(self.notes),
+                "saved_calls": self.saved_calls
+            }
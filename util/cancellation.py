@@ -0,0 +1,109 @@
+"""
+Cooperative cancellation of a run. Every App_Context carries a Cancel_Token; the agent checks it
+between iterations and before every tool call, and long-running tools check it between the steps of
+their work, so a run that nobody is waiting for any more stops within a few seconds instead of
+spending its API budget and worker slot to the end. A token is cancelled explicitly (the cancel
+endpoint, or the client disconnecting) or by passing its deadline.
+"""
+import threading
+import time
+
+
+class Cancelled_Error(Exception):
+    """
+    Raised inside a run once its token is cancelled. Tools must let it propagate.
+    """
+    pass
+
+
+class Cancel_Token:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+        self.deadline = None
+        self._timer = None
+
+    def set_deadline(self, seconds : float):
+        """
+        Cancels the token (reason "deadline") once `seconds` from now have passed. A timer does
+        the cancelling, so the abort callbacks run on time even if nothing checks the token.
+        """
+        timer = threading.Timer(seconds, self.cancel, args=("deadline",))
+        timer.daemon = True
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.deadline = time.monotonic() + seconds
+            previous, self._timer = self._timer, timer
+        if previous is not None:
+            previous.cancel()
+        timer.start()
+
+    def clear_deadline(self):
+        """
+        Drops the deadline and stops its timer. Called once the run is over.
+        """
+        with self._lock:
+            self.deadline = None
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def cancel(self, reason : str = "cancelled"):
+        """
+        Cancels the token and runs the abort callbacks. Only the first call has an effect.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def check(self):
+        """
+        Raises Cancelled_Error if the token has been cancelled.
+        """
+        if self.cancelled:
+            raise Cancelled_Error(f"Run cancelled ({self.reason})")
+
+    def wait(self, seconds : float):
+        """
+        Sleeps up to `seconds`, waking early on cancellation. Returns True if cancelled.
+        """
+        if self.deadline is not None:
+            seconds = min(seconds, max(0.0, self.deadline - time.monotonic()))
+        return self._event.wait(seconds) or self.cancelled
+
+    def on_cancel(self, callback):
+        """
+        Registers `callback()` to abort an in-flight operation when the token is cancelled (it runs
+        on the cancelling thread, or right away if already cancelled). Returns a function that
+        unregisters it once the operation is over.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                def unregister():
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+                return unregister
+        callback()
+        return lambda: None
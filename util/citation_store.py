@@ -0,0 +1,117 @@
+"""
+Remembers the citation metadata (title, author, site name, date, content type) extracted from every
+url, in a SQLite file shared by all runs and worker processes. The same handful of sources are cited
+by many essays, so most citations become a single lookup instead of a page fetch and parse. Entries
+go stale after a while so corrected pages are picked up again, and urls that could not be fetched
+are remembered for a shorter time so a dead link does not cost a slow fetch in every run.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+
+DB_PATH = "./cache/citations.sqlite3"
+FRESH_SECONDS = 30 * 24 * 60 * 60
+FAILURE_SECONDS = 60 * 60
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref_src")
+
+# Fields kept in the store; access_date is set when a citation is made
+FIELDS = ("title", "site_name", "author", "date", "url", "content_type")
+
+
+def canonical_url(url : str):
+    """
+    One key for all the ways of writing the same url: scheme and "www." are ignored, as are the
+    fragment, default ports, trailing slashes, tracking parameters and the order of the query.
+    """
+    try:
+        parsed = urlparse(url.strip())
+        host = (parsed.hostname or "").lower()
+        if host.startswith("www."):
+            host = host[4:]
+        if parsed.port and parsed.port not in (80, 443):
+            host += f":{parsed.port}"
+        path = parsed.path.rstrip("/")
+        query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                       if not k.lower().startswith(TRACKING_PARAMS))
+        key = host + path
+        if query:
+            key += "?" + urlencode(query)
+        return key or url.strip()
+    except ValueError:
+        return url.strip()
+
+
+class Citation_Store:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=DB_PATH, fresh_seconds=FRESH_SECONDS, failure_seconds=FAILURE_SECONDS):
+        self.path = path
+        self.fresh_seconds = fresh_seconds
+        self.failure_seconds = failure_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS metadata (url TEXT PRIMARY KEY, meta TEXT, error TEXT, "
+                         "fetched REAL NOT NULL)")
+        finally:
+            conn.close()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = Citation_Store()
+            return cls._instance
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def lookup(self, url : str):
+        """
+        Returns the stored metadata dict, {"error": ...} for a recent failure, or None if the url has
+        to be fetched (never seen, or its entry went stale).
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT meta, error, fetched FROM metadata WHERE url = ?",
+                               (canonical_url(url),)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        meta, error, fetched = row
+        age = time.time() - fetched
+        if error is not None:
+            return {"error": error} if age < self.failure_seconds else None
+        return json.loads(meta) if age < self.fresh_seconds else None
+
+    def store(self, url : str, meta : dict):
+        record = {field: meta.get(field) for field in FIELDS}
+        self._write(url, json.dumps(record), None)
+
+    def store_failure(self, url : str, error : str):
+        self._write(url, None, error)
+
+    def _write(self, url, meta, error):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO metadata (url, meta, error, fetched) VALUES (?, ?, ?, ?)",
+                         (canonical_url(url), meta, error, time.time()))
+        finally:
+            conn.close()
+
+    def forget(self, url : str):
+        conn = self._connect()
+        try:
+            return conn.execute("DELETE FROM metadata WHERE url = ?", (canonical_url(url),)).rowcount > 0
+        finally:
+            conn.close()
@@ -1,13 +1,19 @@
-import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
 from urllib.parse import urlparse
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from playwright.sync_api import sync_playwright
-import io
-import pypdf
 import re
+from util.citation_store import Citation_Store
+from util.head_metadata import fetch_head_metadata, TIMEOUT as HEAD_TIMEOUT
+from util.domain_health import Domain_Health, fetch_timeout
+from util.metrics import CACHE_REQUESTS, PLAYWRIGHT_BROWSERS
+from util.download_guard import Download_Rejected, classify, read_body
+from util.doc_processing import Doc_Processor
+from util.cancellation import Cancelled_Error
+
+# requests and playwright are heavy, so they are imported where they are used.
+# Parsing (bs4, pypdf) happens in util/doc_processing.py.
+
+# Upper bound for fetching a page to cite; shortened for fast domains and near the run's deadline
+FETCH_TIMEOUT_SECONDS = 30
 
 # ==========================================
 # 1. Helper: Text Sanitization
@@ -30,12 +36,13 @@ def clean_text(text):
 # 2. Fetching Logic (Resilience & Features)
 # ==========================================
 
-def _fetch_with_playwright(url, is_pdf=False):
+def _fetch_with_playwright(url, is_pdf=False, timeout=FETCH_TIMEOUT_SECONDS):
     """
     Fallback: Fetches content using a headless Chromium instance masquerading as a human.
     """
     try:
-        with sync_playwright() as p:
+        from playwright.sync_api import sync_playwright
+        with PLAYWRIGHT_BROWSERS.track(), sync_playwright() as p:
             browser = p.chromium.launch(
                 headless=True,
                 args=[
@@ -64,7 +71,7 @@ def _fetch_with_playwright(url, is_pdf=False):
 
             try:
                 # Wait for network idle to ensure dynamic metadata loads
-                response = page.goto(url, wait_until="networkidle", timeout=30000)
+                response = page.goto(url, wait_until="networkidle", timeout=int(timeout * 1000))
             except Exception:
                 # If timeout, try to grab what we have
                 response = page.main_frame.page
@@ -85,11 +92,15 @@ def _fetch_with_playwright(url, is_pdf=False):
         print(f"Playwright Error: {e}")
         return None
 
-def fetch_content(url):
+def fetch_content(url, timeout=FETCH_TIMEOUT_SECONDS):
     """
-    Attempts to fetch URL via requests; falls back to Playwright on error/bot-detection.
-    Returns: (content, is_pdf_boolean)
+    Attempts to fetch URL via requests; falls back to Playwright on error/bot-detection. Each
+    attempt waits at most `timeout` seconds. Unsupported or oversized documents are not fetched.
+    Returns: (content, is_pdf_boolean); PDFs may come as an open temporary file.
     """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     is_pdf = url.lower().endswith(".pdf")
     
     # Configure robust session
@@ -112,17 +123,25 @@ def fetch_content(url):
     session.mount("http://", adapter)
 
     try:
-        resp = session.get(url, timeout=15, allow_redirects=True)
-        if resp.status_code != 200:
-            raise requests.RequestException(f"Non-200 Status: {resp.status_code}")
+        resp = session.get(url, timeout=min(15, timeout), allow_redirects=True, stream=True)
+        try:
+            if resp.status_code != 200:
+                raise requests.RequestException(f"Non-200 Status: {resp.status_code}")
+            kind = classify(resp.headers.get("Content-Type", ""), resp.url, resp.headers.get("Content-Length"))
+            body, kind = read_body(resp, kind)
+        finally:
+            resp.close()
         
-        if is_pdf:
-            return resp.content, True
-        return resp.text, False
+        if kind == "pdf":
+            return body, True
+        return body.decode(resp.encoding or "utf-8", errors="replace"), False
 
+    except Download_Rejected:
+        # The browser would only download the same thing
+        return None, False
     except requests.RequestException:
         # Fallback to Playwright
-        content = _fetch_with_playwright(url, is_pdf)
+        content = _fetch_with_playwright(url, is_pdf, timeout)
         return content, is_pdf
 
 # ==========================================
@@ -141,8 +160,79 @@ def parse_pdf_date(date_str):
         return f"{match.group(1)}-{match.group(2)}-{match.group(3)}"
     return "n.d."
 
-def get_metadata(url):
-    content, is_pdf = fetch_content(url)
+# Without these, a citation built from search result metadata is not good enough and the page is fetched
+REQUIRED_FIELDS = ("title",)
+
+def get_metadata(url, store=None, hint=None, time_left=None, cancel_token=None):
+    """
+    Citation metadata for `url`, from the citation store when it has a fresh entry. Otherwise it is
+    built from `hint` (fields from the search result that found the url) if that has the required
+    fields, even if fetching the page recently failed, or else the page is fetched and parsed. The result (or the failure) is stored for the
+    next run. `time_left` is what the run has left before its deadline; fetches are cut to fit.
+    Parsing stops with Cancelled_Error once `cancel_token` is cancelled.
+    """
+    store = store or Citation_Store.get()
+    cached = store.lookup(url)
+    has_hint = hint is not None and all(hint.get(field) for field in REQUIRED_FIELDS)
+    # A recent fetch failure does not matter when the search result is enough to cite the url
+    if cached is not None and not ("error" in cached and has_hint):
+        CACHE_REQUESTS.inc(cache="citations", result="negative_hit" if "error" in cached else "hit")
+        if "error" not in cached:
+            cached["url"] = url
+            cached["access_date"] = datetime.now()
+        return cached
+    if has_hint:
+        CACHE_REQUESTS.inc(cache="citations", result="search_metadata")
+        meta = {
+            "title": clean_text(hint["title"]),
+            "site_name": clean_text(hint.get("site_name")) or clean_text(urlparse(url).netloc),
+            "author": clean_text(hint.get("author")),
+            "date": hint.get("date") or "n.d.",
+            "url": url,
+            "content_type": hint.get("content_type", "html"),
+            "access_date": datetime.now()
+        }
+        store.store(url, meta)
+        return meta
+    # The site fetcher just failed on this url; the citation fetch would only fail the same way
+    recent_failure = Domain_Health.get().bad_url(url)
+    if recent_failure:
+        CACHE_REQUESTS.inc(cache="citations", result="negative_hit")
+        return {"error": f"Could not fetch content from URL ({recent_failure})"}
+    CACHE_REQUESTS.inc(cache="citations", result="miss")
+
+    timeout = fetch_timeout(url, "requests", FETCH_TIMEOUT_SECONDS, time_left)
+    if timeout <= 0:
+        # Not the url's fault, so nothing is stored
+        return {"error": "Run deadline reached before the page could be fetched"}
+    meta = extract_metadata(url, timeout, cancel_token)
+    if "error" in meta:
+        store.store_failure(url, meta["error"])
+    else:
+        store.store(url, meta)
+    return meta
+
+def extract_metadata(url, timeout=FETCH_TIMEOUT_SECONDS, cancel_token=None):
+    """
+    Reads the metadata from just the page's <head> (or the PDF's info dictionary) when possible,
+    and falls back to fetching and parsing the whole document.
+    """
+    head = fetch_head_metadata(url, timeout=tuple(min(part, timeout) for part in HEAD_TIMEOUT))
+    if head is not None:
+        meta = {
+            "title": clean_text(head["title"]),
+            "site_name": clean_text(head["site_name"]) or clean_text(urlparse(url).netloc),
+            "author": clean_text(head["author"]),
+            "date": head["date"] or "n.d.",
+            "url": url,
+            "content_type": head["content_type"],
+            "access_date": datetime.now()
+        }
+        return meta
+    return extract_metadata_full(url, timeout, cancel_token)
+
+def extract_metadata_full(url, timeout=FETCH_TIMEOUT_SECONDS, cancel_token=None):
+    content, is_pdf = fetch_content(url, timeout)
     
     if content is None:
         return {"error": "Could not fetch content from URL"}
@@ -154,22 +244,22 @@ def get_metadata(url):
         "author": None,
         "date": "n.d.",
         "url": url,
+        "content_type": "pdf" if is_pdf else "html",
         "access_date": datetime.now()
     }
 
+    # Parsing runs in the document processing pool, off this thread
+    processor = Doc_Processor.get()
     try:
         if is_pdf:
             # --- PDF Parsing ---
-            with io.BytesIO(content) as f:
-                reader = pypdf.PdfReader(f)
-                info = reader.metadata
-                if info:
-                    if info.title: 
-                        meta["title"] = clean_text(info.title)
-                    if info.author: 
-                        meta["author"] = clean_text(info.author)
-                    if '/CreationDate' in info: 
-                        meta["date"] = parse_pdf_date(info['/CreationDate'])
+            fields = processor.pdf_citation_fields(content, cancel_token)
+            if fields["title"]: 
+                meta["title"] = clean_text(fields["title"])
+            if fields["author"]: 
+                meta["author"] = clean_text(fields["author"])
+            if fields["creation_date"]: 
+                meta["date"] = parse_pdf_date(fields["creation_date"])
             
             # Fallback if title is still missing (use filename)
             if meta["title"] == "No Title" or not meta["title"]:
@@ -179,34 +269,28 @@ def get_metadata(url):
 
         else:
             # --- HTML Parsing ---
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Title
-            og_title = soup.find("meta", property="og:title")
-            if og_title and og_title.get("content"):
-                meta["title"] = clean_text(og_title["content"])
-            elif soup.title and soup.title.string:
-                meta["title"] = clean_text(soup.title.string)
-
-            # Site Name
-            og_site = soup.find("meta", property="og:site_name")
-            if og_site and og_site.get("content"):
-                meta["site_name"] = clean_text(og_site["content"])
-
-            # Author
-            auth_meta = soup.find("meta", attrs={'name': 'author'})
-            if auth_meta and auth_meta.get("content"):
-                meta["author"] = clean_text(auth_meta["content"])
+            fields = processor.html_citation_fields(content, cancel_token)
+            if fields["title"]:
+                meta["title"] = clean_text(fields["title"])
+            if fields["site_name"]:
+                meta["site_name"] = clean_text(fields["site_name"])
+            if fields["author"]:
+                meta["author"] = clean_text(fields["author"])
 
             # Date (Clean to YYYY-MM-DD)
-            pub_date = soup.find("meta", property="article:published_time")
-            if pub_date and pub_date.get("content"):
+            if fields["date"]:
                 # Usually dates don't have newlines, but good to be safe
-                cleaned_date = clean_text(pub_date["content"])
+                cleaned_date = clean_text(fields["date"])
                 meta["date"] = cleaned_date[:10] if cleaned_date else "n.d."
 
+    except Cancelled_Error:
+        # Not the url's fault, so this must not be stored as a failure
+        raise
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        if hasattr(content, "close"):
+            content.close()
 
     return meta
 
@@ -281,10 +365,19 @@ def format_apa(data):
 # 5. Entry Points
 # ==========================================
 
+# Citation styles by name; Works_Cited renders any of these from a stored metadata record
+STYLE_FORMATTERS = {
+    "mla": format_mla,
+    "apa": format_apa
+}
+
+def render_citation(meta, style : str):
+    if style not in STYLE_FORMATTERS:
+        raise ValueError(f"Unknown citation style '{style}', expected one of {list(STYLE_FORMATTERS)}")
+    return STYLE_FORMATTERS[style](meta).replace("*", "")
+
 def get_citation_mla(url : str):
-    meta = get_metadata(url)
-    return format_mla(meta).replace("*", "") 
+    return render_citation(get_metadata(url), "mla")
 
 def get_citation_apa(url : str):
-    meta = get_metadata(url)
-    return format_apa(meta).replace("*", "")
\ No newline at end of file
+    return render_citation(get_metadata(url), "apa")
\ No newline at end of file
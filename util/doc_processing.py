@@ -0,0 +1,322 @@
+"""
+Parses fetched documents (HTML and PDF text, citation fields) in a pool of worker processes, so a
+slow parse runs on another core instead of holding the GIL of the server every analysis shares.
+Each task has a time limit, each worker an address-space limit where the platform allows one, and
+the pool is replaced after a number of tasks so a leak in a parser does not grow forever. Workers are
+started fresh (forkserver, or spawn where there is no forkserver) rather than forked from the threaded
+server, so they inherit none of its locks and memory; they only import this module. Large buffers are
+handed over as a temporary file (a PDF that was spooled to disk is passed by path, not copied). If no
+process pool can be started here, tasks run inline on the calling thread.
+"""
+import io
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as Future_Timeout
+from concurrent.futures.process import BrokenProcessPool
+
+# bs4 and pypdf are heavy, so they are imported where they are used (in the worker processes).
+
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# The pool is replaced once it has run this many tasks per worker
+MAX_TASKS_PER_CHILD = 50
+TASK_TIMEOUT_SECONDS = 30
+# The caller gives up this long after the worker's own alarm should have fired
+TIMEOUT_MARGIN_SECONDS = 5
+# On top of what a worker has mapped when it starts
+MEMORY_LIMIT_BYTES = 1024 * 1024 * 1024
+# The caller waits for a task in slices this long, so a cancelled run stops waiting within one
+CANCEL_SLICE_SECONDS = 0.5
+# Bigger payloads go through a temporary file instead of being pickled through the pool's pipe
+HANDOFF_BYTES = 1024 * 1024
+
+
+class Doc_Processing_Error(Exception):
+    pass
+
+
+# ==========================================
+# Worker side
+# ==========================================
+
+def _mapped_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _limit_memory(limit_bytes):
+    try:
+        import resource
+    except ImportError:
+        return
+    mapped = _mapped_bytes()
+    if mapped is None:
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (mapped + limit_bytes, mapped + limit_bytes))
+    except (ValueError, OSError):
+        pass
+
+
+def _on_alarm(signum, frame):
+    raise TimeoutError("Document took too long to parse")
+
+
+def _load(source):
+    kind, value = source
+    if kind == "path":
+        with open(value, "rb") as f:
+            return f.read()
+    return value
+
+
+def _run_task(func, source, timeout):
+    # Pool workers run tasks on their main thread, where SIGALRM can interrupt a runaway parse
+    alarm = timeout and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    if alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(_load(source))
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _text(data):
+    return data.decode("utf-8", errors="ignore") if isinstance(data, bytes) else data
+
+
+def html_to_text(html):
+    """
+    Extracts all visible plaintext from an HTML document.
+    """
+    if not html:
+        return ""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(_text(html), 'html.parser')
+
+    # Remove script and style elements
+    for script_or_style in soup(['script', 'style']):
+        script_or_style.decompose()
+
+    # Get all text and strip leading/trailing whitespace
+    return soup.get_text(separator=' ', strip=True)
+
+
+def pdf_to_text(pdf_bytes):
+    """
+    Extracts text from PDF binary data.
+    """
+    import pypdf
+    try:
+        text = ""
+        with io.BytesIO(pdf_bytes) as f:
+            reader = pypdf.PdfReader(f)
+            for page in reader.pages:
+                extracted = page.extract_text()
+                if extracted:
+                    text += extracted + " "
+        return text
+    except (TimeoutError, MemoryError):
+        # The worker's time and memory limits; the caller reports these as a Doc_Processing_Error
+        raise
+    except Exception as e:
+        return f"Error extracting PDF text: {e}"
+
+
+def html_citation_fields(html):
+    """
+    Title, site name, author and publication date from an HTML page's tags (None when missing).
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(_text(html), 'html.parser')
+    fields = {"title": None, "site_name": None, "author": None, "date": None}
+
+    og_title = soup.find("meta", property="og:title")
+    if og_title and og_title.get("content"):
+        fields["title"] = og_title["content"]
+    elif soup.title and soup.title.string:
+        fields["title"] = str(soup.title.string)
+
+    og_site = soup.find("meta", property="og:site_name")
+    if og_site and og_site.get("content"):
+        fields["site_name"] = og_site["content"]
+
+    auth_meta = soup.find("meta", attrs={'name': 'author'})
+    if auth_meta and auth_meta.get("content"):
+        fields["author"] = auth_meta["content"]
+
+    pub_date = soup.find("meta", property="article:published_time")
+    if pub_date and pub_date.get("content"):
+        fields["date"] = pub_date["content"]
+    return fields
+
+
+def pdf_citation_fields(pdf_bytes):
+    """
+    Title, author and raw creation date from a PDF's info dictionary (None when missing).
+    """
+    import pypdf
+    fields = {"title": None, "author": None, "creation_date": None}
+    with io.BytesIO(pdf_bytes) as f:
+        info = pypdf.PdfReader(f).metadata
+        if info:
+            fields["title"] = info.title
+            fields["author"] = info.author
+            if '/CreationDate' in info:
+                fields["creation_date"] = str(info['/CreationDate'])
+    return fields
+
+
+# ==========================================
+# Caller side
+# ==========================================
+
+def _pool_context():
+    # Spawned workers import the server's main module again (as __mp_main__), so it must only
+    # start the server under its `if __name__ == "__main__"` guard (see main.py)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class Doc_Processor:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers=MAX_WORKERS, timeout=TASK_TIMEOUT_SECONDS, memory_limit=MEMORY_LIMIT_BYTES,
+                 use_processes=True):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.use_processes = use_processes and os.environ.get("DOC_PROCESSES", "1") != "0"
+        self._pool = None
+        self._submitted = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = Doc_Processor()
+            return cls._instance
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is not None and self._submitted >= MAX_TASKS_PER_CHILD * self.max_workers:
+                # Recycled by hand, so tasks already submitted still finish on the old pool
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if self._pool is None and self.use_processes:
+                try:
+                    self._pool = ProcessPoolExecutor(self.max_workers, mp_context=_pool_context(),
+                                                     initializer=_limit_memory, initargs=(self.memory_limit,))
+                    self._submitted = 0
+                except (OSError, NotImplementedError, ImportError):
+                    # No semaphores or subprocesses here (some sandboxes); parse inline from now on
+                    self.use_processes = False
+            if self._pool is not None:
+                self._submitted += 1
+            return self._pool
+
+    def _reset(self, pool):
+        # A worker died or hung: later tasks get a fresh pool, the old one winds down on its own
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _source(self, data):
+        """
+        What a worker is given for `data`: ("bytes", data), or ("path", file) for large buffers and
+        for open files that are on disk already. Returns (source, temporary file to delete or None).
+        """
+        if hasattr(data, "read"):
+            name = getattr(data, "name", None)
+            if isinstance(name, str) and os.path.exists(name):
+                return ("path", name), None
+            data = data.read()
+        if len(data) <= HANDOFF_BYTES:
+            return ("bytes", data), None
+        with tempfile.NamedTemporaryFile(prefix="doc-", delete=False) as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        return ("path", f.name), f.name
+
+    def _wait(self, future, cancel_token):
+        """
+        The task's result, waited for in slices while checking `cancel_token` (if given) between
+        them. Raises Future_Timeout once the caller's time limit has passed.
+        """
+        deadline = time.monotonic() + self.timeout + TIMEOUT_MARGIN_SECONDS
+        while True:
+            if cancel_token is not None and cancel_token.cancelled:
+                # A task that has already started runs until its own alarm; its result is dropped
+                future.cancel()
+                cancel_token.check()
+            left = deadline - time.monotonic()
+            try:
+                return future.result(timeout=max(0, left if cancel_token is None else min(CANCEL_SLICE_SECONDS, left)))
+            except Future_Timeout:
+                if future.done() or time.monotonic() >= deadline:
+                    raise
+
+    def _run(self, func, data, cancel_token=None):
+        """
+        Runs func(bytes) in the pool. `data` is bytes or str, or an open binary file (e.g. a PDF
+        spooled to disk by the download guard), which the caller closes afterwards. Raises
+        Cancelled_Error if `cancel_token` is cancelled while the task runs.
+        """
+        pool = self._get_pool()
+        if pool is None:
+            if hasattr(data, "read"):
+                data = data.read()
+            return _run_task(func, ("bytes", data), None)
+
+        source, handoff = self._source(data)
+        try:
+            future = pool.submit(_run_task, func, source, self.timeout)
+            try:
+                return self._wait(future, cancel_token)
+            except Future_Timeout:
+                # On 3.11+ this is the builtin TimeoutError, which the task itself may have raised
+                # (its own alarm fired); only a task that is still running means a stuck worker
+                if future.done():
+                    raise
+                self._reset(pool)
+                raise Doc_Processing_Error("Document took too long to parse")
+        except BrokenProcessPool:
+            self._reset(pool)
+            raise Doc_Processing_Error("Document parser crashed (out of memory?)")
+        except (TimeoutError, MemoryError) as e:
+            raise Doc_Processing_Error(str(e))
+        finally:
+            if handoff is not None:
+                os.unlink(handoff)
+
+    def html_to_text(self, html, cancel_token=None):
+        return self._run(html_to_text, html, cancel_token)
+
+    def pdf_to_text(self, pdf, cancel_token=None):
+        return self._run(pdf_to_text, pdf, cancel_token)
+
+    def html_citation_fields(self, html, cancel_token=None):
+        return self._run(html_citation_fields, html, cancel_token)
+
+    def pdf_citation_fields(self, pdf, cancel_token=None):
+        return self._run(pdf_citation_fields, pdf, cancel_token)
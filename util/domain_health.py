@@ -0,0 +1,258 @@
+"""
+Remembers which sites we could not fetch, and why (timeout, 403, captcha page, empty text, ...), in
+a SQLite file shared by all runs and worker processes. A url that just failed is not tried again for
+a while: the fetch fails fast with the cached result instead of waiting out the same timeouts. Each
+domain also gets a health score from its recent successes and failures, where older events count for
+less and less, so search results from sites that keep failing can be ranked last. How long each
+domain takes to answer is recorded too, separately for each fetch tier (a browser navigation and a
+plain HTTP request do not take the same time), so fetch timeouts can follow what the site actually
+needs instead of a fixed worst case.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+from util.citation_store import canonical_url
+
+
+DB_PATH = "./cache/domain_health.sqlite3"
+HALF_LIFE_SECONDS = 6 * 60 * 60
+BAD_URL_SECONDS = 6 * 60 * 60
+# Failures that may well not happen again on the next try are only remembered briefly
+TRANSIENT_KINDS = ("timeout", "captcha", "error")
+TRANSIENT_BAD_URL_SECONDS = 10 * 60
+# Events older than this weigh under 1% and are deleted
+FORGET_SECONDS = 7 * HALF_LIFE_SECONDS
+UNHEALTHY_SCORE = 0.4
+
+# Fetch timeouts: a margin over the recent 95th percentile latency, once there are enough samples
+LATENCY_SAMPLES = 50
+MIN_LATENCY_SAMPLES = 5
+TIMEOUT_PERCENTILE = 0.95
+TIMEOUT_MARGIN = 2.0
+MIN_TIMEOUT_SECONDS = 3.0
+TIMEOUT_CACHE_SECONDS = 60
+# Left over for the agent to write its answer once fetching has used up the run's deadline
+DEADLINE_RESERVE_SECONDS = 10.0
+
+FETCH_TIERS = ("playwright", "requests")
+FAILURE_KINDS = ("timeout", "http_403", "http_error", "captcha", "empty", "error", "unsupported_type", "too_large")
+
+# Text of bot walls and challenge pages that are served with a 200
+CAPTCHA_MARKERS = ("cf-challenge", "just a moment...", "checking your browser", "verify you are human",
+                   "are you a robot", "unusual traffic from your computer network",
+                   "complete the security check", "attention required! | cloudflare")
+# Challenge pages are a few lines long; anything longer is content, even if it quotes one
+CAPTCHA_MAX_CHARS = 2000
+# A challenge is a line or two of instructions, not a paragraph that mentions one
+CAPTCHA_LINE_CHARS = 120
+
+
+def domain_of(url : str):
+    host = (urlparse(url.strip()).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def fetch_timeout(url : str, tier : str, default : float, time_left : float = None):
+    """
+    Seconds a fetch of `url` with `tier` (one of FETCH_TIERS) may take: the domain's adaptive
+    timeout for that tier (never above `default`), cut down to what the run has left before its
+    deadline. 0 means there is no time left to fetch.
+    """
+    timeout = Domain_Health.get().timeout_for(url, tier, default)
+    if time_left is not None:
+        timeout = min(timeout, max(0.0, time_left - DEADLINE_RESERVE_SECONDS))
+    return timeout
+
+
+def looks_like_captcha(text : str):
+    """
+    True for short pages that are bot walls rather than content: the page's title (its first line)
+    is challenge text, or most of its text is.
+    """
+    if not text or len(text.strip()) > CAPTCHA_MAX_CHARS:
+        return False
+    lines = [line.strip() for line in text.lower().splitlines() if line.strip()]
+    challenge = [line for line in lines
+                 if len(line) <= CAPTCHA_LINE_CHARS and any(marker in line for marker in CAPTCHA_MARKERS)]
+    if not challenge:
+        return False
+    return challenge[0] is lines[0] or 2 * sum(map(len, challenge)) > sum(map(len, lines))
+
+
+class Domain_Health:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=DB_PATH, half_life=HALF_LIFE_SECONDS, bad_url_seconds=BAD_URL_SECONDS,
+                 transient_bad_url_seconds=TRANSIENT_BAD_URL_SECONDS):
+        self.path = path
+        self.half_life = half_life
+        self.bad_url_seconds = bad_url_seconds
+        self.transient_bad_url_seconds = transient_bad_url_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS events (domain TEXT NOT NULL, kind TEXT NOT NULL, ts REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS events_by_domain ON events (domain, ts)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bad_urls (url TEXT PRIMARY KEY, kind TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS latencies (domain TEXT NOT NULL, tier TEXT NOT NULL, "
+                         "seconds REAL NOT NULL, ts REAL NOT NULL)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(latencies)")]
+            if "tier" not in columns:
+                # Samples from before tiers were told apart were all whole Playwright fetches
+                conn.execute("ALTER TABLE latencies ADD COLUMN tier TEXT NOT NULL DEFAULT 'playwright'")
+            conn.execute("CREATE INDEX IF NOT EXISTS latencies_by_tier ON latencies (domain, tier, ts)")
+        finally:
+            conn.close()
+        self._timeouts = {}     # (domain, tier) -> (timeout, default, computed at)
+        self._timeouts_lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = Domain_Health()
+            return cls._instance
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    # --- Recording ---
+
+    def record_success(self, url : str):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO events (domain, kind, ts) VALUES (?, 'ok', ?)", (domain_of(url), now))
+            conn.execute("DELETE FROM bad_urls WHERE url = ?", (canonical_url(url),))
+        finally:
+            conn.close()
+
+    def record_failure(self, url : str, kind : str):
+        """
+        Records a failed fetch of `url`; `kind` is one of FAILURE_KINDS. The url is not fetched
+        again for bad_url_seconds, or transient_bad_url_seconds if `kind` is in TRANSIENT_KINDS.
+        """
+        now = time.time()
+        ttl = self.transient_bad_url_seconds if kind in TRANSIENT_KINDS else self.bad_url_seconds
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO events (domain, kind, ts) VALUES (?, ?, ?)", (domain_of(url), kind, now))
+            conn.execute("INSERT OR REPLACE INTO bad_urls (url, kind, expires) VALUES (?, ?, ?)",
+                         (canonical_url(url), kind, now + ttl))
+            conn.execute("DELETE FROM events WHERE ts < ?", (now - FORGET_SECONDS,))
+            conn.execute("DELETE FROM bad_urls WHERE expires < ?", (now,))
+        finally:
+            conn.close()
+
+    def record_latency(self, url : str, tier : str, seconds : float):
+        """
+        Records how long `tier` (one of FETCH_TIERS) took to get a response from the url's domain.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO latencies (domain, tier, seconds, ts) VALUES (?, ?, ?, ?)",
+                         (domain_of(url), tier, seconds, now))
+            conn.execute("DELETE FROM latencies WHERE ts < ?", (now - FORGET_SECONDS,))
+        finally:
+            conn.close()
+
+    # --- Queries ---
+
+    def timeout_for(self, url : str, tier : str, default : float):
+        """
+        A fetch timeout for the url's domain and `tier`: TIMEOUT_MARGIN times the tier's recent 95th
+        percentile latency there, between MIN_TIMEOUT_SECONDS and `default`. `default` until there
+        are enough samples.
+        """
+        domain = domain_of(url)
+        now = time.time()
+        with self._timeouts_lock:
+            cached = self._timeouts.get((domain, tier))
+        if cached and cached[1] == default and now - cached[2] < TIMEOUT_CACHE_SECONDS:
+            return cached[0]
+
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT seconds FROM latencies WHERE domain = ? AND tier = ? ORDER BY ts DESC LIMIT ?",
+                                (domain, tier, LATENCY_SAMPLES)).fetchall()
+        finally:
+            conn.close()
+        timeout = default
+        if len(rows) >= MIN_LATENCY_SAMPLES:
+            samples = sorted(row[0] for row in rows)
+            p95 = samples[int(TIMEOUT_PERCENTILE * (len(samples) - 1))]
+            timeout = min(default, max(MIN_TIMEOUT_SECONDS, p95 * TIMEOUT_MARGIN))
+        with self._timeouts_lock:
+            self._timeouts[(domain, tier)] = (timeout, default, now)
+        return timeout
+
+    def bad_url(self, url : str):
+        """
+        The kind of the url's recent failure, or None if it may be fetched.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT kind FROM bad_urls WHERE url = ? AND expires > ?",
+                               (canonical_url(url), time.time())).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _weights(self, rows, now):
+        decay = math.log(2) / self.half_life
+        ok = 0.0
+        failures = {}
+        for kind, ts in rows:
+            weight = math.exp(-decay * (now - ts))
+            if kind == "ok":
+                ok += weight
+            else:
+                failures[kind] = failures.get(kind, 0.0) + weight
+        return ok, failures
+
+    def score(self, domain : str):
+        """
+        Health of a domain between 0 (everything fails) and 1 (no recent failures).
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT kind, ts FROM events WHERE domain = ?", (domain,)).fetchall()
+        finally:
+            conn.close()
+        ok, failures = self._weights(rows, time.time())
+        return (1 + ok) / (1 + ok + sum(failures.values()))
+
+    def is_unhealthy(self, domain : str):
+        return self.score(domain) < UNHEALTHY_SCORE
+
+    def report(self, limit=50):
+        """
+        The least healthy domains, with their decayed failure counts by kind.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT domain, kind, ts FROM events WHERE ts > ?", (now - FORGET_SECONDS,)).fetchall()
+        finally:
+            conn.close()
+        by_domain = {}
+        for domain, kind, ts in rows:
+            by_domain.setdefault(domain, []).append((kind, ts))
+        out = []
+        for domain, events in by_domain.items():
+            ok, failures = self._weights(events, now)
+            out.append({
+                "domain": domain,
+                "score": round((1 + ok) / (1 + ok + sum(failures.values())), 3),
+                "successes": round(ok, 2),
+                "failures": {kind: round(weight, 2) for kind, weight in failures.items()}
+            })
+        out.sort(key=lambda entry: entry["score"])
+        return out[:limit]
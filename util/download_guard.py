@@ -0,0 +1,148 @@
+"""
+Checks a download before and while it is read, so a link to a dataset, video or archive costs one
+header read instead of the whole file. Only what the extractors can use is accepted: HTML and other
+text, and PDFs. A Content-Length over the cap is refused before reading, and the body is cut off as
+soon as it passes the cap anyway, since many servers send no length (or a wrong one). PDF bodies
+are written to a temporary file as they arrive instead of being held in memory.
+"""
+import os
+import shutil
+import tempfile
+from urllib.parse import urlparse
+
+
+CHUNK_SIZE = 64 * 1024
+MAX_TEXT_BYTES = 5 * 1024 * 1024
+MAX_PDF_BYTES = 30 * 1024 * 1024
+
+TEXT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "application/xml", "text/xml")
+PDF_TYPES = ("application/pdf", "application/x-pdf")
+# Labels that say nothing about the content; the first bytes decide
+GENERIC_TYPES = ("", "application/octet-stream", "binary/octet-stream", "application/download")
+
+TEXT_EXTENSIONS = (".html", ".htm", ".xhtml", ".txt", ".xml")
+
+
+class Download_Rejected(Exception):
+    """
+    `kind` is "unsupported_type", "too_large" or (for a browser download that did not finish in
+    time) "timeout", as recorded by Domain_Health.
+    """
+    def __init__(self, kind : str, message : str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _limit(kind):
+    return MAX_PDF_BYTES if kind == "pdf" else MAX_TEXT_BYTES
+
+
+def classify(content_type : str, url : str = "", content_length=None):
+    """
+    "text" or "pdf" from the response headers, or None when they do not say and the body has to be
+    sniffed. Raises Download_Rejected for other types, or if the declared length is over the cap.
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime in PDF_TYPES:
+        kind = "pdf"
+    elif mime in TEXT_TYPES:
+        kind = "text"
+    elif mime in GENERIC_TYPES:
+        kind = "pdf" if urlparse(url).path.lower().endswith(".pdf") else None
+    else:
+        raise Download_Rejected("unsupported_type", f"Unsupported content type {mime}")
+    try:
+        length = int(content_length) if content_length is not None else None
+    except ValueError:
+        length = None
+    if length is not None and length > _limit(kind or "pdf"):
+        raise Download_Rejected("too_large", f"{length} bytes is over the download limit")
+    return kind
+
+
+def sniff(first_bytes : bytes):
+    """
+    "pdf" or "text" from the start of a body, or None if it looks like some other binary format.
+    """
+    if b"%PDF" in first_bytes[:1024]:
+        return "pdf"
+    # Text, in any encoding we extract from, has no NUL bytes
+    return None if b"\x00" in first_bytes[:1024] else "text"
+
+
+def read_body(resp, kind=None, cancel_token=None):
+    """
+    Reads a streamed requests response under the cap for its kind (from classify(); None sniffs the
+    first chunk). Returns (body, kind): bytes for text, or for PDFs an open temporary file positioned
+    at the start, which the caller closes. Checks `cancel_token` between chunks.
+    """
+    chunks = resp.iter_content(CHUNK_SIZE)
+    first = next(chunks, b"")
+    if kind is None:
+        kind = sniff(first)
+        if kind is None:
+            raise Download_Rejected("unsupported_type", "Binary content that is neither a page nor a PDF")
+    limit = _limit(kind)
+
+    if kind == "pdf":
+        out = tempfile.NamedTemporaryFile(prefix="fetch-", suffix=".pdf")
+        write = out.write
+    else:
+        out = []
+        write = out.append
+    size = 0
+    try:
+        for chunk in _prepend(first, chunks):
+            if cancel_token is not None:
+                cancel_token.check()
+            size += len(chunk)
+            if size > limit:
+                raise Download_Rejected("too_large", f"Body passed the {limit} byte download limit")
+            write(chunk)
+    except BaseException:
+        if kind == "pdf":
+            out.close()
+        raise
+    if kind == "pdf":
+        out.seek(0)
+        return out, kind
+    return b"".join(out), kind
+
+
+def _prepend(first, rest):
+    if first:
+        yield first
+    yield from rest
+
+
+def temp_copy(path : str):
+    """
+    An open temporary file holding a copy of the file at `path`, positioned at the start, which the
+    caller closes. Unlike an open handle on `path` itself, it survives `path` being deleted on any
+    platform (the browser deletes its downloads when it closes).
+    """
+    out = tempfile.NamedTemporaryFile(prefix="fetch-", suffix=os.path.splitext(path)[1])
+    try:
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, out, CHUNK_SIZE)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def check_file(path : str, filename : str = ""):
+    """
+    "pdf" or "text" for a file that was already downloaded (by the browser), after the same checks.
+    """
+    extension = os.path.splitext(filename or path)[1].lower()
+    with open(path, "rb") as f:
+        kind = sniff(f.read(1024))
+    if kind == "text" and extension not in TEXT_EXTENSIONS:
+        raise Download_Rejected("unsupported_type", f"Unsupported download {filename}")
+    if kind is None:
+        raise Download_Rejected("unsupported_type", f"Unsupported download {filename}")
+    if os.path.getsize(path) > _limit(kind):
+        raise Download_Rejected("too_large", f"{filename} is over the download limit")
+    return kind
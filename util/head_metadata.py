@@ -0,0 +1,335 @@
+"""
+Fetches only what a citation needs. For HTML pages the response is streamed into an incremental
+parser and the connection is closed as soon as </head> (or <body>) is seen, collecting <title>,
+<meta> tags (og:*, article:*, author, citation_*) and JSON-LD blocks on the way. For PDFs only the
+end of the file is requested (a Range request), to read the trailer and the document info
+dictionary. Anything that cannot be done cheaply returns None so the caller can fall back to a full
+fetch.
+"""
+import json
+import re
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+# requests is heavy, so it is imported where it is used.
+
+
+CHUNK_SIZE = 8 * 1024
+MAX_HEAD_BYTES = 1024 * 1024
+PDF_TAIL_BYTES = 64 * 1024
+PDF_OBJECT_BYTES = 16 * 1024
+TIMEOUT = (5, 10)
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,application/pdf;q=0.8,*/*;q=0.5',
+}
+
+
+class Head_Parser(HTMLParser):
+    """
+    Collects the <head> of an HTML document fed to it in pieces. `done` is set once the head ends.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.tags = {}          # lowercased name/property -> list of contents
+        self.json_ld = []
+        self.done = False
+        self._in_title = False
+        self._script = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.done = True
+            return
+        attrs = dict(attrs)
+        if tag == "meta":
+            key = attrs.get("property") or attrs.get("name") or attrs.get("itemprop")
+            content = attrs.get("content")
+            if key and content:
+                self.tags.setdefault(key.strip().lower(), []).append(content)
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "script" and (attrs.get("type") or "").lower() == "application/ld+json":
+            self._script = []
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+        elif tag == "title":
+            self._in_title = False
+        elif tag == "script" and self._script is not None:
+            try:
+                self.json_ld.append(json.loads("".join(self._script)))
+            except ValueError:
+                pass
+            self._script = None
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif self._script is not None:
+            self._script.append(data)
+
+
+# ==========================================
+# Turning tags into a citation record
+# ==========================================
+
+def _first(tags, *keys):
+    for key in keys:
+        values = tags.get(key)
+        if values:
+            return values[0]
+    return None
+
+
+def _json_ld_items(blocks):
+    for block in blocks:
+        items = block if isinstance(block, list) else [block]
+        for item in items:
+            if isinstance(item, dict):
+                yield item
+                yield from (g for g in item.get("@graph", []) if isinstance(g, dict))
+
+
+def _name_of(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get("name")
+    return value if isinstance(value, str) else None
+
+
+def normalize_date(value):
+    """
+    YYYY-MM-DD from the date formats pages use (ISO timestamps, 2020/05/01, ...), or the year alone.
+    """
+    if not value:
+        return None
+    match = re.search(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})", value)
+    if match:
+        return f"{match.group(1)}-{int(match.group(2)):02d}-{int(match.group(3)):02d}"
+    match = re.search(r"\b(1[5-9]\d{2}|20\d{2})\b", value)
+    return match.group(1) if match else None
+
+
+def _author_name(value):
+    # citation_author is usually "Last, First"; the formatters expect "First Last"
+    if value and value.count(",") == 1:
+        last, first = (part.strip() for part in value.split(","))
+        if last and first:
+            return f"{first} {last}"
+    return value
+
+
+def metadata_from_tags(tags, json_ld=(), title=None):
+    """
+    Title, author, site name and date from <meta> tags (keys lowercased, values as lists), JSON-LD
+    blocks and the page title. Scholarly citation_* tags win over Open Graph, which wins over
+    JSON-LD and plain HTML. Missing fields are None.
+    """
+    ld = {}
+    for item in _json_ld_items(json_ld):
+        ld.setdefault("title", item.get("headline") or item.get("name"))
+        ld.setdefault("author", _name_of(item.get("author")))
+        ld.setdefault("site_name", _name_of(item.get("publisher")) or _name_of(item.get("isPartOf")))
+        ld.setdefault("date", item.get("datePublished") or item.get("dateCreated"))
+    ld = {key: value for key, value in ld.items() if isinstance(value, str) and value.strip()}
+
+    return {
+        "title": _first(tags, "citation_title", "og:title", "dc.title", "twitter:title") or ld.get("title")
+                 or (title.strip() if title and title.strip() else None),
+        "author": _author_name(_first(tags, "citation_author", "author", "dc.creator") or ld.get("author")),
+        "site_name": _first(tags, "citation_journal_title", "og:site_name", "citation_publisher",
+                            "application-name") or ld.get("site_name"),
+        "date": normalize_date(_first(tags, "citation_publication_date", "citation_date",
+                                      "citation_online_date", "article:published_time", "dc.date",
+                                      "date") or ld.get("date"))
+    }
+
+
+# ==========================================
+# HTML: stream until </head>
+# ==========================================
+
+def _is_pdf_response(resp, url):
+    return "application/pdf" in resp.headers.get("Content-Type", "").lower() or \
+        urlparse(url).path.lower().endswith(".pdf")
+
+
+def _read_head(resp):
+    parser = Head_Parser()
+    # Only trust an explicit charset; requests assumes ISO-8859-1 for any text/* response without one
+    charset = re.search(r"charset=([\w-]+)", resp.headers.get("Content-Type", ""), re.IGNORECASE)
+    decoder = codecs.getincrementaldecoder(charset.group(1) if charset else "utf-8")(errors="replace")
+    read = 0
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.done or read >= MAX_HEAD_BYTES:
+            break
+    return parser
+
+
+def fetch_head_metadata(url, session=None, timeout=TIMEOUT):
+    """
+    Citation fields for `url` without downloading the whole document: a dict with title, author,
+    site_name, date and content_type ("html" or "pdf"), or None if the cheap path did not work.
+    `timeout` is passed to requests for every request made.
+    """
+    import requests
+    session = session or requests.Session()
+    try:
+        resp = session.get(url, headers=HEADERS, timeout=timeout, stream=True, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    try:
+        if resp.status_code != 200:
+            return None
+        if _is_pdf_response(resp, url):
+            resp.close()
+            info = fetch_pdf_info(resp.url, session, timeout)
+            if info is None:
+                return None
+            info["content_type"] = "pdf"
+            return info
+        if "html" not in resp.headers.get("Content-Type", "text/html").lower():
+            return None
+        parser = _read_head(resp)
+    except (requests.RequestException, LookupError):
+        return None
+    finally:
+        # Closing the streamed response drops the rest of the document unread
+        resp.close()
+
+    meta = metadata_from_tags(parser.tags, parser.json_ld, parser.title)
+    if not meta["title"]:
+        return None
+    meta["content_type"] = "html"
+    return meta
+
+
+# ==========================================
+# PDF: trailer and info dictionary only
+# ==========================================
+
+def _range(session, url, start=None, length=None, timeout=TIMEOUT):
+    """
+    Bytes of a Range request ("start" and "length", or the last `length` bytes when start is None).
+    Returns (data, total_size), or None if the server ignored the range.
+    """
+    spec = f"bytes=-{length}" if start is None else f"bytes={start}-{start + length - 1}"
+    resp = session.get(url, headers=dict(HEADERS, Range=spec), timeout=timeout, stream=True)
+    try:
+        if resp.status_code != 206:
+            return None
+        data = resp.raw.read(length + 1024, decode_content=True)
+        match = re.search(r"/(\d+)$", resp.headers.get("Content-Range", ""))
+        return data, int(match.group(1)) if match else None
+    finally:
+        resp.close()
+
+
+def _pdf_string(raw : bytes):
+    """
+    Decodes a PDF literal "(...)" or hex "<...>" string, including UTF-16 ones.
+    """
+    if raw.startswith(b"<"):
+        try:
+            raw = bytes.fromhex(raw[1:-1].decode("ascii"))
+        except ValueError:
+            return None
+    else:
+        raw = raw[1:-1]
+        escapes = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f",
+                   b"(": b"(", b")": b")", b"\\": b"\\"}
+        def unescape(match):
+            token = match.group(1)
+            if token[:1].isdigit():
+                return bytes([int(token, 8) & 0xFF])
+            return escapes.get(token, token)
+        raw = re.sub(rb"\\([0-7]{1,3}|.)", unescape, raw, flags=re.DOTALL)
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", errors="replace")
+    return raw.decode("latin-1")
+
+
+_PDF_STRING = rb"(\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>)"
+
+
+def _pdf_date(value):
+    # D:YYYYMMDDHHmmSS...
+    match = re.match(r"D:(\d{4})(\d{2})(\d{2})", value or "")
+    return f"{match.group(1)}-{match.group(2)}-{match.group(3)}" if match else None
+
+
+def _info_fields(dictionary : bytes):
+    fields = {}
+    for key in (b"Title", b"Author", b"CreationDate"):
+        match = re.search(rb"/" + key + rb"\s*" + _PDF_STRING, dictionary, re.DOTALL)
+        if match:
+            fields[key.decode()] = _pdf_string(match.group(1))
+    return fields
+
+
+def fetch_pdf_info(url, session, timeout=TIMEOUT):
+    """
+    Title, author and date from a PDF's info dictionary, reading only the end of the file and, if
+    the info object is not there, the bytes at the offset its cross-reference entry points to.
+    """
+    try:
+        tail = _range(session, url, length=PDF_TAIL_BYTES, timeout=timeout)
+        if tail is None:
+            return None
+        data, total = tail
+
+        info_ref = re.findall(rb"/Info\s+(\d+)\s+(\d+)\s+R", data)
+        if not info_ref:
+            return None
+        number, generation = info_ref[-1]
+        header = number + b"\\s+" + generation + b"\\s+obj"
+        pattern = rb"(?<!\d)" + header + rb"(.*?)endobj"
+
+        found = re.findall(pattern, data, re.DOTALL)
+        if not found and total is not None:
+            # Classic cross-reference table: entry N is the object's byte offset
+            xref = re.findall(rb"startxref\s+(\d+)", data)
+            if not xref:
+                return None
+            table_start = int(xref[-1]) - (total - len(data))
+            table = data[table_start:] if table_start >= 0 else None
+            if table is None:
+                chunk = _range(session, url, start=int(xref[-1]), length=PDF_OBJECT_BYTES, timeout=timeout)
+                table = chunk[0] if chunk else b""
+            match = re.search(rb"xref\s+(\d+)\s+(\d+)\s+", table)
+            if not match:
+                return None
+            first = int(match.group(1))
+            index = int(number) - first
+            if index < 0:
+                return None
+            # Entries are fixed width: 10-digit offset, 5-digit generation, type, end of line
+            entry = table[match.end() + index * 20: match.end() + index * 20 + 18].split()
+            if not entry or not entry[0].isdigit():
+                return None
+            chunk = _range(session, url, start=int(entry[0]), length=PDF_OBJECT_BYTES, timeout=timeout)
+            if chunk is None:
+                return None
+            found = re.findall(pattern, chunk[0], re.DOTALL)
+        if not found:
+            return None
+        fields = _info_fields(found[-1])
+    except Exception:
+        return None
+
+    if not fields.get("Title"):
+        return None
+    return {
+        "title": " ".join(fields["Title"].split()),
+        "author": " ".join(fields["Author"].split()) if fields.get("Author") else None,
+        "site_name": None,
+        "date": _pdf_date(fields.get("CreationDate"))
+    }
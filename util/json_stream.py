@@ -0,0 +1,127 @@
+"""
+Serializes API payloads in a single pass. Strings are sanitized as they are written instead of
+dumping the whole payload, filtering the resulting string and parsing it back. The output comes out
+in chunks, optionally compressed, so large responses can be streamed without building them in memory
+first.
+"""
+import json
+import zlib
+from json.encoder import encode_basestring_ascii
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(obj, sanitize=None):
+    """
+    Yields the JSON encoding of `obj` piece by piece. `sanitize` is applied to every string
+    (keys included) before it is encoded.
+    """
+    if isinstance(obj, str):
+        yield encode_basestring_ascii(sanitize(obj) if sanitize else obj)
+    elif isinstance(obj, dict):
+        yield "{"
+        first = True
+        for key, value in obj.items():
+            if not first:
+                yield ", "
+            first = False
+            key = str(key)
+            yield encode_basestring_ascii(sanitize(key) if sanitize else key)
+            yield ": "
+            yield from iter_json(value, sanitize)
+        yield "}"
+    elif isinstance(obj, (list, tuple)):
+        yield "["
+        first = True
+        for value in obj:
+            if not first:
+                yield ", "
+            first = False
+            yield from iter_json(value, sanitize)
+        yield "]"
+    else:
+        # Numbers, booleans and None
+        yield json.dumps(obj)
+
+
+def iter_chunks(obj, sanitize=None, chunk_size=CHUNK_SIZE):
+    """
+    Groups the encoder's many small pieces into byte chunks of roughly `chunk_size`.
+    """
+    buffer = []
+    size = 0
+    for piece in iter_json(obj, sanitize):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer).encode("ascii")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("ascii")
+
+
+def _brotli_available():
+    try:
+        import brotli
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate_encoding(accept_encoding : str):
+    """
+    Picks the response encoding the client prefers by q-value: brotli (if installed), gzip, or None
+    for identity. Ties go to the better compression. Encodings given q=0 are never picked, "*"
+    covers anything the header does not name, and identity only wins over a listed encoding if the
+    client ranks it higher.
+    """
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    default = weights.get("*", 0.0)
+    candidates = (["br"] if _brotli_available() else []) + ["gzip"]
+    best, best_q = None, weights.get("identity", 0.0)
+    for encoding in candidates:
+        q = weights.get(encoding, default)
+        if q > 0 and (q > best_q or (best is None and q == best_q)):
+            best, best_q = encoding, q
+    return best
+
+
+def compress_chunks(chunks, encoding):
+    if encoding is None:
+        yield from chunks
+        return
+
+    if encoding == "br":
+        import brotli
+        compressor = brotli.Compressor()
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+
+    # wbits=31 makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
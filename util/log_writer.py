@@ -0,0 +1,121 @@
+"""
+Writes structured log records (one JSON object per line) from a background thread, so the agent
+never waits on the disk. Records are batched into a buffered file and the file is rotated once it
+grows past a size limit: agent.jsonl becomes agent.jsonl.1, agent.jsonl.1 becomes agent.jsonl.2 and
+so on, keeping a fixed number of old files. Each process writes its own file (agent.<pid>.jsonl), so
+job workers never rotate a file that another process is still appending to.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+
+
+LOG_PATH = "./logs/agent.jsonl"
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+BUFFER_BYTES = 64 * 1024
+
+
+def process_log_path(path=LOG_PATH):
+    """
+    `path` with this process's id before the extension: ./logs/agent.jsonl -> ./logs/agent.1234.jsonl
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{extension}"
+
+
+class Log_Writer:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=LOG_PATH, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._file = None
+        self._size = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            # A forked child inherits the parent's writer, but not its thread
+            if cls._instance is None or cls._instance.pid != os.getpid():
+                cls._instance = Log_Writer(process_log_path())
+                atexit.register(cls._instance.close)
+            return cls._instance
+
+    def write(self, record : dict):
+        """
+        Queues `record` to be written. Never blocks the caller.
+        """
+        self._queue.put(record)
+
+    def flush(self, timeout=5.0):
+        """
+        Waits until everything queued so far is on disk.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    def _open(self):
+        self._file = open(self.path, "ab", buffering=BUFFER_BYTES)
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _run(self):
+        self._open()
+        while True:
+            item = self._queue.get()
+            # Drain whatever else is waiting so the file is written in batches
+            batch = [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in batch:
+                if item is None:
+                    self._file.close()
+                    return
+                if isinstance(item, threading.Event):
+                    self._file.flush()
+                    item.set()
+                    continue
+                try:
+                    line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8", "replace")
+                except (TypeError, ValueError):
+                    self.dropped += 1
+                    continue
+                self._file.write(line)
+                self._size += len(line)
+                if self._size >= self.max_bytes:
+                    self._rotate()
+            self._file.flush()
@@ -1,30 +1,146 @@
+import io
+import os
 import time
+import threading
+import uuid
+from util.log_writer import Log_Writer
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# Set LOG_LEVEL=INFO (or WARNING, ERROR) to quiet the console; files always get every entry
+CONSOLE_LEVEL = {name: level for level, name in LEVEL_NAMES.items()}.get(os.environ.get("LOG_LEVEL", "DEBUG").upper(), DEBUG)
+
+# Longest entry echoed to the console in full; the transcript and the JSONL log keep everything
+CONSOLE_LIMIT = 2000
+
+
+def classify_entry(mssg : str):
+    """
+    Event type of a log entry, used when streaming a transcript to the frontend.
+    """
+    if mssg.startswith("--- Iteration"):
+        return "iteration"
+    if mssg.startswith("Action:"):
+        return "action"
+    if mssg.startswith("Observation:"):
+        return "observation"
+    if mssg.startswith("DEBUG: LLM Output:"):
+        return "thought"
+    return "log"
+
+
+def infer_level(mssg : str):
+    """
+    Level of an entry logged without one, based on the prefixes the agent and tools already use.
+    """
+    if mssg.startswith("DEBUG"):
+        return DEBUG
+    if mssg.startswith("WARNING"):
+        return WARNING
+    if "ERROR" in mssg[:80] or "failed!" in mssg[:120]:
+        return ERROR
+    return INFO
 
 
 class Log:
-    def __init__(self, should_print=True):
-        self.entries = [];
-        self.saved = False;
-        self.start_time = time.time()
-        self.time_str = time.asctime(time.localtime(self.start_time))
-        self.name = self.time_str.replace(" ", "_").replace(":", "") + ".log"
-        self.as_string = ""
+    def __init__(self, should_print=True, console_level=CONSOLE_LEVEL, console_limit=CONSOLE_LIMIT, writer=None):
         self.should_print = should_print
+        self.console_level = console_level
+        self.console_limit = console_limit
         self.save_dir = "./logs/"
+        self._writer = writer
+        self._subscribers = []
+        self._lock = threading.Lock()
+        # Held from numbering an entry until its subscribers have it, so entries logged from several
+        # threads at once (concurrent delegates) reach subscribers in index order. Reentrant, so a
+        # subscriber may log itself.
+        self._delivery_lock = threading.RLock()
+        self.begin()
+    
+    def begin(self):
+        """
+        (Re)starts the log. Pre-built contexts call this when they are handed to a run, so the log
+        is named and timed after the run rather than after the moment the context was built. Runs
+        can start in the same second, so the run id carries a random suffix as well as the time.
+        """
+        with self._lock:
+            self.entries = [];
+            self.saved = False;
+            self.start_time = time.time()
+            self.time_str = time.asctime(time.localtime(self.start_time))
+            self.run_id = self.time_str.replace(" ", "_").replace(":", "") + "_" + uuid.uuid4().hex[:12]
+            self.name = self.run_id + ".log"
+            # The transcript is built as entries arrive, so dumping it never re-joins every entry
+            self._transcript = io.StringIO()
+            self._saved_chars = 0
         
         self.log(f"[STARTED LOG AT {self.time_str}]\n")
     
-    def log(self, mssg : str):
-        self.entries.append(mssg)
-        if (self.should_print):
+    @property
+    def as_string(self):
+        with self._lock:
+            return self._transcript.getvalue()
+    
+    def log(self, mssg : str, level=None):
+        if level is None:
+            level = infer_level(mssg)
+        with self._delivery_lock:
+            with self._lock:
+                self.entries.append(mssg)
+                index = len(self.entries) - 1
+                self._transcript.write(mssg)
+                self._transcript.write("\n")
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                callback(index, mssg)
+        
+        writer = self._writer or Log_Writer.get()
+        writer.write({
+            "ts": time.time(),
+            "run": self.run_id,
+            "level": LEVEL_NAMES.get(level, str(level)),
+            "type": classify_entry(mssg),
+            "index": index,
+            "msg": mssg
+        })
+        
+        if (self.should_print and level >= self.console_level):
+            if len(mssg) > self.console_limit:
+                mssg = mssg[:self.console_limit] + f"... [{len(mssg) - self.console_limit} more chars]"
             print(mssg)
             
         self.saved = False
+    
+    def subscribe(self, callback):
+        """
+        Calls `callback(index, entry)` for every entry logged from now on, in index order. Returns
+        the index of the first entry the callback will get.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            return len(self.entries)
+    
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
         
     def save(self):
-        self.as_string = ""
-        for ent in self.entries:
-            self.as_string += ent + "\n"
+        """
+        Appends whatever was logged since the last save to this run's .log file.
+        """
+        with self._lock:
+            self._transcript.seek(self._saved_chars)
+            pending = self._transcript.read()
+            self._saved_chars += len(pending)
         
-        with open(self.save_dir + self.name, "w") as file:
-            file.write(self.as_string)
\ No newline at end of file
+        if pending:
+            os.makedirs(self.save_dir, exist_ok=True)
+            with open(self.save_dir + self.name, "a", encoding="utf-8") as file:
+                file.write(pending)
+        self.saved = True
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+A small in-process metrics registry, exported in the Prometheus text format by the /metrics
+endpoint. Updating a metric is a dict lookup and an addition under a lock, so the agent, the tools
+and the API can record on their hot paths. Every metric the server exposes is declared at the bottom
+of this file.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values, extra=""):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name : str, help : str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_label_text(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track(self, **labels):
+        """
+        Counts the body of the with-block as in progress while it runs.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name : str, help : str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.label_names, key)} {count}")
+        return lines
+
+
+class Metrics_Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collect):
+        """
+        Registers `collect()`, called before every export. Use it for values that are cheaper to
+        read when scraped than to keep up to date, like the size of a job queue.
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collect in collectors:
+            try:
+                collect()
+            except Exception:
+                pass
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Metrics_Registry()
+
+# --- Runs ---
+RUN_DURATION = REGISTRY.histogram("essay_run_duration_seconds", "Wall time of an analysis run.", ["outcome"])
+RUN_ITERATIONS = REGISTRY.histogram("essay_agent_iterations", "ReACT iterations per agent run.", ["role"],
+                                    buckets=(1, 2, 3, 5, 8, 10, 15, 20, 30))
+ACTIVE_RUNS = REGISTRY.gauge("essay_active_runs", "Analyses currently running in this process.")
+ACTIVE_JOBS = REGISTRY.gauge("essay_jobs", "Jobs known to the job backend, by status.", ["status"])
+
+# --- Tools ---
+TOOL_LATENCY = REGISTRY.histogram("essay_tool_latency_seconds", "Time spent in a tool call.", ["tool"])
+TOOL_CALLS = REGISTRY.counter("essay_tool_calls_total", "Tool calls made by agents.", ["tool", "outcome"])
+FETCH_TIER = REGISTRY.counter("essay_fetch_tier_total", "Which tier answered a site fetch.", ["tier"])
+PLAYWRIGHT_BROWSERS = REGISTRY.gauge("essay_playwright_browsers", "Playwright browsers currently open.")
+
+# --- Caches ---
+CACHE_REQUESTS = REGISTRY.counter("essay_cache_requests_total", "Cache lookups by cache and result.",
+                                  ["cache", "result"])
+
+# --- LLM ---
+LLM_TOKENS = REGISTRY.counter("essay_llm_tokens_total", "LLM tokens used, by role, model and direction.",
+                              ["role", "model", "direction"])
+LLM_LATENCY = REGISTRY.histogram("essay_llm_latency_seconds", "Latency of a chat completion call.", ["role"])
+LLM_RATE_LIMITS = REGISTRY.counter("essay_llm_rate_limits_total", "Rate-limit errors from the LLM API.", ["model"])
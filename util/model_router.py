@@ -0,0 +1,116 @@
+"""
+Picks which OpenAI model each kind of agent runs on. Routes are read from ./config/model_routes.json
+and map a role ("head" or "delegate") to an ordered chain of models. The first model in the
+chain is preferred; when a model keeps getting rate limited, the router falls through to the next one
+until the pressure dies down.
+"""
+import json
+import threading
+import time
+from util.metrics import LLM_TOKENS, LLM_LATENCY, LLM_RATE_LIMITS
+
+
+CONFIG_PATH = "./config/model_routes.json"
+
+DEFAULT_CONFIG = {
+    "routes": {
+        "head": ["gpt-4o", "gpt-4o-mini"],
+        "delegate": ["gpt-4o-mini"]
+    },
+    "prices_per_1k_tokens": {},
+    "rate_limit_window_seconds": 60,
+    "rate_limit_threshold": 2
+}
+
+_config_cache = None
+_config_lock = threading.Lock()
+
+# Rate limits are a property of the API account, not of a single run, so pressure is tracked
+# process-wide and shared by every router.
+_rate_limit_hits = {}
+_rate_limit_lock = threading.Lock()
+
+
+def load_route_config(path=CONFIG_PATH):
+    global _config_cache
+    with _config_lock:
+        if _config_cache is None:
+            config = dict(DEFAULT_CONFIG)
+            try:
+                with open(path, "r") as file:
+                    loaded = json.load(file)
+            except (OSError, ValueError):
+                loaded = {}
+            # Routes are merged role by role, so a file that only overrides "delegate" keeps "head"
+            routes = dict(DEFAULT_CONFIG["routes"])
+            routes.update(loaded.get("routes", {}))
+            config.update(loaded)
+            config["routes"] = routes
+            _config_cache = config
+        return _config_cache
+
+
+class Model_Router:
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_route_config()
+        self.routes = self.config["routes"]
+        self.prices = self.config.get("prices_per_1k_tokens", {})
+        self.window = self.config.get("rate_limit_window_seconds", 60)
+        self.threshold = self.config.get("rate_limit_threshold", 2)
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def chain_for(self, role : str):
+        if role in self.routes:
+            return self.routes[role]
+        return self.routes.get("head", DEFAULT_CONFIG["routes"]["head"])
+
+    def _under_pressure(self, model : str):
+        now = time.time()
+        with _rate_limit_lock:
+            hits = [t for t in _rate_limit_hits.get(model, []) if now - t < self.window]
+            _rate_limit_hits[model] = hits
+            return len(hits) >= self.threshold
+
+    def model_for(self, role : str):
+        """
+        The first model in the role's chain that is not currently being rate limited.
+        """
+        chain = self.chain_for(role)
+        for model in chain:
+            if not self._under_pressure(model):
+                return model
+        return chain[-1]
+
+    def report_rate_limit(self, model : str):
+        LLM_RATE_LIMITS.inc(model=model)
+        with _rate_limit_lock:
+            _rate_limit_hits.setdefault(model, []).append(time.time())
+
+    def record(self, role : str, model : str, latency : float, prompt_tokens : int = 0, completion_tokens : int = 0):
+        price = self.prices.get(model, {})
+        cost = (prompt_tokens * price.get("input", 0) + completion_tokens * price.get("output", 0)) / 1000
+        LLM_LATENCY.observe(latency, role=role)
+        LLM_TOKENS.inc(prompt_tokens, role=role, model=model, direction="prompt")
+        LLM_TOKENS.inc(completion_tokens, role=role, model=model, direction="completion")
+        with self._lock:
+            route = self.stats.setdefault(f"{role} -> {model}", {
+                "calls": 0, "latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0
+            })
+            route["calls"] += 1
+            route["latency"] += latency
+            route["prompt_tokens"] += prompt_tokens
+            route["completion_tokens"] += completion_tokens
+            route["cost"] += cost
+
+    def summary(self):
+        with self._lock:
+            out = ""
+            total = 0.0
+            for route, s in self.stats.items():
+                avg = s["latency"] / s["calls"] if s["calls"] else 0
+                out += (f"\t{route}: {s['calls']} calls, avg {avg:.2f}s, "
+                        f"{s['prompt_tokens']} in / {s['completion_tokens']} out tokens, ${s['cost']:.4f}\n")
+                total += s["cost"]
+            out += f"\tTotal estimated cost: ${total:.4f}"
+            return out
@@ -1,12 +1,24 @@
-
-
+import os
+import threading
 
 
 class Prompt:
+    # Prompt files never change while the server runs, so each one is read from disk only once
+    _cache = {}
+    _lock = threading.Lock()
+    
     def __init__(self, name : str):
         self.name = name
         self.path = "./prompts/" + self.name + ".txt"
         self.txt = ""
-        with open(self.path, "r") as file:
-            self.txt = file.read()
-    
\ No newline at end of file
+        with Prompt._lock:
+            if self.path not in Prompt._cache:
+                with open(self.path, "r") as file:
+                    Prompt._cache[self.path] = file.read()
+            self.txt = Prompt._cache[self.path]
+    
+    @staticmethod
+    def preload_all(directory="./prompts/"):
+        for filename in os.listdir(directory):
+            if filename.endswith(".txt"):
+                Prompt(filename[:-4])
@@ -0,0 +1,38 @@
+"""
+Everything that is the same for every run and never changes while the server is up: the prompt
+files, the API keys and the tool classes. It is loaded once, at startup (the keys on first use), and
+every run's context is built from it instead of re-reading files.
+"""
+import threading
+from util.logs import Log
+from util.prompt_loader import Prompt
+from keys.wallet import Key_Wallet
+from tools.tool_registry import ALL_TOOLS
+
+
+class Shared_State:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, verbose=True):
+        self.log = Log(verbose)
+        self._wallet = None
+        self._wallet_lock = threading.Lock()
+        Prompt.preload_all()
+        self.system_prompt = Prompt("system_prompt").txt
+        self.tool_classes = tuple(ALL_TOOLS)
+
+    @property
+    def wallet(self):
+        # Read on first use, so importing the server (or a test) does not need the keys file
+        with self._wallet_lock:
+            if self._wallet is None:
+                self._wallet = Key_Wallet(self.log)
+            return self._wallet
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = Shared_State()
+            return cls._instance
@@ -0,0 +1,58 @@
+"""
+Turns text into plain ASCII for the LLM, the works cited and the API. Non-ASCII characters are
+transliterated rather than dropped: curly quotes become straight quotes, dashes become hyphens and
+accented letters lose their accents, so "Müller – “Café”" becomes 'Muller - "Cafe"'. Everything
+runs in C (str.isascii, str.replace, unicodedata and the ascii codec); text that is already ASCII
+is returned as is.
+"""
+import unicodedata
+
+
+# Characters that Unicode normalization would not map to ASCII (or would map badly)
+_REPLACEMENTS = {
+    # Quotes and apostrophes
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'", "´": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"',
+    "«": '"', "»": '"', "‹": "'", "›": "'",
+    # Dashes and hyphens
+    "‐": "-", "‑": "-", "‒": "-", "–": "-", "—": "--", "―": "--",
+    "−": "-", "\u00ad": "",
+    # Spaces and invisible characters
+    "\u00a0": " ", "\u2002": " ", "\u2003": " ", "\u2009": " ", "\u200a": " ", "\u202f": " ",
+    "\u200b": "", "\u200c": "", "\u200d": "", "\ufeff": "",
+    # Punctuation and symbols
+    "…": "...", "•": "*", "·": "*", "©": "(c)", "®": "(R)", "™": "(TM)",
+    "§": "S", "¶": "P", "°": " deg", "×": "x", "÷": "/", "⁄": "/", "€": "EUR",
+    "£": "GBP", "¥": "JPY", "→": "->", "←": "<-",
+    # Letters without a decomposition
+    "ß": "ss", "æ": "ae", "Æ": "AE", "œ": "oe", "Œ": "OE", "ø": "o",
+    "Ø": "O", "ł": "l", "Ł": "L", "đ": "d", "Đ": "D", "ð": "d",
+    "Ð": "D", "þ": "th", "Þ": "Th", "ı": "i",
+}
+
+_REPLACEMENT_ITEMS = tuple(_REPLACEMENTS.items())
+
+
+def _replace_known(text : str) -> str:
+    # A substring test and str.replace are both single C scans, much faster than str.translate
+    # with a dict table, and most text only contains a handful of these characters
+    for char, replacement in _REPLACEMENT_ITEMS:
+        if char in text:
+            text = text.replace(char, replacement)
+    return text
+
+
+def to_ascii(text : str) -> str:
+    """
+    Transliterates `text` to ASCII. Characters with no ASCII equivalent are dropped.
+    """
+    if text.isascii():
+        return text
+    text = _replace_known(text)
+    if text.isascii():
+        return text
+    # NFKD splits accented letters into letter + combining accent (and ligatures, fractions and
+    # full-width forms into plain characters); the ascii codec then drops the accents and anything
+    # left over.
+    text = _replace_known(unicodedata.normalize("NFKD", text))
+    return text.encode("ascii", "ignore").decode("ascii")
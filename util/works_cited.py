@@ -1,5 +1,9 @@
-
-
+"""
+The sources cited during a run. Each work keeps the metadata record it was cited from, so the whole
+bibliography can be rendered again in any supported style without touching the network.
+"""
+from datetime import datetime
+from util.citations import render_citation
 
 
 class Works_Cited:
@@ -7,18 +11,66 @@ class Works_Cited:
         self.works = []
         
         
-    def cite(self, type, format, citation):
+    def cite(self, type, format, citation, meta=None):
         self.works.append(
             {
                 "format" : format,
                 "type" : type,
-                "txt" : citation
+                "txt" : citation,
+                "meta" : meta
             }
         )
         
         
-    def purge(self):
+    def cite_source(self, type, format, meta):
+        """
+        Renders `meta` in `format` (e.g. "mla"), records it and returns the citation.
+        """
+        citation = render_citation(meta, format)
+        self.cite(type, format, citation, meta)
+        return citation
+        
+        
+    def render(self, format=None):
+        """
+        The bibliography as text, in `format` if given, otherwise in the style each work was cited in.
+        Works cited without a metadata record keep their original text.
+        """
         contents = ""
         for source in self.works:
-            contents += source["txt"] + "\n\n"
-        return contents
\ No newline at end of file
+            if format and source["meta"] is not None and format != source["format"]:
+                contents += render_citation(source["meta"], format) + "\n\n"
+            else:
+                contents += source["txt"] + "\n\n"
+        return contents
+        
+        
+    def purge(self):
+        return self.render()
+        
+        
+    def to_records(self):
+        """
+        The works as JSON-ready dicts (dates as ISO strings).
+        """
+        records = []
+        for source in self.works:
+            record = dict(source)
+            if source["meta"] is not None:
+                record["meta"] = dict(source["meta"])
+                if isinstance(record["meta"].get("access_date"), datetime):
+                    record["meta"]["access_date"] = record["meta"]["access_date"].isoformat()
+            records.append(record)
+        return records
+        
+        
+    @classmethod
+    def from_records(cls, records):
+        wc = cls()
+        for record in records:
+            meta = record.get("meta")
+            if meta is not None and isinstance(meta.get("access_date"), str):
+                meta = dict(meta)
+                meta["access_date"] = datetime.fromisoformat(meta["access_date"])
+            wc.cite(record.get("type", "website"), record.get("format"), record.get("txt", ""), meta)
+        return wc
@@ -1,11 +1,50 @@
-from util.application import Application_Instance
+from util.application import Application_Instance, Application_Pool
 from tools.tool_registry import *
 import json
-from util import ascii_filter
+import time
+import threading
+from util.metrics import RUN_DURATION, ACTIVE_RUNS
+from util.cancellation import Cancel_Token, Cancelled_Error
+from util.model_router import Model_Router
+from web_api.result_cache import Result_Cache, cache_key
+from web_api.artifact_store import Artifact_Store
+from util.works_cited import Works_Cited
+from util.logs import Log
+from util.citations import STYLE_FORMATTERS
 
-class Application_API:
+class _Shared_Result_Context:
+    """
+    What on_context is given when a query is answered by the result cache or by an identical run
+    that is already in progress: just a log for the job's transcript.
+    """
     def __init__(self):
+        self.log = Log(False)
+
+
+class Application_API:
+    def __init__(self, prebuild=True):
+        """
+        With `prebuild`, the shared state and a few run contexts are built right away. A web tier
+        that only enqueues jobs for worker processes passes False, so it never builds them unless it
+        runs an analysis itself.
+        """
         self.has_run = False
+        self.results = Result_Cache()
+        self.artifacts = Artifact_Store()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        if prebuild:
+            self.pool
+    
+    @property
+    def pool(self):
+        # Loads prompts and keys once and keeps a few run contexts ready to go. The agent's ReACT
+        # instructions are cached per tool set (build_react_instructions), in registry order, so a
+        # tool selection only pays for building them on its first run.
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = Application_Pool()
+            return self._pool
     
     # to be connected to "mock get all tools" function in the web application
     def get_all_tools(self):
@@ -39,40 +78,109 @@ class Application_API:
         "aiLevel": int,
         "instructions": str,
         "text": str,
-        "tools": [str, str, ...]
+        "tools": [str, str, ...],
+        "noCache": bool (optional, forces a fresh run)
     }
     
     Returns output as object in form of 
     {
         "revised_text" : str,
         "additional_downloadable_files": [
-            {"name": str, "extension": str, "data": bytes},
+            {"name": str, "extension": str, "url": str, "size": int, "sha256": str},
             ...
         ],
-        "transcript": str
+        "transcript_file": {"name": str, "extension": str, "url": str, "size": int, "sha256": str},
+        "cache_key": str
     }
+    
+    Files are kept in the artifact store and downloaded from their url on demand.
+    
+    Identical queries are served from the result cache, and identical queries submitted while one
+    is still running wait for that run rather than starting their own.
+    
+    If `cancel_token` is given, cancelling it stops the run (see util/cancellation.py) and this
+    raises Cancelled_Error. Cancelled runs are not cached. A run shared by identical queries is only
+    stopped once all of their tokens are cancelled; until then, a cancelled follower just stops waiting.
     """
-    def run_analysis(self, query):
-        app = Application_Instance(True)
+    def run_analysis(self, query, on_context=None, cancel_token : Cancel_Token = None):
+        # The primary head model, not the current fallback, so rate limiting does not change the key
+        key = cache_key(query, Model_Router().chain_for("head")[0])
+        out = self.results.get_or_run(key, lambda token: self._run_analysis(query, on_context, token),
+                                      use_cache=not query.get("noCache", False),
+                                      valid=self._artifacts_exist,
+                                      on_shared=lambda how: self._report_shared(on_context, how),
+                                      cancel_token=cancel_token)
+        out["cache_key"] = key
+        return out
+    
+    def _report_shared(self, on_context, how):
+        # No agent runs for this query, so its transcript would stay empty; say where the result comes from
+        if on_context is None:
+            return
+        ctx = _Shared_Result_Context()
+        on_context(ctx)
+        if how == "hit":
+            ctx.log.log("[RESULT CACHE] : Served from cache, an identical analysis already finished.")
+        else:
+            ctx.log.log("[RESULT CACHE] : An identical analysis is already running; waiting for its result.")
+    
+    def _artifacts_exist(self, out):
+        # A cached result is useless if the store has since evicted one of its files
+        refs = list(out.get("additional_downloadable_files", [])) + [out.get("transcript_file")]
+        return all(ref and "sha256" in ref and self.artifacts.exists(ref) for ref in refs)
+    
+    def rerender_works_cited(self, works_cited_sha256 : str, style : str):
+        """
+        Renders a run's works cited (the JSON_Works_Cited artifact) in another citation style, from
+        the stored metadata alone. Returns the new text file's artifact reference, or None if the
+        artifact is gone. Raises ValueError for unknown styles.
+        """
+        if style not in STYLE_FORMATTERS:
+            raise ValueError(f"Unknown citation style '{style}', expected one of {list(STYLE_FORMATTERS)}")
+        data = self.artifacts.read(works_cited_sha256)
+        if data is None:
+            return None
+        wc = Works_Cited.from_records(json.loads(data))
+        return self.artifacts.put(f"{style.upper()}_Works_Cited", "txt", wc.render(style))
+    
+    def invalidate_cached(self, key=None):
+        if key is None:
+            self.results.clear()
+            return True
+        return self.results.invalidate(key)
+
+    def _run_analysis(self, query, on_context=None, cancel_token=None):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with ACTIVE_RUNS.track():
+                out, ok = self._run_analysis_inner(query, on_context, cancel_token)
+            outcome = "ok" if ok else "agent_failure"
+            return out, ok
+        except Cancelled_Error:
+            outcome = "cancelled"
+            raise
+        finally:
+            RUN_DURATION.observe(time.perf_counter() - start, outcome=outcome)
+
+    def _run_analysis_inner(self, query, on_context=None, cancel_token=None):
+        app = self.pool.acquire()
+        if cancel_token is not None:
+            app.ctx.cancel_token = cancel_token
+        # Lets callers (e.g. the job manager) watch the run's live context
+        if on_context is not None:
+            on_context(app.ctx)
         app.filter_down(query["tools"])
-        app.run_agentic(query["instructions"], query["text"], 15)
+        answer = app.run_agentic(query["instructions"], query["text"], 15)
 
         out = {}
-        out["transcript"] = app.dump_log()
+        out["transcript_file"] = self.artifacts.put("Transcript", "txt", app.dump_log())
         out["additional_downloadable_files"] = []
         out["additional_downloadable_files"].append(
-            {
-                "name": "JSON_Works_Cited",
-                "extension": "json",
-                "data": app.dump_works_cited_json()
-            }
+            self.artifacts.put("JSON_Works_Cited", "json", app.dump_works_cited_json())
         )
         out["additional_downloadable_files"].append(
-            {
-                "name": "TXT_Works_Cited",
-                "extension": "txt",
-                "data": app.dump_works_cited()
-            }
+            self.artifacts.put("TXT_Works_Cited", "txt", app.dump_works_cited())
         )
         
         if (len(app.ctx.notes)):
@@ -80,11 +188,7 @@ class Application_API:
             for note in app.ctx.notes:
                 notes_str += f"[NOTE]:\n{note}"
             out["additional_downloadable_files"].append(
-                {
-                    "name": "AI_Notepad",
-                    "extension": "txt",
-                    "data": notes_str
-                }
+                self.artifacts.put("AI_Notepad", "txt", notes_str)
             )
         
         out["revised_text"] = app.ctx.essay
@@ -92,7 +196,7 @@ class Application_API:
         
         self.has_run = True
         
-        # output validation
-        out = json.loads(ascii_filter.filter_non_ascii(json.dumps(out)))
+        # Output validation (ASCII only) happens as the payload is serialized; see util/json_stream.py
         
-        return out
\ No newline at end of file
+        # Failed runs are not worth replaying from the cache
+        return out, not answer.startswith("Agent Failure")
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Stores the files a run produces (works cited, notepad, transcript) on disk, named by the SHA-256 of
+their contents. Identical files from different runs are stored once, and the hash doubles as an ETag.
+API responses only carry small references to these files; the browser downloads them on demand.
+When the store grows past its size cap, the least recently used files are deleted.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from urllib.parse import quote
+
+
+ROOT = "./artifacts"
+MAX_TOTAL_BYTES = 512 * 1024 * 1024
+
+MIME_TYPES = {
+    "json": "application/json",
+    "txt": "text/plain; charset=utf-8",
+    "log": "text/plain; charset=utf-8",
+    "html": "text/html; charset=utf-8"
+}
+
+
+class Artifact_Store:
+    def __init__(self, root=ROOT, max_total_bytes=MAX_TOTAL_BYTES):
+        self.root = root
+        self.max_total_bytes = max_total_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._scan())
+
+    def _path(self, digest):
+        # Shard by the first two hex digits so no single directory gets huge
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _scan(self):
+        for shard in os.listdir(self.root):
+            directory = os.path.join(self.root, shard)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def put(self, name, extension, data):
+        """
+        Stores `data` (str or bytes) and returns a reference to it for the API response.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+
+        with self._lock:
+            if os.path.exists(path):
+                # Already stored by an earlier run; just mark it as recently used
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(tmp, path)
+                self._total += len(data)
+                if self._total > self.max_total_bytes:
+                    self._evict(keep=path)
+
+        return {
+            "name": name,
+            "extension": extension,
+            "url": f"/api/artifacts/{digest}.{extension}?name={quote(name)}",
+            "size": len(data),
+            "sha256": digest
+        }
+
+    def _evict(self, keep):
+        # Other processes may share the store, so re-measure from disk before deleting anything
+        files = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_total_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
+
+    def path_for(self, digest):
+        """
+        Path of a stored artifact, or None if it does not exist (or `digest` is not a valid hash).
+        """
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            return None
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def read(self, digest):
+        """
+        Contents of a stored artifact as bytes, or None if it does not exist.
+        """
+        path = self.path_for(digest)
+        if path is None:
+            return None
+        with open(path, "rb") as file:
+            return file.read()
+
+    def exists(self, reference):
+        return os.path.exists(self._path(reference["sha256"]))
@@ -0,0 +1,308 @@
+"""
+A durable job queue on a local SQLite file, so analyses survive a web server restart and can be run
+by separate worker processes (see web_api/worker.py). The web tier only submits jobs and reads their
+status, results and transcript events. Workers claim a job by taking a lease on it and keep the lease
+alive with heartbeats; if a worker dies, its lease expires and another worker picks the job up again.
+Cancelling a running job marks it cancel_requested; its worker notices within CANCEL_POLL_SECONDS,
+stops the run and marks it cancelled. A job that several identical submissions share counts its
+submitters, and is only cancelled once each of them has cancelled it.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+from web_api.jobs import Queue_Full_Error, MAX_QUEUED, RESULT_TTL_SECONDS, STREAM_KEEPALIVE_SECONDS, FINISHED_STATUSES
+from web_api.result_cache import cache_key
+from util.model_router import Model_Router
+
+
+DB_PATH = "./jobs/queue.sqlite3"
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+EVENT_POLL_SECONDS = 0.5
+CANCEL_POLL_SECONDS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    query TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    iteration INTEGER NOT NULL DEFAULT 0,
+    log_entries INTEGER NOT NULL DEFAULT 0,
+    cache_key TEXT,
+    submitters INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (cache_key, status);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class Queued_Job:
+    """
+    Read-only view of a row in the jobs table. Mirrors the interface of jobs.Job so the web tier
+    can serve either backend.
+    """
+    def __init__(self, queue, row):
+        self.queue = queue
+        self.id = row["id"]
+        self.status = row["status"]
+        self.error = row["error"]
+        self.result = json.loads(row["result"]) if row["result"] else None
+        self.created = row["created"]
+        self.started = row["started"]
+        self.finished = row["finished"]
+        self.attempts = row["attempts"]
+        self.iteration = row["iteration"]
+        self.log_entries = row["log_entries"]
+
+    def is_finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def describe(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": {"iteration": self.iteration, "log_entries": self.log_entries},
+            "error": self.error,
+            "attempts": self.attempts,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+    def stream(self, offset=0):
+        """
+        Same contract as jobs.Job.stream, fed by the events the worker writes to the database.
+        """
+        next_index = offset
+        idle = 0.0
+        while True:
+            events = self.queue.events_since(self.id, next_index)
+            for index, entry in events:
+                next_index = index + 1
+                yield index, entry
+            if events:
+                idle = 0.0
+                continue
+            job = self.queue.get(self.id)
+            if job is None or job.is_finished():
+                # One last read in case the final events landed after the previous poll
+                for index, entry in self.queue.events_since(self.id, next_index):
+                    yield index, entry
+                return
+            time.sleep(EVENT_POLL_SECONDS)
+            idle += EVENT_POLL_SECONDS
+            if idle >= STREAM_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield None
+
+
+class Sqlite_Job_Queue:
+    def __init__(self, path=DB_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 max_queued=MAX_QUEUED, ttl=RESULT_TTL_SECONDS, wal=True):
+        """
+        Set `wal=False` when the database lives on a network volume shared by several hosts;
+        SQLite's write-ahead log only works when every process is on the same machine.
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.wal = wal
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "submitters" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN submitters INTEGER NOT NULL DEFAULT 1")
+
+    def _connect(self):
+        # A fresh connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if self.wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+        return _Closing(conn)
+
+    # --- Web tier ---
+
+    def submit(self, query):
+        """
+        Queues `query`, unless an identical query is already queued or running, in which case that
+        job is returned so both clients share one run.
+        """
+        job_id = uuid.uuid4().hex
+        key = cache_key(query, Model_Router().chain_for("head")[0])
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire(conn)
+            if not query.get("noCache", False):
+                existing = conn.execute("SELECT id FROM jobs WHERE cache_key = ? AND status IN ('queued', 'running')",
+                                        (key,)).fetchone()
+                if existing:
+                    conn.execute("UPDATE jobs SET submitters = submitters + 1 WHERE id = ?", (existing["id"],))
+                    conn.execute("COMMIT")
+                    return self.get(existing["id"])
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running', 'cancel_requested')").fetchone()[0]
+            if pending >= self.max_queued:
+                conn.execute("ROLLBACK")
+                raise Queue_Full_Error("Too many analyses in progress, please try again later.")
+            conn.execute("INSERT INTO jobs (id, status, query, created, cache_key) VALUES (?, 'queued', ?, ?, ?)",
+                         (job_id, json.dumps(query), time.time(), key))
+            conn.execute("COMMIT")
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Queued_Job(self, row) if row else None
+
+    def counts(self):
+        """
+        Number of known jobs in each status.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def cancel(self, job_id, reason="cancelled"):
+        """
+        Cancels a queued job outright and asks the worker of a running one to stop. A job shared by
+        several submitters only loses one of them, and keeps going for the others. Returns the job,
+        or None if it is unknown.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            shared = conn.execute("UPDATE jobs SET submitters = submitters - 1 "
+                                  "WHERE id = ? AND submitters > 1 AND status IN ('queued', 'running')", (job_id,))
+            if shared.rowcount > 0:
+                conn.execute("COMMIT")
+                return self.get(job_id)
+            conn.execute("UPDATE jobs SET status = 'cancelled', error = ?, finished = ? WHERE id = ? AND status = 'queued'",
+                         (f"Run cancelled ({reason})", now, job_id))
+            conn.execute("UPDATE jobs SET status = 'cancel_requested', error = ? WHERE id = ? AND status = 'running'",
+                         (f"Run cancelled ({reason})", job_id))
+            conn.execute("COMMIT")
+        return self.get(job_id)
+
+    def events_since(self, job_id, offset):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT idx, entry FROM job_events WHERE job_id = ? AND idx >= ? ORDER BY idx",
+                                (job_id, offset)).fetchall()
+        return [(row["idx"], row["entry"]) for row in rows]
+
+    def _expire(self, conn):
+        cutoff = time.time() - self.ttl
+        old = "SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?"
+        conn.execute(f"DELETE FROM job_events WHERE job_id IN ({old})", (cutoff,))
+        conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,))
+
+    # --- Worker tier ---
+
+    def claim(self, worker_id):
+        """
+        Leases the oldest runnable job to `worker_id`. Jobs whose lease expired (their worker died)
+        are runnable again until they run out of attempts. Returns (job_id, query) or None.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Nobody is left to stop these runs: their workers died after the cancel came in
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished = ?, lease_owner = NULL "
+                         "WHERE status = 'cancel_requested' AND lease_expires < ?", (now, now))
+            while True:
+                row = conn.execute(
+                    "SELECT id, query, attempts, status FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY created LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ?, lease_owner = NULL "
+                                 "WHERE id = ?", (f"Gave up after {row['attempts']} attempts.", now, row["id"]))
+                    continue
+                # A retried job starts its transcript over
+                conn.execute("DELETE FROM job_events WHERE job_id = ?", (row["id"],))
+                conn.execute("UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                             "attempts = attempts + 1, started = ?, iteration = 0, log_entries = 0 WHERE id = ?",
+                             (worker_id, now + self.lease_seconds, now, row["id"]))
+                conn.execute("COMMIT")
+                return row["id"], json.loads(row["query"])
+
+    def heartbeat(self, job_id, worker_id, events=(), iteration=None):
+        """
+        Extends the lease and records new transcript events. Returns False if the lease was lost.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? "
+                               "AND status IN ('running', 'cancel_requested')",
+                               (time.time() + self.lease_seconds, job_id, worker_id))
+            if cur.rowcount == 0:
+                conn.execute("ROLLBACK")
+                return False
+            if events:
+                conn.executemany("INSERT OR IGNORE INTO job_events (job_id, idx, entry) VALUES (?, ?, ?)",
+                                 [(job_id, index, entry) for index, entry in events])
+                conn.execute("UPDATE jobs SET log_entries = ? WHERE id = ?", (events[-1][0] + 1, job_id))
+            if iteration is not None:
+                conn.execute("UPDATE jobs SET iteration = ? WHERE id = ?", (iteration, job_id))
+            conn.execute("COMMIT")
+            return True
+
+    def cancel_requested(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row["status"] == "cancel_requested"
+
+    def _finish(self, job_id, worker_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_owner = NULL "
+                         "WHERE id = ? AND lease_owner = ?",
+                         (status, json.dumps(result) if result is not None else None, error, time.time(),
+                          job_id, worker_id))
+
+    def complete(self, job_id, worker_id, result):
+        self._finish(job_id, worker_id, "done", result=result)
+
+    def fail(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, "failed", error=error)
+
+    def cancelled(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, "cancelled", error=error)
+
+
+class _Closing:
+    """
+    sqlite3's own context manager only ends transactions; this one also closes the connection.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+        return False
@@ -0,0 +1,252 @@
+"""
+Runs analyses in the background so the web server can answer right away. A job is submitted, gets
+an id, and is executed on a bounded worker pool. Clients poll the job's status and fetch its result
+once it is done. Finished jobs are forgotten after a TTL. A job can be cancelled while it is queued
+or running; a running job stops at the next point where its run checks its cancel token.
+"""
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from util.cancellation import Cancel_Token, Cancelled_Error
+
+
+MAX_WORKERS = 2
+MAX_QUEUED = 8
+RESULT_TTL_SECONDS = 60 * 60
+STREAM_KEEPALIVE_SECONDS = 15
+# How long a job may go without any transcript stream open before a disconnect cancels it
+DISCONNECT_GRACE_SECONDS = 30
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+# Put into every open stream's queue once the job finishes, so the stream ends right away
+_STREAM_END = object()
+
+
+class Queue_Full_Error(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, query):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.ctx = None
+        self.cancel_token = Cancel_Token()
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._streams = []
+        self._streams_lock = threading.Lock()
+
+    def mark_finished(self):
+        """
+        Records when the job finished (its status must already be final) and ends open streams.
+        """
+        self.finished = time.time()
+        with self._streams_lock:
+            streams = list(self._streams)
+        for pending in streams:
+            pending.put(_STREAM_END)
+
+    def progress(self):
+        """
+        How far along the run is, read from the live log of its App_Context.
+        """
+        if self.ctx is None:
+            return {"iteration": 0, "log_entries": 0}
+        entries = self.ctx.log.entries
+        iteration = 0
+        for entry in reversed(entries):
+            if entry.startswith("--- Iteration "):
+                iteration = int(entry.split()[2])
+                break
+        return {"iteration": iteration, "log_entries": len(entries)}
+
+    def is_finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def stream(self, offset=0):
+        """
+        Yields (index, entry) for every log entry from `offset` onward, as they are logged, and
+        None as a keepalive while nothing new has happened. Ends once the job is finished.
+        """
+        waited = 0.0
+        while self.ctx is None and not self.is_finished():
+            time.sleep(0.5)
+            waited += 0.5
+            if waited >= STREAM_KEEPALIVE_SECONDS:
+                waited = 0.0
+                yield None
+        if self.ctx is None:
+            return
+
+        log = self.ctx.log
+        pending = queue.Queue()
+        callback = lambda index, entry: pending.put((index, entry))
+        with self._streams_lock:
+            self._streams.append(pending)
+        # Subscribe before replaying history so nothing logged in between is missed
+        live_from = log.subscribe(callback)
+        try:
+            for index in range(offset, live_from):
+                yield index, log.entries[index]
+            next_index = max(offset, live_from)
+            while True:
+                try:
+                    item = pending.get(timeout=STREAM_KEEPALIVE_SECONDS if not self.is_finished() else 0.1)
+                except queue.Empty:
+                    if self.is_finished():
+                        return
+                    yield None
+                    continue
+                # Entries logged before the job finished are already queued ahead of the end marker
+                if item is _STREAM_END:
+                    return
+                index, entry = item
+                if index >= next_index:
+                    next_index = index + 1
+                    yield index, entry
+        finally:
+            log.unsubscribe(callback)
+            with self._streams_lock:
+                self._streams.remove(pending)
+
+    def describe(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress(),
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class Job_Manager:
+    def __init__(self, api, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED, ttl=RESULT_TTL_SECONDS):
+        self.api = api
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _expire(self):
+        now = time.time()
+        for job_id in list(self.jobs):
+            job = self.jobs[job_id]
+            if job.finished and now - job.finished > self.ttl:
+                del self.jobs[job_id]
+
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if job.status in ("queued", "running", "cancel_requested"))
+
+    def counts(self):
+        """
+        Number of known jobs in each status.
+        """
+        with self._lock:
+            out = {}
+            for job in self.jobs.values():
+                out[job.status] = out.get(job.status, 0) + 1
+            return out
+
+    def submit(self, query):
+        with self._lock:
+            self._expire()
+            # Backpressure: everything running plus everything waiting for a worker
+            if self.pending() >= self.max_workers + self.max_queued:
+                raise Queue_Full_Error("Too many analyses in progress, please try again later.")
+            job = Job(query)
+            self.jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def _attach(self, job, ctx):
+        job.ctx = ctx
+
+    def _run(self, job):
+        with self._lock:
+            if job.status == "cancelled":
+                return
+            job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = self.api.run_analysis(job.query, on_context=lambda ctx: self._attach(job, ctx),
+                                               cancel_token=job.cancel_token)
+            # A job whose run other jobs are still waiting for only notices its own cancellation here
+            job.status = "cancelled" if job.cancel_token.cancelled else "done"
+        except Cancelled_Error as e:
+            job.error = str(e)
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.cancel_token.clear_deadline()
+            job.mark_finished()
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id, reason="cancelled"):
+        """
+        Cancels a queued or running job. Returns the job, or None if it is unknown.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.is_finished():
+                return job
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.error = f"Run cancelled ({reason})"
+                job.mark_finished()
+            else:
+                job.status = "cancel_requested"
+        job.cancel_token.cancel(reason)
+        return job
+
+
+class Disconnect_Watcher:
+    """
+    Cancels jobs whose clients went away: once the last transcript stream of an unfinished job
+    closes and none reopens within the grace period (EventSource reconnects take a few seconds),
+    the job is cancelled. Works with either job backend.
+    """
+    def __init__(self, jobs, grace=DISCONNECT_GRACE_SECONDS):
+        self.jobs = jobs
+        self.grace = grace
+        self._streams = {}      # job id -> open streams
+        self._lock = threading.Lock()
+
+    def opened(self, job_id):
+        with self._lock:
+            self._streams[job_id] = self._streams.get(job_id, 0) + 1
+
+    def closed(self, job_id):
+        with self._lock:
+            self._streams[job_id] -= 1
+            if self._streams[job_id] > 0:
+                return
+        timer = threading.Timer(self.grace, self._expire, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _expire(self, job_id):
+        with self._lock:
+            if self._streams.get(job_id, 0) > 0:
+                return
+            self._streams.pop(job_id, None)
+        job = self.jobs.get(job_id)
+        if job is not None and not job.is_finished():
+            self.jobs.cancel(job_id, "client disconnected")
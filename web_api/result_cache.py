@@ -0,0 +1,183 @@
+"""
+Caches finished analyses by a hash of everything that determines their outcome: the essay text, the
+instructions, the (sorted) tools, the AI level and the head model. Results persist in a SQLite file so
+they survive restarts and are shared by worker processes. Identical requests that arrive while the
+first one is still running wait for it instead of starting a second agent run. A shared run is only
+cancelled once every caller waiting for it has cancelled; a caller that gives up earlier just stops
+waiting.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from util.metrics import CACHE_REQUESTS
+from util.cancellation import Cancel_Token
+
+
+DB_PATH = "./cache/results.sqlite3"
+RESULT_TTL_SECONDS = 24 * 60 * 60
+# How often a caller waiting for another caller's run checks its own cancel token
+WAIT_SLICE_SECONDS = 0.5
+
+
+def cache_key(query, model : str):
+    material = {
+        "text": query.get("text", ""),
+        "instructions": query.get("instructions", ""),
+        "tools": sorted(query.get("tools", [])),
+        "aiLevel": str(query.get("aiLevel", "")),
+        "model": model
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class _In_Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # The run's own token, cancelled once every attached caller has cancelled theirs
+        self.token = Cancel_Token()
+        self.callers = 0
+        self._lock = threading.Lock()
+
+    def attach(self, cancel_token):
+        """
+        Adds a caller, who keeps the run alive until `cancel_token` is cancelled (forever if it is
+        None). Returns a function that detaches the caller's token once it stops waiting, or None if
+        every earlier caller has already given up on the run.
+        """
+        with self._lock:
+            if self.token.cancelled:
+                return None
+            self.callers += 1
+        if cancel_token is None:
+            return lambda: None
+        return cancel_token.on_cancel(lambda: self._leave(cancel_token.reason))
+
+    def _leave(self, reason):
+        with self._lock:
+            self.callers -= 1
+            if self.callers == 0:
+                self.token.cancel(reason)
+
+
+class Result_Cache:
+    def __init__(self, path=DB_PATH, ttl=RESULT_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT result, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0])
+        finally:
+            conn.close()
+
+    def put(self, key, result):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO results (key, result, created) VALUES (?, ?, ?)",
+                         (key, json.dumps(result), time.time()))
+        finally:
+            conn.close()
+
+    def invalidate(self, key):
+        conn = self._connect()
+        try:
+            return conn.execute("DELETE FROM results WHERE key = ?", (key,)).rowcount > 0
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM results")
+        finally:
+            conn.close()
+
+    def get_or_run(self, key, run, use_cache=True, valid=None, on_shared=None, cancel_token=None):
+        """
+        Returns the cached result for `key`, or calls `run(token)` to produce it. `run` must return
+        (result, cacheable), and stop once `token` is cancelled. Concurrent calls with the same key
+        share a single run, whose token is cancelled only when every call's `cancel_token` is; a call
+        that is cancelled while another call's run is going raises Cancelled_Error right away. Cached
+        results that fail `valid(result)` are treated as misses. When the result does not come from
+        this call's own run, `on_shared(how)` is called first, with how = "hit" or "coalesced".
+        """
+        if use_cache:
+            cached = self.get(key)
+            if cached is not None and (valid is None or valid(cached)):
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="results", result="hit")
+                if on_shared is not None:
+                    on_shared("hit")
+                return cached
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            detach = flight.attach(cancel_token) if flight is not None else None
+            # A run every caller gave up on is on its way out; this call starts a new one
+            leader = detach is None
+            if leader:
+                flight = _In_Flight()
+                self._in_flight[key] = flight
+                detach = flight.attach(cancel_token)
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache="results", result="miss")
+            else:
+                self.coalesced += 1
+                CACHE_REQUESTS.inc(cache="results", result="coalesced")
+
+        if not leader:
+            try:
+                if on_shared is not None:
+                    on_shared("coalesced")
+                while not flight.done.wait(WAIT_SLICE_SECONDS):
+                    if cancel_token is not None:
+                        cancel_token.check()
+            finally:
+                detach()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            result, cacheable = run(flight.token)
+            if cacheable:
+                self.put(key, result)
+            flight.result = result
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            detach()
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+            flight.done.set()
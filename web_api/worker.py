@@ -0,0 +1,146 @@
+"""
+Worker process for the SQLite job queue. Each worker claims one job at a time, runs the analysis,
+and heartbeats while it runs so its lease does not expire. Start several with:
+
+    python -m web_api.worker --workers 4
+
+and run the web server with JOB_BACKEND=sqlite so it only enqueues jobs. Workers on other hosts can
+share the same queue by pointing --db at a shared volume (and passing --no-wal).
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from web_api.job_queue import Sqlite_Job_Queue, DB_PATH, CANCEL_POLL_SECONDS
+from util.cancellation import Cancel_Token, Cancelled_Error
+
+
+IDLE_POLL_SECONDS = 1.0
+# How often new log entries are written to the queue, so transcript streams stay live. Independent
+# of the lease heartbeat, which only needs to come every lease_seconds / 3.
+EVENT_FLUSH_SECONDS = 0.5
+
+
+class _Job_Runner:
+    """
+    Forwards a run's log entries to the queue in small batches, heartbeats its lease, and cancels the
+    run when the job is cancelled through the queue or its lease is lost (another worker owns the job).
+    """
+    def __init__(self, queue, job_id, worker_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.pending = []
+        self.iteration = None
+        self.lease_lost = False
+        self.cancel_token = Cancel_Token()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def on_entry(self, index, entry):
+        with self._lock:
+            self.pending.append((index, entry))
+            if entry.startswith("--- Iteration "):
+                self.iteration = int(entry.split()[2])
+
+    def attach(self, ctx):
+        log = ctx.log
+        # Entries logged before subscribing (the log's start line, at least) are queued first,
+        # under the lock so live entries cannot get ahead of them
+        with self._lock:
+            live_from = log.subscribe(self.on_entry)
+            self.pending[0:0] = [(index, log.entries[index]) for index in range(live_from)]
+
+    def flush(self):
+        with self._lock:
+            events, self.pending = self.pending, []
+            iteration = self.iteration
+        if not self.queue.heartbeat(self.job_id, self.worker_id, events, iteration):
+            self.lease_lost = True
+            self.cancel_token.cancel("lease lost")
+
+    def _beat(self):
+        last_flush = last_poll = time.monotonic()
+        while not self._done.wait(min(EVENT_FLUSH_SECONDS, CANCEL_POLL_SECONDS)):
+            now = time.monotonic()
+            if now - last_poll >= CANCEL_POLL_SECONDS:
+                last_poll = now
+                if self.queue.cancel_requested(self.job_id):
+                    self.cancel_token.cancel("cancelled")
+            with self._lock:
+                has_events = bool(self.pending)
+            # Writing events renews the lease too, so an explicit heartbeat is only needed when idle
+            if has_events or now - last_flush >= self.queue.lease_seconds / 3:
+                last_flush = now
+                self.flush()
+
+    def run(self, api, query):
+        beat = threading.Thread(target=self._beat, daemon=True)
+        beat.start()
+        try:
+            return api.run_analysis(query, on_context=self.attach, cancel_token=self.cancel_token)
+        finally:
+            self._done.set()
+            beat.join()
+            self.flush()
+
+
+def run_worker(db_path=DB_PATH, wal=True):
+    # Imported here so the parent process that only spawns workers stays light
+    from web_api.api_functions import Application_API
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = Sqlite_Job_Queue(db_path, wal=wal)
+    api = Application_API()
+    print(f"[JOB WORKER] : {worker_id} polling {db_path}")
+
+    while True:
+        claimed = queue.claim(worker_id)
+        if claimed is None:
+            time.sleep(IDLE_POLL_SECONDS)
+            continue
+
+        job_id, query = claimed
+        print(f"[JOB WORKER] : {worker_id} claimed job {job_id}")
+        _run_job(queue, api, worker_id, job_id, query)
+
+
+def _run_job(queue, api, worker_id, job_id, query):
+    runner = _Job_Runner(queue, job_id, worker_id)
+    try:
+        outcome, detail = "done", runner.run(api, query)
+    except Cancelled_Error as e:
+        outcome, detail = "cancelled", str(e)
+    except Exception as e:
+        outcome, detail = "failed", str(e)
+    if runner.lease_lost:
+        # The run was stopped as soon as the lease was gone; the job belongs to another worker now
+        print(f"[JOB WORKER] : {worker_id} lost its lease on job {job_id}; another worker owns it now.")
+        return
+    if outcome == "done":
+        queue.complete(job_id, worker_id, detail)
+    elif outcome == "cancelled":
+        queue.cancelled(job_id, worker_id, detail)
+    else:
+        queue.fail(job_id, worker_id, detail)
+    print(f"[JOB WORKER] : {worker_id} finished job {job_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run analysis workers for the SQLite job queue.")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes to start")
+    parser.add_argument("--db", default=DB_PATH, help="path to the queue database")
+    parser.add_argument("--no-wal", action="store_true", help="use when the database is on a shared network volume")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        run_worker(args.db, not args.no_wal)
+    else:
+        processes = [multiprocessing.Process(target=run_worker, args=(args.db, not args.no_wal))
+                     for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
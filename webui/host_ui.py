@@ -1,7 +1,14 @@
-from flask import Flask, request, jsonify, send_from_directory, make_response
+from flask import Flask, request, jsonify, send_from_directory, send_file, make_response, Response, stream_with_context
 import os
+import json
 from pathlib import Path
 from web_api.api_functions import Application_API
+from web_api.jobs import Job_Manager, Queue_Full_Error, Disconnect_Watcher
+from util.logs import classify_entry
+from util.json_stream import iter_chunks, negotiate_encoding, compress_chunks
+from web_api.artifact_store import MIME_TYPES
+from util.metrics import REGISTRY, ACTIVE_JOBS
+from util.domain_health import Domain_Health
 
 
 APP = Flask(__name__, static_folder=str(Path(__file__).parent / "site"))
@@ -10,7 +17,7 @@ APP = Flask(__name__, static_folder=str(Path(__file__).parent / "site"))
 def add_cors_headers(resp):
 	resp.headers["Access-Control-Allow-Origin"] = "*"
 	resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
-	resp.headers["Access-Control-Allow-Methods"] = "GET,POST,OPTIONS"
+	resp.headers["Access-Control-Allow-Methods"] = "GET,POST,DELETE,OPTIONS"
 	return resp
 
 
@@ -19,6 +26,20 @@ def _after_request(response):
 	return add_cors_headers(response)
 
 
+def stream_json(payload, status=200):
+	"""
+	Streams `payload` as ASCII-only JSON (non-ASCII characters are \\u-escaped, exactly as the old
+	dumps/filter/loads round trip left them), compressed if the client accepts it.
+	"""
+	encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+	body = compress_chunks(iter_chunks(payload), encoding)
+	resp = Response(body, status=status, mimetype="application/json")
+	resp.headers["Vary"] = "Accept-Encoding"
+	if encoding:
+		resp.headers["Content-Encoding"] = encoding
+	return resp
+
+
 @APP.route("/", methods=["GET"])
 def index():
 	return send_from_directory(APP.static_folder, "index.html")
@@ -29,8 +50,39 @@ def static_files(filename):
 	return send_from_directory(APP.static_folder, filename)
 
 
-# API endpoints
-api = Application_API()
+# JOB_BACKEND=sqlite hands analyses to separate worker processes (python -m web_api.worker) through a
+# durable queue; otherwise they run on a thread pool inside this server.
+SQLITE_BACKEND = os.environ.get("JOB_BACKEND", "thread") == "sqlite"
+
+# API endpoints. With the sqlite backend this server only enqueues, so no run contexts are built
+api = Application_API(prebuild=not SQLITE_BACKEND)
+
+if SQLITE_BACKEND:
+	from web_api.job_queue import Sqlite_Job_Queue
+	jobs = Sqlite_Job_Queue(os.environ.get("JOB_DB", "./jobs/queue.sqlite3"))
+else:
+	jobs = Job_Manager(api)
+
+# Jobs whose transcript streams all closed (the tab was closed) are cancelled after a grace period
+stream_watcher = Disconnect_Watcher(jobs)
+
+
+def _collect_job_counts():
+	counts = jobs.counts()
+	for status in ("queued", "running", "cancel_requested", "done", "failed", "cancelled"):
+		ACTIVE_JOBS.set(counts.get(status, 0), status=status)
+
+
+REGISTRY.add_collector(_collect_job_counts)
+
+
+@APP.route("/metrics", methods=["GET"])
+def metrics():
+	"""
+	Server health in the Prometheus text format. With JOB_BACKEND=sqlite, runs happen in the worker
+	processes, so only the job counts here reflect them.
+	"""
+	return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 
 @APP.route("/api/get_all_tools", methods=["GET"])
@@ -51,6 +103,14 @@ def get_allowed_tools():
 
 @APP.route("/api/run_analysis", methods=["POST"])
 def run_analysis():
+	"""
+	Runs an analysis in the request. With JOB_BACKEND=sqlite this server only enqueues, so callers
+	are sent to /api/jobs instead.
+	"""
+	if SQLITE_BACKEND:
+		return jsonify({"error": "analyses run on the job workers; submit them to /api/jobs",
+						"jobs_url": "/api/jobs"}), 409
+
 	data = request.get_json(force=True)
 	if not data:
 		return jsonify({"error": "missing JSON body"}), 400
@@ -61,11 +121,168 @@ def run_analysis():
 	except Exception as e:
 		return jsonify({"error": f"server error: {e}"}), 500
 
-	# Ensure JSON serializable
-	return jsonify(out)
+	return stream_json(out)
+
+
+@APP.route("/api/jobs", methods=["POST"])
+def submit_job():
+	data = request.get_json(force=True)
+	if not data:
+		return jsonify({"error": "missing JSON body"}), 400
+
+	try:
+		job = jobs.submit(data)
+	except Queue_Full_Error as e:
+		resp = jsonify({"error": str(e)})
+		resp.headers["Retry-After"] = "30"
+		return resp, 429
+
+	return jsonify({
+		"job_id": job.id,
+		"status_url": f"/api/jobs/{job.id}",
+		"result_url": f"/api/jobs/{job.id}/result",
+		"cancel_url": f"/api/jobs/{job.id}/cancel"
+	}), 202
+
+
+@APP.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+	job = jobs.get(job_id)
+	if job is None:
+		return jsonify({"error": "unknown or expired job"}), 404
+	return jsonify(job.describe())
+
+
+@APP.route("/api/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+	job = jobs.get(job_id)
+	if job is None:
+		return jsonify({"error": "unknown or expired job"}), 404
+	if job.status == "failed":
+		return jsonify({"error": f"server error: {job.error}"}), 500
+	if job.status == "cancelled":
+		return jsonify({"error": job.error or "job was cancelled"}), 410
+	if job.status != "done":
+		return jsonify(job.describe()), 202
+	return stream_json(job.result)
+
+
+@APP.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+	"""
+	Cancels a queued job, or asks a running one to stop (status "cancel_requested" until it has).
+	With JOB_BACKEND=sqlite, identical submissions share one job, which keeps going until every one
+	of them has cancelled it.
+	"""
+	job = jobs.cancel(job_id)
+	if job is None:
+		return jsonify({"error": "unknown or expired job"}), 404
+	return jsonify(job.describe()), 200 if job.is_finished() else 202
+
+
+@APP.route("/api/artifacts/<digest>.<extension>", methods=["GET"])
+def get_artifact(digest, extension):
+	"""
+	Serves a stored artifact. Its content hash is the ETag, so repeat downloads are answered with
+	304 Not Modified, and Range requests let large transcripts be fetched in pieces.
+	"""
+	path = api.artifacts.path_for(digest)
+	if path is None:
+		return jsonify({"error": "unknown or expired artifact"}), 404
+	name = request.args.get("name", digest[:12])
+	resp = send_file(path, mimetype=MIME_TYPES.get(extension, "application/octet-stream"),
+					 conditional=True, etag=digest, max_age=24 * 60 * 60,
+					 download_name=f"{name}.{extension}")
+	# Content never changes for a given hash
+	resp.headers["Cache-Control"] = "public, max-age=86400, immutable"
+	return resp
+
+
+@APP.route("/api/jobs/<job_id>/stream", methods=["GET"])
+def job_stream(job_id):
+	"""
+	Server-Sent Events stream of the job's transcript. Each event id is the log entry index, so a
+	reconnecting EventSource resumes via Last-Event-ID (or ?offset=N) without replaying everything.
+	"""
+	job = jobs.get(job_id)
+	if job is None:
+		return jsonify({"error": "unknown or expired job"}), 404
+
+	try:
+		if request.headers.get("Last-Event-ID"):
+			offset = int(request.headers["Last-Event-ID"]) + 1
+		else:
+			offset = int(request.args.get("offset", 0))
+	except ValueError:
+		offset = 0
+
+	def events():
+		# A write to a closed connection ends this generator early, at the latest on a keepalive
+		stream_watcher.opened(job_id)
+		try:
+			for item in job.stream(offset):
+				if item is None:
+					yield ": keepalive\n\n"
+					continue
+				index, entry = item
+				kind = classify_entry(entry)
+				data = json.dumps({"index": index, "type": kind, "text": entry})
+				yield f"id: {index}\nevent: {kind}\ndata: {data}\n\n"
+			finished = jobs.get(job_id) or job
+			yield f"event: done\ndata: {json.dumps({'status': finished.status})}\n\n"
+		finally:
+			stream_watcher.closed(job_id)
+
+	resp = Response(stream_with_context(events()), mimetype="text/event-stream")
+	resp.headers["Cache-Control"] = "no-cache"
+	resp.headers["X-Accel-Buffering"] = "no"
+	return resp
+
+
+@APP.route("/api/cache/<key>", methods=["DELETE"])
+def invalidate_cached_result(key):
+	if not api.invalidate_cached(key):
+		return jsonify({"error": "no cached result for that key"}), 404
+	return jsonify({"invalidated": key})
+
+
+@APP.route("/api/domain_health", methods=["GET"])
+def domain_health():
+	"""
+	The least healthy domains, with their health scores (0 to 1) and recent failures by kind.
+	"""
+	try:
+		limit = int(request.args.get("limit", 50))
+	except ValueError:
+		limit = 50
+	return jsonify({"domains": Domain_Health.get().report(limit)})
+
+
+@APP.route("/api/rerender_works_cited", methods=["POST"])
+def rerender_works_cited():
+	"""
+	Body: {"works_cited": <sha256 of a JSON_Works_Cited file>, "style": "mla" | "apa"}
+	"""
+	data = request.get_json(silent=True) or {}
+	try:
+		ref = api.rerender_works_cited(str(data.get("works_cited", "")), str(data.get("style", "")))
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	if ref is None:
+		return jsonify({"error": "unknown or expired works cited file"}), 404
+	return jsonify({"file": ref})
+
+
+@APP.route("/api/cache", methods=["DELETE"])
+def clear_cached_results():
+	api.invalidate_cached()
+	return jsonify({"invalidated": "all"})
 
 
 def run(host: str = "127.0.0.1", port: int = 5000, debug: bool = False):
+	# The keys are loaded lazily; check them before serving rather than on the first analysis
+	if not SQLITE_BACKEND:
+		api.pool.shared.wallet
 	root = Path(__file__).parent
 	print(f"Serving site from: {root / 'site'}")
 	APP.run(host=host, port=port, debug=debug)
@@ -262,8 +262,21 @@ async function runAgent() {
     instructions: document.getElementById("extraInstruct").value,
   };
 
+  // Show the transcript tab right away and fill it in as the agent works
+  const transcriptContent = document.getElementById("transcriptContent");
+  transcriptContent.innerText = "";
+  ensureTranscriptTab();
+
+  let streamed = false;
   try {
-    const response = await serverInteraction(requestData);
+    const response = await serverInteraction(requestData, (entry) => {
+      streamed = true;
+      transcriptContent.appendChild(document.createTextNode(entry.text + "\n"));
+    });
+    // Cached results finish without streaming anything; fetch their transcript instead
+    if (!streamed && response.transcript_file) {
+      transcriptContent.innerText = await fetchArtifactText(response.transcript_file);
+    }
     handleResponse(response);
   } catch (error) {
     console.error("Error:", error);
@@ -298,17 +311,8 @@ function setProcessing(isProc) {
   }
 }
 
-function handleResponse(data) {
-  // Update Text
-  const textArea = document.getElementById("essayText");
-  textArea.value = data.revised_text;
-
-  // Create/Update Transcript Tab
-  const transcriptId = "transcript";
-  const transcriptContent = document.getElementById("transcriptContent");
-  transcriptContent.innerText = data.transcript;
-
-  // Add Tab Button if not exists
+// Add Transcript Tab Button if not exists
+function ensureTranscriptTab() {
   const nav = document.getElementById("tabNav");
   if (!document.querySelector('button[data-tab="transcript"]')) {
     const btn = document.createElement("button");
@@ -322,80 +326,55 @@ function handleResponse(data) {
     };
     nav.appendChild(btn);
   }
+}
+
+function handleResponse(data) {
+  // Update Text
+  const textArea = document.getElementById("essayText");
+  textArea.value = data.revised_text;
+
+  // The transcript tab was already filled in by runAgent
+  ensureTranscriptTab();
 
   // Handle Files - UPDATED SECTION
   const filesArea = document.getElementById("filesArea");
   filesArea.innerHTML = ""; // Clear old
   
+  // Files are stored on the server and only downloaded when clicked
   data.additional_downloadable_files.forEach((file) => {
-    // 1. Create a Blob from the file content string
-    const mimeType = getPlaintextMimeType(file.extension);
-    const fileBlob = new Blob([file.data], { type: mimeType });
-
-    // 2. Create a temporary URL for the Blob
-    const fileURL = URL.createObjectURL(fileBlob);
-
     const a = document.createElement("a");
     a.className = "file-btn";
-    a.href = fileURL;
-    // --- KEY CHANGES ---
-    // 3. Open in a new tab by adding target="_blank"
-    a.target = "_blank"; 
-    // 4. Remove a.download = ...
-    // -------------------
-    
-    // 5. Clean up the object URL when the link is clicked
-    a.onclick = (e) => {
-      // This allows the link to navigate to the URL, opening the file in a new tab.
-      // Clean up the object URL immediately after the click event processes
-      setTimeout(() => URL.revokeObjectURL(fileURL), 100);
-    };
-
+    a.href = file.url;
+    a.target = "_blank";
     a.innerHTML = `<i class="fas fa-file-alt"></i> ${file.name}.${file.extension}`;
     filesArea.appendChild(a);
   });
 
+  // Offer the works cited in every style; the server re-renders it from the saved metadata
+  const worksCited = data.additional_downloadable_files.find((file) => file.name === "JSON_Works_Cited");
+  if (worksCited) {
+    ["mla", "apa"].forEach((style) => {
+      const btn = document.createElement("button");
+      btn.className = "file-btn";
+      btn.innerHTML = `<i class="fas fa-sync-alt"></i> Works Cited as ${style.toUpperCase()}`;
+      btn.onclick = async () => {
+        try {
+          const file = await rerenderWorksCited(worksCited, style);
+          window.open(file.url, "_blank");
+        } catch (error) {
+          console.error("Error:", error);
+          alert("Could not re-render the works cited: " + error.message);
+        }
+      };
+      filesArea.appendChild(btn);
+    });
+  }
+
   // Flash success color on text area
   textArea.style.borderColor = "var(--clr-success-a0)";
   setTimeout(() => (textArea.style.borderColor = ""), 1000);
 }
 
-// Helper function to determine specific plaintext MIME type
-function getPlaintextMimeType(extension) {
-    switch (extension.toLowerCase()) {
-        case 'json':
-            return 'application/json';
-        case 'html':
-            return 'text/html';
-        case 'css':
-            return 'text/css';
-        case 'js':
-            return 'text/javascript';
-        case 'xml':
-            return 'application/xml';
-        default:
-            return 'text/plain'; // Default for txt, log, etc.
-    }
-}
-
-// Helper function to determine specific plaintext MIME type
-function getPlaintextMimeType(extension) {
-    switch (extension.toLowerCase()) {
-        case 'json':
-            return 'application/json';
-        case 'html':
-            return 'text/html';
-        case 'css':
-            return 'text/css';
-        case 'js':
-            return 'text/javascript';
-        case 'xml':
-            return 'application/xml';
-        default:
-            return 'text/plain'; // Default for txt, log, etc.
-    }
-}
-
 // Helper function to determine MIME type
 function getMimeType(extension) {
     switch (extension.toLowerCase()) {
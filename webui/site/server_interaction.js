@@ -76,24 +76,111 @@ async function fetchAllowedTools(level) {
   return json.allowed || [];
 }
 
-async function serverInteraction(data) {
+const JOB_POLL_INTERVAL_MS = 2000;
+// How long a finished job's transcript stream may take to deliver its last events
+const STREAM_DRAIN_TIMEOUT_MS = 5000;
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+const TRANSCRIPT_EVENT_TYPES = ['iteration', 'action', 'observation', 'thought', 'log'];
+
+// Streams a job's transcript over Server-Sent Events. The browser's EventSource reconnects on its
+// own and resumes from the last event id it saw. `ended` resolves once the server has sent every
+// entry and its closing 'done' event.
+function streamTranscript(jobId, onEntry) {
+  const source = new EventSource(`/api/jobs/${jobId}/stream`);
+  TRANSCRIPT_EVENT_TYPES.forEach((type) => {
+    source.addEventListener(type, (e) => onEntry(JSON.parse(e.data)));
+  });
+  const ended = new Promise((resolve) => {
+    source.addEventListener('done', () => {
+      source.close();
+      resolve();
+    });
+  });
+  return { source, ended };
+}
+
+// The job this page is waiting for, cancelled if the page is closed or navigated away from
+let activeJob = null;
+
+window.addEventListener('pagehide', () => {
+  if (activeJob) navigator.sendBeacon(activeJob.cancel_url);
+});
+
+async function cancelJob(job) {
+  const res = await fetch(job.cancel_url, { method: 'POST' });
+  if (!res.ok && res.status !== 404) throw new Error(`Server error: ${res.status} ${await res.text()}`);
+}
+
+async function serverInteraction(data, onTranscriptEntry) {
   // data should be { aiLevel, instructions, text, tools }
-  const res = await fetch('/api/run_analysis', {
+  // The analysis runs as a background job: submit it, then poll until the result is ready.
+  // If onTranscriptEntry is given, the transcript is streamed to it live while the job runs.
+  const res = await fetch('/api/jobs', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(data)
   });
 
+  if (res.status === 429) {
+    throw new Error('The server is busy with other analyses. Please try again in a minute.');
+  }
   if (!res.ok) {
     const errText = await res.text();
     throw new Error(`Server error: ${res.status} ${errText}`);
   }
 
-  const json = await res.json();
-  return json;
+  const job = await res.json();
+  activeJob = job;
+  const stream = onTranscriptEntry ? streamTranscript(job.job_id, onTranscriptEntry) : null;
+  let finished = false;
+  try {
+    while (true) {
+      await sleep(JOB_POLL_INTERVAL_MS);
+      const poll = await fetch(job.result_url);
+      if (poll.status === 202) continue; // still queued or running
+      if (poll.status === 410) throw new Error('The analysis was cancelled.');
+      if (!poll.ok) {
+        const errText = await poll.text();
+        throw new Error(`Server error: ${poll.status} ${errText}`);
+      }
+      const result = await poll.json();
+      finished = true;
+      return result;
+    }
+  } finally {
+    if (activeJob === job) activeJob = null;
+    if (stream) {
+      // The result can arrive before the last transcript events; let the stream drain first
+      if (finished) await Promise.race([stream.ended, sleep(STREAM_DRAIN_TIMEOUT_MS)]);
+      stream.source.close();
+    }
+  }
+}
+
+// Downloads a stored artifact (transcript, works cited, ...) from its reference in a result
+async function fetchArtifactText(ref) {
+  const res = await fetch(ref.url);
+  if (!res.ok) throw new Error(`Failed to fetch ${ref.name}`);
+  return await res.text();
+}
+
+// Re-renders a run's works cited in another style ("mla" or "apa") on the server, without refetching
+async function rerenderWorksCited(worksCitedRef, style) {
+  const res = await fetch("/api/rerender_works_cited", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ works_cited: worksCitedRef.sha256, style: style }),
+  });
+  if (!res.ok) throw new Error(`Server error: ${res.status} ${await res.text()}`);
+  return (await res.json()).file;
 }
 
 // Export functions for other scripts to use (browser globals)
 window.api_getAllTools = getAllTools;
 window.api_fetchAllowedTools = fetchAllowedTools;
 window.api_runAnalysis = serverInteraction;
+window.api_cancelJob = cancelJob;